@@ -0,0 +1,369 @@
+import time
+import heapq
+import sqlite3
+import logging
+from array import array
+from operator import itemgetter
+from datetime import date, timedelta
+from collections import Counter
+from typing import Optional, Dict, Any, List, Tuple
+from sqlite_db import SQLiteDatabase
+from history_store import HistoryStore
+from analytics import ListeningAnalytics, patterns_from
+
+logger = logging.getLogger(__name__)
+
+# Bump when the bucketing or keys change; users stored under another
+# version are rebuilt from their scrobbles on next use
+AGGREGATES_VERSION = 2
+
+KEY_SEPARATOR = '\x1f'
+KINDS = ('cell', 'month', 'artist', 'album', 'track')
+TOP_KINDS = ('artist', 'album', 'track')
+SECONDS_PER_DAY = 86400
+EPOCH = date(1970, 1, 1)
+
+# Chart rollup grains: plays per UTC day, calendar month and year
+DAY = 'day'
+MONTH = 'month'
+YEAR = 'year'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS aggregate_state (
+    user TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    scrobbles INTEGER NOT NULL DEFAULT 0,
+    artists INTEGER NOT NULL DEFAULT 0,
+    albums INTEGER NOT NULL DEFAULT 0,
+    tracks INTEGER NOT NULL DEFAULT 0,
+    first_uts INTEGER,
+    last_uts INTEGER,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS aggregate_counts (
+    user TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    plays INTEGER NOT NULL,
+    PRIMARY KEY (user, kind, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS aggregate_counts_top ON aggregate_counts (user, kind, plays);
+CREATE TABLE IF NOT EXISTS aggregate_rollups (
+    user TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    grain TEXT NOT NULL,
+    period INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    plays INTEGER NOT NULL,
+    PRIMARY KEY (user, kind, grain, period, key)
+) WITHOUT ROWID;
+"""
+
+def _keys(row: Tuple) -> Dict[str, str]:
+    """Artist, album (when known) and track keys of a (user, uts, artist, track, album, ...) row"""
+    keys = {'artist': row[2], 'track': row[2] + KEY_SEPARATOR + row[3]}
+    if row[4]:
+        keys['album'] = row[2] + KEY_SEPARATOR + row[4]
+    return keys
+
+def _month_index(day: int) -> int:
+    """Calendar month (years * 12 + month - 1) of a day counted from 1970-01-01"""
+    when = EPOCH + timedelta(days=day)
+    return when.year * 12 + when.month - 1
+
+def _month_first_day(month: int) -> int:
+    """Day number of the first day of a month index"""
+    return (date(month // 12, month % 12 + 1, 1) - EPOCH).days
+
+def range_segments(first_day: int, last_day: int) -> List[Tuple[str, int, int]]:
+    """
+    Split an inclusive day range into rollup reads.
+
+    Whole years are read from yearly rollups, whole months from monthly
+    ones and only the partial months at either end from daily ones, so a
+    range costs at most about two months of daily rows, 22 months of
+    monthly rows and one row per key per year.
+
+    Returns:
+        List[Tuple[str, int, int]]: (grain, first period, last period)
+    """
+    if first_day > last_day:
+        return []
+    first_month, last_month = _month_index(first_day), _month_index(last_day)
+    head_days = _month_first_day(first_month) != first_day
+    tail_days = _month_first_day(last_month + 1) - 1 != last_day
+    if first_month == last_month and (head_days or tail_days):
+        return [(DAY, first_day, last_day)]
+
+    segments, tail = [], []
+    if head_days:
+        segments.append((DAY, first_day, _month_first_day(first_month + 1) - 1))
+        first_month += 1
+    if tail_days:
+        tail.append((DAY, _month_first_day(last_month), last_day))
+        last_month -= 1
+    if first_month <= last_month:
+        first_year, last_year = first_month // 12, last_month // 12
+        if first_month % 12:
+            end = min(last_month, first_year * 12 + 11)
+            segments.append((MONTH, first_month, end))
+            first_year += 1
+            if end == last_month:
+                return segments + tail
+        if last_month % 12 != 11:
+            tail.insert(0, (MONTH, last_year * 12, last_month))
+            last_year -= 1
+        if first_year <= last_year:
+            segments.append((YEAR, first_year, last_year))
+    return segments + tail
+
+def _bucket(rows: List[Tuple]) -> Tuple[Dict[str, Counter], Dict[str, Counter]]:
+    """
+    Count (user, uts, artist, track, album, ...) rows into every aggregate kind.
+
+    Returns:
+        Tuple: (totals by kind and key, chart kind counts by (grain, period, key))
+    """
+    analytics = ListeningAnalytics(array('q', (row[1] for row in rows)))
+    heatmap = analytics.heatmap()
+    totals = {
+        'cell': Counter({f"{day}:{hour}": plays for day, row in enumerate(heatmap)
+                         for hour, plays in enumerate(row) if plays}),
+        'month': Counter(analytics.monthly())
+    }
+    totals.update({kind: Counter() for kind in TOP_KINDS})
+    rollups = {kind: Counter() for kind in TOP_KINDS}
+    months = {}
+    for row in rows:
+        day = row[1] // SECONDS_PER_DAY
+        month = months.get(day)
+        if month is None:
+            month = months[day] = _month_index(day)
+        for kind, key in _keys(row).items():
+            totals[kind][key] += 1
+            rollups[kind][DAY, day, key] += 1
+            rollups[kind][MONTH, month, key] += 1
+            rollups[kind][YEAR, month // 12, key] += 1
+    return totals, rollups
+
+class ListeningAggregates:
+    """
+    Per-user listening statistics kept up to date as scrobbles are stored.
+
+    Registered as a HistoryStore listener, it folds every batch of new
+    scrobbles (history sync, backfill or a local /scrobble) into weekday x
+    hour and monthly histograms, per-artist/album/track play counts (in
+    total and per UTC day, month and year) and distinct counts, inside the
+    same transaction as the insert. Reading a user's statistics is then a
+    handful of small indexed lookups however long the history is, and a
+    chart for any date range sums that range's rollups. Each user's row
+    records the aggregate version; a user stored under an older version (or
+    before aggregates existed) is rebuilt from the stored scrobbles once.
+    """
+
+    def __init__(self, history_store: HistoryStore):
+        self.history_store = history_store
+        self._db = SQLiteDatabase(history_store.path, _SCHEMA)
+        self._tables_ready = False
+        history_store.add_listener(self._on_insert)
+
+    @staticmethod
+    def _user(user: str) -> str:
+        return user.strip().lower()
+
+    def _add_counts(self, conn: sqlite3.Connection, user: str, kind: str, counts: Counter) -> int:
+        """Add plays for one kind; returns how many keys are new"""
+        before = conn.total_changes
+        conn.executemany(
+            'INSERT OR IGNORE INTO aggregate_counts (user, kind, key, plays) VALUES (?, ?, ?, 0)',
+            [(user, kind, key) for key in counts]
+        )
+        new_keys = conn.total_changes - before
+        conn.executemany(
+            'UPDATE aggregate_counts SET plays = plays + ? WHERE user = ? AND kind = ? AND key = ?',
+            [(plays, user, kind, key) for key, plays in counts.items()]
+        )
+        return new_keys
+
+    def _state(self, conn: sqlite3.Connection, user: str) -> Optional[Tuple]:
+        return conn.execute(
+            'SELECT version, scrobbles, artists, albums, tracks, first_uts, last_uts '
+            'FROM aggregate_state WHERE user = ?', (user,)
+        ).fetchone()
+
+    def _rebuild(self, conn: sqlite3.Connection, user: str) -> None:
+        """Recompute a user's aggregates from every stored scrobble"""
+        conn.execute('DELETE FROM aggregate_counts WHERE user = ?', (user,))
+        conn.execute('DELETE FROM aggregate_rollups WHERE user = ?', (user,))
+        rows = conn.execute('SELECT user, uts, artist, track, album FROM scrobbles WHERE user = ?', (user,)).fetchall()
+        conn.execute('INSERT OR REPLACE INTO aggregate_state (user, version, updated_at) VALUES (?, ?, ?)',
+                     (user, AGGREGATES_VERSION, time.time()))
+        if rows:
+            self._apply(conn, user, rows)
+        logger.info(f"Rebuilt listening aggregates for {user} from {len(rows)} scrobbles")
+
+    def _apply(self, conn: sqlite3.Connection, user: str, rows: List[Tuple]) -> None:
+        """Fold rows into a user's aggregates, which must be at the current version"""
+        counts, rollups = _bucket(rows)
+        new_keys = {kind: self._add_counts(conn, user, kind, counts[kind]) for kind in KINDS}
+        for kind in TOP_KINDS:
+            conn.executemany(
+                'INSERT INTO aggregate_rollups (user, kind, grain, period, key, plays) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (user, kind, grain, period, key) DO UPDATE SET plays = plays + excluded.plays',
+                [(user, kind) + period_key + (plays,) for period_key, plays in rollups[kind].items()]
+            )
+        uts = [row[1] for row in rows]
+        conn.execute(
+            'UPDATE aggregate_state SET scrobbles = scrobbles + ?, artists = artists + ?, albums = albums + ?, '
+            'tracks = tracks + ?, first_uts = MIN(COALESCE(first_uts, ?), ?), '
+            'last_uts = MAX(COALESCE(last_uts, ?), ?), updated_at = ? WHERE user = ?',
+            (len(rows), new_keys['artist'], new_keys['album'], new_keys['track'],
+             min(uts), min(uts), max(uts), max(uts), time.time(), user)
+        )
+
+    def _on_insert(self, conn: sqlite3.Connection, user: str, rows: List[Tuple]) -> None:
+        if not self._tables_ready:
+            # Inside the insert transaction: a second connection would wait
+            # on our own write lock, and executescript would commit early
+            for statement in filter(str.strip, _SCHEMA.split(';')):
+                conn.execute(statement)
+            self._tables_ready = True
+        state = self._state(conn, user)
+        if state is None or state[0] != AGGREGATES_VERSION:
+            self._rebuild(conn, user)  # already includes the new rows
+        else:
+            self._apply(conn, user, rows)
+
+    def _ensure_current(self, user: str) -> None:
+        state = self._state(self._db.connection(), user)
+        if state is None or state[0] != AGGREGATES_VERSION:
+            with self._db.transaction() as conn:
+                state = self._state(conn, user)
+                if state is None or state[0] != AGGREGATES_VERSION:
+                    self._rebuild(conn, user)
+
+    def get(self, user: str) -> Dict[str, Any]:
+        """
+        Read a user's aggregate listening statistics.
+
+        Args:
+            user: Last.fm user name
+
+        Returns:
+            Dict[str, Any]: Scrobble and distinct artist/album/track counts,
+                first and last scrobble times, and 'patterns' (hourly, daily,
+                monthly and heatmap) as built by analytics.patterns_from
+        """
+        user = self._user(user)
+        self._ensure_current(user)
+        conn = self._db.connection()
+        _, scrobbles, artists, albums, tracks, first_uts, last_uts = self._state(conn, user)
+
+        heatmap = [[0] * 24 for _ in range(7)]
+        for key, plays in conn.execute(
+                "SELECT key, plays FROM aggregate_counts WHERE user = ? AND kind = 'cell'", (user,)):
+            day, hour = key.split(':')
+            heatmap[int(day)][int(hour)] = plays
+        monthly = dict(conn.execute(
+            "SELECT key, plays FROM aggregate_counts WHERE user = ? AND kind = 'month' ORDER BY key", (user,)
+        ).fetchall())
+
+        return {
+            'scrobbles': scrobbles,
+            'unique_artists': artists,
+            'unique_albums': albums,
+            'unique_tracks': tracks,
+            'first_uts': first_uts,
+            'last_uts': last_uts,
+            'patterns': patterns_from(heatmap, monthly)
+        }
+
+    def top(self, user: str, kind: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Most played artists, albums or tracks across the stored history.
+
+        Args:
+            user: Last.fm user name
+            kind: 'artist', 'album' or 'track'
+            limit: Maximum number of entries
+
+        Returns:
+            List[Dict[str, Any]]: Entries with 'artist', 'name' (album or
+                track; absent for artists) and 'plays', most played first
+        """
+        if kind not in TOP_KINDS:
+            raise ValueError(f"Unknown aggregate kind: {kind}")
+        user = self._user(user)
+        self._ensure_current(user)
+        rows = self._db.execute(
+            'SELECT key, plays FROM aggregate_counts WHERE user = ? AND kind = ? ORDER BY plays DESC LIMIT ?',
+            (user, kind, limit)
+        )
+        entries = []
+        for key, plays in rows:
+            artist, _, name = key.partition(KEY_SEPARATOR)
+            entry = {'artist': artist, 'plays': plays}
+            if kind != 'artist':
+                entry['name'] = name
+            entries.append(entry)
+        return entries
+
+    def top_range(self, user: str, kind: str, since: Optional[int] = None, until: Optional[int] = None,
+                  limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Most played artists, albums or tracks within a date range.
+
+        Sums the range's rollups (whole years and months from coarser ones,
+        see range_segments) and keeps the top entries with a bounded heap,
+        so the cost depends on the range and not on the number of scrobbles.
+
+        Args:
+            user: Last.fm user name
+            kind: 'artist', 'album' or 'track'
+            since: Range start as a Unix timestamp (rounded down to its UTC day)
+            until: Range end as a Unix timestamp (rounded up to its UTC day)
+            limit: Maximum number of entries
+
+        Returns:
+            List[Dict[str, Any]]: Entries shaped like top(), most played first
+        """
+        if kind not in TOP_KINDS:
+            raise ValueError(f"Unknown aggregate kind: {kind}")
+        user = self._user(user)
+        self._ensure_current(user)
+        state = self._state(self._db.connection(), user)
+        if not state[1]:
+            return []
+        if (since is None or since <= state[5]) and (until is None or until >= state[6]):
+            return self.top(user, kind, limit)  # the whole history: read the running totals
+        # Clamp open ends to the stored history so the range splits into few segments
+        first_day = max(since or 0, state[5]) // SECONDS_PER_DAY
+        last_day = min(until if until is not None else state[6], state[6]) // SECONDS_PER_DAY
+
+        totals = Counter()
+        for grain, first, last in range_segments(first_day, last_day):
+            for key, plays in self._db.execute(
+                    'SELECT key, plays FROM aggregate_rollups '
+                    'WHERE user = ? AND kind = ? AND grain = ? AND period BETWEEN ? AND ?',
+                    (user, kind, grain, first, last)):
+                totals[key] += plays
+
+        entries = []
+        for key, plays in sorted(heapq.nlargest(limit, totals.items(), key=itemgetter(1)),
+                                 key=lambda item: (-item[1], item[0])):
+            artist, _, name = key.partition(KEY_SEPARATOR)
+            entry = {'artist': artist, 'plays': plays}
+            if kind != 'artist':
+                entry['name'] = name
+            entries.append(entry)
+        return entries
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return the number of users with aggregates and the stored version"""
+        stats = {'version': AGGREGATES_VERSION, 'users': 0}
+        if self._db.exists():
+            try:
+                stats['users'] = self._db.execute('SELECT COUNT(*) FROM aggregate_state').fetchone()[0]
+            except sqlite3.Error as e:
+                logger.warning(f"Aggregate stats unavailable: {e}")
+        return stats
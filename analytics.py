@@ -0,0 +1,184 @@
+import time
+import logging
+from array import array
+from itertools import repeat
+from operator import floordiv
+from collections import Counter
+from datetime import datetime, timezone, tzinfo
+from typing import Optional, Dict, Any, List, Iterable
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_HOUR = 3600
+SECONDS_PER_DAY = 86400
+QUARTER_HOUR = 900  # every time-zone offset in use is a multiple of this
+EPOCH_WEEKDAY = 3  # 1970-01-01 was a Thursday (0=Monday)
+
+def _utc_offset(uts: int, tz: Optional[tzinfo]) -> int:
+    """Seconds east of UTC at ``uts``; ``tz=None`` means the server's local time"""
+    if tz is None:
+        return time.localtime(uts).tm_gmtoff
+    return int(datetime.fromtimestamp(uts, tz).utcoffset().total_seconds())
+
+def _month(day: int) -> str:
+    """'YYYY-MM' for a day number counted from 1970-01-01"""
+    return datetime.fromtimestamp(day * SECONDS_PER_DAY, timezone.utc).strftime('%Y-%m')
+
+def patterns_from(heatmap: List[List[int]], monthly: Dict[str, int]) -> Dict[str, Any]:
+    """
+    Build the dashboard's pattern payload from a weekday x hour heatmap.
+
+    Returns:
+        Dict[str, Any]: 'hourly' and 'daily' counts keyed by string index,
+            'monthly' keyed by 'YYYY-MM', and the weekday x hour 'heatmap'
+    """
+    return {
+        'hourly': {str(hour): sum(column) for hour, column in enumerate(zip(*heatmap))},
+        'daily': {str(day): sum(row) for day, row in enumerate(heatmap)},
+        'monthly': monthly,
+        'heatmap': heatmap
+    }
+
+class ListeningAnalytics:
+    """
+    Listening patterns computed over a compact array of scrobble times.
+
+    Timestamps are kept in one int64 array and bucketed with integer
+    arithmetic rather than a datetime per scrobble. Time-zone offsets are
+    looked up once per distinct day (per scrobble only on the days a DST
+    change happens), so a full history reduces to a few bincounts. With
+    numpy installed the bucketing is vectorized; otherwise the same
+    arithmetic runs over an ``array('q')`` in plain Python, counting
+    scrobbles per UTC hour first so the per-item work stays in C.
+    """
+
+    def __init__(self, timestamps: Iterable[int], tz: Optional[tzinfo] = None):
+        self.tz = tz
+        if np is not None:
+            if isinstance(timestamps, array) and timestamps.typecode == 'q':
+                self._uts = np.frombuffer(timestamps, dtype=np.int64)
+            else:
+                self._uts = np.fromiter(timestamps, dtype=np.int64)
+        else:
+            self._uts = timestamps if isinstance(timestamps, array) else array('q', timestamps)
+        self._buckets = None
+
+    @classmethod
+    def from_tracks(cls, tracks: Iterable[Dict[str, Any]], tz: Optional[tzinfo] = None) -> 'ListeningAnalytics':
+        """Build from Last.fm track entries, skipping now-playing and undated ones"""
+        timestamps = array('q')
+        for track in tracks:
+            uts = str((track.get('date') or {}).get('uts', ''))
+            if uts.isdigit():
+                timestamps.append(int(uts))
+        return cls(timestamps, tz)
+
+    def __len__(self) -> int:
+        return len(self._uts)
+
+    def _day_offsets(self, days: Iterable[int]) -> Dict[int, Optional[int]]:
+        """Offset for each UTC day, or None where it changes during the day"""
+        offsets = {}
+        for day in days:
+            start = _utc_offset(day * SECONDS_PER_DAY, self.tz)
+            end = _utc_offset(day * SECONDS_PER_DAY + SECONDS_PER_DAY - 1, self.tz)
+            offsets[day] = start if start == end else None
+        return offsets
+
+    def _compute_numpy(self) -> Dict[str, Any]:
+        uts = self._uts
+        utc_days = uts // SECONDS_PER_DAY
+        unique_days, inverse = np.unique(utc_days, return_inverse=True)
+        day_offsets = self._day_offsets(unique_days.tolist())
+        offsets = np.array([day_offsets[day] or 0 for day in unique_days.tolist()], dtype=np.int64)[inverse]
+        for day, offset in day_offsets.items():
+            if offset is None:
+                mask = utc_days == day
+                offsets[mask] = [_utc_offset(t, self.tz) for t in uts[mask].tolist()]
+
+        local = uts + offsets
+        days = local // SECONDS_PER_DAY
+        hours = (local // SECONDS_PER_HOUR) % 24
+        weekdays = (days + EPOCH_WEEKDAY) % 7
+        heatmap = np.bincount(weekdays * 24 + hours, minlength=168).reshape(7, 24)
+
+        months, counts = np.unique(days.astype('datetime64[D]').astype('datetime64[M]'), return_counts=True)
+        return {
+            'heatmap': heatmap.tolist(),
+            'monthly': {str(month): int(count) for month, count in zip(months, counts)}
+        }
+
+    def _compute_python(self) -> Dict[str, Any]:
+        # Scrobbles in the same UTC slot share a local hour and day, so only
+        # distinct slots are bucketed; half-hour zones need quarter-hour slots
+        step = SECONDS_PER_HOUR
+        slots = Counter(map(floordiv, self._uts, repeat(step)))
+        day_offsets = self._day_offsets({slot * step // SECONDS_PER_DAY for slot in slots})
+        if any(offset is None or offset % step for offset in day_offsets.values()):
+            step = QUARTER_HOUR
+            slots = Counter(map(floordiv, self._uts, repeat(step)))
+
+        cells = [0] * 168
+        local_days = Counter()
+        for slot, count in slots.items():
+            start = slot * step
+            offset = day_offsets[start // SECONDS_PER_DAY]
+            if offset is None:
+                offset = _utc_offset(start, self.tz)
+            local = start + offset
+            day = local // SECONDS_PER_DAY
+            cells[((day + EPOCH_WEEKDAY) % 7) * 24 + (local // SECONDS_PER_HOUR) % 24] += count
+            local_days[day] += count
+
+        monthly = Counter()
+        for day, count in local_days.items():
+            monthly[_month(day)] += count
+        return {
+            'heatmap': [cells[weekday * 24:(weekday + 1) * 24] for weekday in range(7)],
+            'monthly': dict(sorted(monthly.items()))
+        }
+
+    def _compute(self) -> Dict[str, Any]:
+        if self._buckets is None:
+            if not len(self._uts):
+                self._buckets = {'heatmap': [[0] * 24 for _ in range(7)], 'monthly': {}}
+            elif np is not None:
+                self._buckets = self._compute_numpy()
+            else:
+                self._buckets = self._compute_python()
+        return self._buckets
+
+    def heatmap(self) -> List[List[int]]:
+        """Scrobble counts by weekday (rows, 0=Monday) and hour (columns)"""
+        return self._compute()['heatmap']
+
+    def hourly(self) -> List[int]:
+        """Scrobble counts for each hour of the day"""
+        return [sum(column) for column in zip(*self.heatmap())]
+
+    def daily(self) -> List[int]:
+        """Scrobble counts for each weekday, Monday first"""
+        return [sum(row) for row in self.heatmap()]
+
+    def monthly(self) -> Dict[str, int]:
+        """Scrobble counts keyed by 'YYYY-MM', oldest first"""
+        return self._compute()['monthly']
+
+    def most_active_hour(self) -> int:
+        """Hour of the day with the most scrobbles (12 when there are none)"""
+        hourly = self.hourly()
+        return hourly.index(max(hourly)) if len(self) else 12
+
+    def patterns(self) -> Dict[str, Any]:
+        """Summarize listening patterns in the shape the dashboard expects (see patterns_from)"""
+        return patterns_from(self.heatmap(), self.monthly())
+
+    @staticmethod
+    def engine() -> str:
+        """Name the bucketing backend in use"""
+        return 'numpy' if np is not None else 'array'
@@ -4,11 +4,33 @@ import hashlib
 import logging
 import requests
 import random
-from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
+import asyncio
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, g, has_request_context, send_file, Response, stream_with_context
 from urllib.parse import urlencode
 from functools import wraps
 from token_store import TokenStore
+from http_client import HTTPClient
+from response_cache import ResponseCache, UNCACHEABLE_METHODS
+from single_flight import SingleFlight
+from metadata_cache import MetadataCache
+from artwork_store import ArtworkStore, ArtworkError
+from history_store import HistoryStore
+from history_export import HistoryExport, remote_rows
+from recent_blocks import RecentTracksBlocks
+from artist_tags import ArtistTagIndex
+from scrobble_queue import ScrobbleQueue
+from backfill import Backfill
+from analytics import ListeningAnalytics
+from aggregates import ListeningAggregates
+from sketches import ListeningSketches
+from async_client import AsyncLastFMClient
+from upstream_governor import UpstreamGovernor, GovernorTimeout, priority_for, RATE_LIMIT_ERROR_CODE, BACKGROUND
+from circuit_breaker import CircuitBreakerRegistry, CLOSED, HALF_OPEN
 from dotenv import load_dotenv
 
 # Configure logging
@@ -20,12 +42,100 @@ app.secret_key = os.environ.get('SECRET_KEY', os.urandom(24))
 token_store = TokenStore()
 load_dotenv()
 
+# Shared pooled HTTP client for all upstream Last.fm calls (one pool per worker)
+http_client = HTTPClient.from_env()
+
+# In-memory TTL cache for read-only Last.fm methods
+response_cache = ResponseCache(
+    max_bytes=int(os.environ.get('LASTFM_CACHE_MAX_MB', '32')) * 1024 * 1024
+)
+
+# Persistent artist/album/track info shared by all workers (opened lazily)
+metadata_cache = MetadataCache.from_env()
+
+# Local copy of each user's scrobbles, synced incrementally
+history_store = HistoryStore.from_env()
+
+# Listening statistics updated as scrobbles reach the local history
+aggregates = ListeningAggregates(history_store)
+
+# Fixed-size per-month sketches behind the approximate /stats mode
+sketches = ListeningSketches(history_store)
+
+# Resumable full-history import into the local history, at background priority
+backfill = Backfill.from_env(history_store, fetch=lambda user, extra: fetch_history_page(user, extra))
+
+# Recent-tracks pages beyond the local history, cut from 200-track upstream pages
+recent_blocks = RecentTracksBlocks.from_env(
+    fetch=lambda user, extra, background: fetch_recent_block(user, extra, background)
+)
+
+# Artist -> top tags for genre statistics, shared by all users and persisted
+artist_tags = ArtistTagIndex.from_env(fetch=lambda artist, background: fetch_artist_tags(artist, background))
+
+# Durable queue of /scrobble submissions, sent to Last.fm in batches by a
+# flusher thread in each worker (SCROBBLE_FLUSHER=false leaves that to others)
+scrobble_queue = ScrobbleQueue.from_env(
+    send=lambda user, session_key, tracks: send_scrobble_batch(user, session_key, tracks),
+    cipher=token_store,
+    retryable=lambda error: scrobble_error_retryable(error)
+)
+SCROBBLE_FLUSHER = os.environ.get('SCROBBLE_FLUSHER', 'true').lower() == 'true'
+
+# Identical concurrent read requests share a single upstream call
+request_coalescer = SingleFlight()
+
+# Outbound request budget shared by all workers on this node
+upstream_governor = UpstreamGovernor.from_env()
+
+# Per-method circuit breakers guarding against upstream outages
+circuit_breakers = CircuitBreakerRegistry(
+    failure_threshold=int(os.environ.get('LASTFM_BREAKER_THRESHOLD', '5')),
+    reset_timeout=float(os.environ.get('LASTFM_BREAKER_RESET', '30'))
+)
+
+# Worker pool resolving artwork for batch image requests
+image_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('IMAGE_RESOLVER_WORKERS', '8')),
+    thread_name_prefix='image-resolver'
+)
+MAX_IMAGE_BATCH = 100
+
+# Tracks Last.fm accepts in one track.scrobble request
+MAX_SCROBBLE_BATCH = 50
+
+# Most played artists whose tags make up a listener's genre statistics
+GENRE_ARTISTS = 200
+
+# Answer /stats from sketches rather than exact counts unless ?approx=0
+STATS_APPROXIMATE = os.environ.get('STATS_APPROXIMATE', 'false').lower() == 'true'
+
+# Resolved image outcomes, including "no image" and "not found", keyed by
+# lookup; the track/album -> artist fallback is remembered as a whole
+image_cache = ResponseCache(method_ttls={}, max_bytes=4 * 1024 * 1024)
+IMAGE_CACHE_TTL = int(os.environ.get('IMAGE_CACHE_TTL', '86400'))
+IMAGE_MISS_TTL = int(os.environ.get('IMAGE_MISS_TTL', '21600'))
+
+# Content-addressed thumbnail cache behind /artwork; redirects are not
+# followed so an allowed host cannot bounce the proxy elsewhere
+artwork_store = ArtworkStore.from_env(
+    fetch=lambda url: http_client.get(url, allow_redirects=False)
+)
+ARTWORK_MAX_AGE = 365 * 24 * 3600
+
 # Configuration
 API_KEY = os.environ.get('LASTFM_API_KEY', 'your_api_key_here')
 API_SECRET = os.environ.get('LASTFM_API_SECRET', 'your_api_secret_here')
-BASE_URL = 'https://ws.audioscrobbler.com/2.0/'
+BASE_URL = os.environ.get('LASTFM_BASE_URL', 'https://ws.audioscrobbler.com/2.0/')
 AUTH_URL = 'http://www.last.fm/api/auth'
 
+# Last.fm error codes meaning the service itself is failing
+# (8: operation failed, 11: service offline, 16: temporarily unavailable)
+LASTFM_UNAVAILABLE_ERRORS = {8, 11, 16}
+
+# Last.fm error code for unknown artists, albums and tracks ("Invalid parameters")
+LASTFM_NOT_FOUND_ERROR = 6
+
 # Rate limiting configuration
 RATE_LIMIT_REQUESTS = 5
 RATE_LIMIT_WINDOW = 60  # seconds
@@ -37,6 +147,46 @@ class LastFMError(Exception):
     """Custom exception for Last.fm API errors"""
     pass
 
+class UpstreamUnavailableError(LastFMError):
+    """Last.fm is unreachable, failing, or short-circuited by an open breaker"""
+    pass
+
+class LastFMNotFoundError(LastFMError):
+    """Last.fm has no such artist, album or track"""
+    pass
+
+class UpstreamBusyError(LastFMError):
+    """Last.fm or the outbound request budget asked us to slow down"""
+    pass
+
+def lastfm_error(message, code=None, status=None):
+    """
+    Map a failed Last.fm call to the LastFMError subclass routes expect.
+    
+    Shared by the sync and async request paths. A Last.fm error code takes
+    precedence over an HTTP status; with neither (network, timeout or
+    decode failures) the service is treated as unavailable.
+    
+    Args:
+        message: Error message
+        code: Last.fm error code from an error response
+        status: HTTP status of a failed response
+    
+    Returns:
+        LastFMError: The exception to raise
+    """
+    if code is not None:
+        if code in LASTFM_UNAVAILABLE_ERRORS:
+            return UpstreamUnavailableError(message)
+        if code == LASTFM_NOT_FOUND_ERROR:
+            return LastFMNotFoundError(message)
+        if code == RATE_LIMIT_ERROR_CODE:
+            return UpstreamBusyError(message)
+        return LastFMError(message)
+    if status is not None and status < 500:
+        return LastFMError(message)
+    return UpstreamUnavailableError(message)
+
 class RateLimiter:
     def __init__(self):
         self.requests = {}
@@ -59,7 +209,15 @@ class RateLimiter:
 rate_limiter = RateLimiter()
 
 def require_auth(f):
-    """Decorator to require authentication"""
+    """Decorator to require authentication (works for sync and async views)"""
+    if asyncio.iscoroutinefunction(f):
+        @wraps(f)
+        async def decorated_async_function(*args, **kwargs):
+            if 'oauth_token' not in session:
+                return jsonify({'success': False, 'error': 'Authentication required'}), 401
+            return await f(*args, **kwargs)
+        return decorated_async_function
+
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'oauth_token' not in session:
@@ -130,29 +288,216 @@ def get_api_signature(params):
 
 def make_lastfm_request(params, method='GET'):
     """Make authenticated request to Last.fm API"""
+    params['format'] = 'json'
+    
+    # Signed and mutating calls are never cached or coalesced
+    if method != 'GET' or params.get('method') in UNCACHEABLE_METHODS:
+        return _send_lastfm_request(params, method)
+    
+    api_method = params.get('method')
+    cache_key = response_cache.make_key(params)
+    if response_cache.is_cacheable(params):
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
+    def fetch():
+        return _fetch_and_cache(params, cache_key)
+    
+    # Catalogue info survives restarts on disk; old entries are served
+    # while a background refresh fetches a new copy
+    if metadata_cache.handles(api_method):
+        stored = metadata_cache.get(cache_key)
+        if stored is not None:
+            data, refresh_due = stored
+            response_cache.set(cache_key, data, method=api_method)
+            if refresh_due:
+                _refresh_in_background(cache_key, fetch)
+            return data
+    
+    # While the breaker is not closed, answer from the last good response
+    # right away and let a background refresh probe upstream
+    breaker_state = circuit_breakers.get(api_method).state
+    if breaker_state != CLOSED:
+        stale = response_cache.get_stale(cache_key)
+        if stale is not None:
+            if breaker_state == HALF_OPEN:
+                _refresh_in_background(cache_key, fetch)
+            _mark_stale_response()
+            return stale
+    
+    try:
+        return request_coalescer.do(cache_key, fetch)
+    except UpstreamUnavailableError:
+        stale = response_cache.get_stale(cache_key)
+        if stale is None:
+            raise
+        _mark_stale_response()
+        return stale
+
+async def make_lastfm_request_async(client, params):
+    """
+    Coroutine version of make_lastfm_request for reads.
+    
+    Uses the same response and metadata caches, coalescing, circuit
+    breakers and stale fallback, with the same keys, so sync and async
+    routes share cached responses and in-flight calls and both serve the
+    last good response while Last.fm is down. Background refreshes run on
+    the sync path.
+    
+    Args:
+        client: An open AsyncLastFMClient (see create_async_client)
+        params: Request parameters
+    
+    Returns:
+        dict: Decoded JSON response
+    """
+    params['format'] = 'json'
+    
+    if params.get('method') in UNCACHEABLE_METHODS:
+        return await client.request(params)
+    
+    api_method = params.get('method')
+    cache_key = response_cache.make_key(params)
+    if response_cache.is_cacheable(params):
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
+    async def fetch():
+        data = await client.request(params)
+        response_cache.set(cache_key, data, method=api_method)
+        metadata_cache.set(cache_key, data, method=api_method)
+        return data
+    
+    def refresh():
+        return _fetch_and_cache(dict(params), cache_key)
+    
+    if metadata_cache.handles(api_method):
+        stored = metadata_cache.get(cache_key)
+        if stored is not None:
+            data, refresh_due = stored
+            response_cache.set(cache_key, data, method=api_method)
+            if refresh_due:
+                _refresh_in_background(cache_key, refresh)
+            return data
+    
+    breaker_state = circuit_breakers.get(api_method).state
+    if breaker_state != CLOSED:
+        stale = response_cache.get_stale(cache_key)
+        if stale is not None:
+            if breaker_state == HALF_OPEN:
+                _refresh_in_background(cache_key, refresh)
+            _mark_stale_response()
+            return stale
+    
+    try:
+        return await request_coalescer.do_async(cache_key, fetch)
+    except UpstreamUnavailableError:
+        stale = response_cache.get_stale(cache_key)
+        if stale is None:
+            raise
+        _mark_stale_response()
+        return stale
+
+def _fetch_and_cache(params, cache_key, method='GET'):
+    """Send a read to Last.fm and store the response in both caches"""
+    data = _send_lastfm_request(params, method)
+    response_cache.set(cache_key, data, method=params.get('method'))
+    metadata_cache.set(cache_key, data, method=params.get('method'))
+    return data
+
+_refreshing_keys = set()
+_refreshing_lock = threading.Lock()
+
+def _refresh_in_background(cache_key, fetch):
+    """Refresh a stale response on a daemon thread, one refresh per key"""
+    with _refreshing_lock:
+        if cache_key in _refreshing_keys:
+            return
+        _refreshing_keys.add(cache_key)
+    
+    def run():
+        try:
+            request_coalescer.do(cache_key, fetch)
+        except LastFMError as e:
+            logger.info(f"Background refresh failed: {e}")
+        finally:
+            with _refreshing_lock:
+                _refreshing_keys.discard(cache_key)
+    
+    threading.Thread(target=run, daemon=True).start()
+
+def _mark_stale_response():
+    """Flag the current response as served from stale Last.fm data"""
+    if has_request_context():
+        g.lastfm_stale = True
+
+def _send_lastfm_request(params, method='GET', priority=None):
+    """Send a request to Last.fm and map failures to LastFMError"""
+    breaker = circuit_breakers.get(params.get('method'))
+    if not breaker.allow_request():
+        raise UpstreamUnavailableError("Last.fm is temporarily unavailable. Please try again shortly.")
+    
+    try:
+        upstream_governor.acquire(priority_for(params.get('method')) if priority is None else priority)
+    except GovernorTimeout as e:
+        breaker.release()
+        logger.warning(f"Outbound request budget exhausted: {e}")
+        raise lastfm_error("Last.fm is busy right now. Please try again shortly.", code=RATE_LIMIT_ERROR_CODE)
+    
     try:
-        params['format'] = 'json'
-        
         if method == 'POST':
-            response = requests.post(BASE_URL, data=params, timeout=10)
+            response = http_client.post(BASE_URL, data=params)
         else:
-            response = requests.get(BASE_URL, params=params, timeout=10)
+            response = http_client.get(BASE_URL, params=params)
         
+        if response.status_code == 429:
+            upstream_governor.penalize()
         response.raise_for_status()
         data = response.json()
-        
-        if 'error' in data:
-            error_msg = data.get('message', f"Last.fm API error: {data['error']}")
-            logger.error(f"Last.fm API error: {error_msg}")
-            raise LastFMError(error_msg)
-        
-        return data
+    except requests.HTTPError as e:
+        logger.error(f"Request error: {e}")
+        status = e.response.status_code if e.response is not None else 500
+        raise _record_outcome(breaker, lastfm_error("Failed to connect to Last.fm", status=status))
     except requests.RequestException as e:
         logger.error(f"Request error: {e}")
-        raise LastFMError("Failed to connect to Last.fm")
+        raise _record_outcome(breaker, lastfm_error("Failed to connect to Last.fm"))
     except ValueError as e:
         logger.error(f"JSON decode error: {e}")
-        raise LastFMError("Invalid response from Last.fm")
+        raise _record_outcome(breaker, lastfm_error("Invalid response from Last.fm"))
+    
+    if 'error' in data:
+        if data['error'] == RATE_LIMIT_ERROR_CODE:
+            upstream_governor.penalize()
+        error_msg = data.get('message', f"Last.fm API error: {data['error']}")
+        logger.error(f"Last.fm API error: {error_msg}")
+        raise _record_outcome(breaker, lastfm_error(error_msg, code=data['error']))
+    
+    breaker.record_success()
+    return data
+
+def _record_outcome(breaker, error):
+    """Count a failed call against its breaker if it means Last.fm is down; returns error"""
+    if isinstance(error, UpstreamUnavailableError):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return error
+
+def create_async_client():
+    """Create an async Last.fm client sharing the sync path's settings and error mapping"""
+    return AsyncLastFMClient(
+        BASE_URL,
+        error_for=lastfm_error,
+        signer=get_api_signature,
+        connect_timeout=http_client.connect_timeout,
+        read_timeout=http_client.read_timeout,
+        limit=http_client.pool_maxsize,
+        governor=upstream_governor,
+        breakers=circuit_breakers,
+        is_outage=lambda error: isinstance(error, UpstreamUnavailableError)
+    )
 
 def get_user_info(username):
     """Get user information from Last.fm"""
@@ -198,6 +543,24 @@ def get_user_info(username):
         logger.error(f"Error getting user info: {e}")
         raise LastFMError("Failed to get user information")
 
+@app.before_request
+def start_scrobble_flusher():
+    """Make sure this worker drains the scrobble queue, including entries left by a restart"""
+    if SCROBBLE_FLUSHER:
+        scrobble_queue.start()
+
+@app.after_request
+def flag_stale_response(response):
+    """Mark responses that were built from stale Last.fm data"""
+    if g.get('lastfm_stale'):
+        response.headers['Warning'] = '110 - "Response is Stale"'
+        if response.is_json:
+            payload = response.get_json(silent=True)
+            if isinstance(payload, dict):
+                payload['stale'] = True
+                response.set_data(json.dumps(payload))
+    return response
+
 @app.errorhandler(LastFMError)
 def handle_lastfm_error(error):
     return jsonify({'success': False, 'error': str(error)}), 400
@@ -260,48 +623,84 @@ def logout():
     session.clear()
     return redirect(url_for('home'))
 
+def sync_user_history(user_name):
+    """Pull new scrobbles into the local history if it is stale"""
+    if not history_store.needs_sync(user_name):
+        return
+    
+    def fetch(extra):
+        params = {'method': 'user.getRecentTracks', 'user': user_name, 'api_key': API_KEY}
+        params.update(extra)
+        return make_lastfm_request(params)
+    
+    request_coalescer.do(f"history-sync:{user_name.lower()}",
+                         lambda: history_store.sync(user_name, fetch))
+    backfill.resume_interrupted(user_name)
+    # A sync too far behind leaves a gap an earlier full import cannot fill
+    backfill.refill(user_name)
+
+def fetch_history_page(user_name, extra):
+    """Fetch a backfill page of user.getRecentTracks at background priority"""
+    params = {'method': 'user.getRecentTracks', 'user': user_name, 'api_key': API_KEY, 'format': 'json'}
+    params.update(extra)
+    # Pinned 'to' pages are read once and stored locally; caching them would
+    # only push live responses out of the in-memory cache
+    return _send_lastfm_request(params, priority=BACKGROUND)
+
+def fetch_recent_block(user_name, extra, background=False):
+    """Fetch a superblock of user.getRecentTracks for the /recent-tracks page cache"""
+    params = {'method': 'user.getRecentTracks', 'user': user_name, 'api_key': API_KEY, 'format': 'json'}
+    params.update(extra)
+    if 'to' not in extra:
+        # The unpinned first block keeps the cache's outage fallback and coalescing
+        return make_lastfm_request(params)
+    return _send_lastfm_request(params, priority=BACKGROUND if background else None)
+
+def get_local_recent_tracks(user_name, limit, page):
+    """Serve a page of recent tracks from the local history, or None if not covered"""
+    try:
+        sync_user_history(user_name)
+    except LastFMError as e:
+        if history_store.get_state(user_name) is None:
+            return None
+        logger.warning(f"History sync failed, serving local copy: {e}")
+        _mark_stale_response()
+    
+    state = history_store.get_state(user_name)
+    covered = history_store.covered_count(user_name)
+    offset = (page - 1) * limit
+    if state is None or (offset + limit > covered and covered < state['remote_total']):
+        return None
+    
+    tracks = history_store.recent(user_name, limit, offset)
+    if page == 1 and state['now_playing']:
+        tracks.insert(0, state['now_playing'])
+    total = max(state['remote_total'], covered)
+    return {
+        'tracks': tracks,
+        'total_pages': max(1, -(-total // limit)),
+        'current_page': page,
+        'total_tracks': total
+    }
+
 def get_user_recent_tracks(limit=10, page=1):
-    """Get user's recent tracks from Last.fm with pagination"""
+    """Get user's recent tracks with pagination, from local history when it covers the page"""
     if 'oauth_token' not in session or 'user_name' not in session:
         return {'tracks': [], 'total_pages': 1, 'current_page': page, 'total_tracks': 0}
 
     try:
-        params = {
-            'method': 'user.getRecentTracks',
-            'user': session.get('user_name'),
-            'api_key': API_KEY,
-            'limit': min(limit, 50),  # Limit to prevent abuse
-            'page': page
-        }
-
-        data = make_lastfm_request(params)
-        
-        result = {
-            'tracks': [],
-            'total_pages': 1,
-            'current_page': page,
-            'total_tracks': 0
-        }
-        
-        if 'recenttracks' in data:
-            recent_tracks = data['recenttracks']
-            
-            # Get pagination info
-            if '@attr' in recent_tracks:
-                attr = recent_tracks['@attr']
-                result['total_pages'] = int(attr.get('totalPages', 1))
-                result['current_page'] = int(attr.get('page', 1))
-                result['total_tracks'] = int(attr.get('total', 0))
-            
-            # Get tracks
-            if 'track' in recent_tracks:
-                tracks = recent_tracks['track']
-                # Ensure tracks is always a list
-                if isinstance(tracks, dict):
-                    tracks = [tracks]
-                result['tracks'] = tracks
-        
-        return result
+        local = get_local_recent_tracks(session.get('user_name'), limit, page)
+        if local is not None:
+            return local
+        
+        # Limit to prevent abuse; the upstream request is always a full block
+        state = history_store.get_state(session.get('user_name'))
+        anchor = None
+        if state and state['newest_uts']:
+            # The sync just read the newest scrobbles; pin the blocks to them
+            anchor = {'to_uts': state['newest_uts'] + 1, 'total': state['remote_total'],
+                      'now_playing': state['now_playing']}
+        return recent_blocks.page(session.get('user_name'), min(limit, 50), page, anchor)
     except LastFMError:
         raise
     except Exception as e:
@@ -310,59 +709,37 @@ def get_user_recent_tracks(limit=10, page=1):
 
 def get_most_active_hour(tracks):
     """Analyze most active listening hours"""
-    hours = {}
-    for track in tracks:
-        if 'date' in track:
-            try:
-                timestamp = int(track['date']['uts'])
-                hour = datetime.fromtimestamp(timestamp).hour
-                hours[hour] = hours.get(hour, 0) + 1
-            except:
-                continue
-    
-    return max(hours.items(), key=lambda x: x[1])[0] if hours else 12
+    return ListeningAnalytics.from_tracks(tracks).most_active_hour()
+
+def get_peak_hour(patterns):
+    """Hour with the most scrobbles in a patterns payload (12 when empty)"""
+    hourly = patterns['hourly']
+    return int(max(hourly, key=lambda hour: (hourly[hour], -int(hour)))) if any(hourly.values()) else 12
 
 def get_listening_patterns(tracks):
-    """Analyze listening patterns by day of week and hour"""
-    patterns = {
-        'hourly': {str(i): 0 for i in range(24)},
-        'daily': {str(i): 0 for i in range(7)},  # 0=Monday, 6=Sunday
-        'monthly': {}
-    }
-    
-    for track in tracks:
-        if 'date' in track:
-            try:
-                timestamp = int(track['date']['uts'])
-                dt = datetime.fromtimestamp(timestamp)
-                hour = str(dt.hour)
-                day = str(dt.weekday())
-                month = dt.strftime('%Y-%m')
-                
-                patterns['hourly'][hour] += 1
-                patterns['daily'][day] += 1
-                patterns['monthly'][month] = patterns['monthly'].get(month, 0) + 1
-            except:
-                continue
-    
-    return patterns
+    """Analyze listening patterns by day of week (0=Monday) and hour"""
+    return ListeningAnalytics.from_tracks(tracks).patterns()
 
-def get_top_genres(tracks, limit=10):
-    """Get top genres from recent tracks (simplified - uses artist tags)"""
-    # This is a simplified version - in a real implementation you'd use artist.getTopTags
-    genre_counts = {}
-    
-    # For demo purposes, we'll extract common genres from artist names
-    # In production, you'd call artist.getTopTags for each unique artist
-    common_genres = ['rock', 'pop', 'electronic', 'hip hop', 'indie', 'metal', 'jazz', 'classical', 'folk', 'alternative']
-    
-    for track in tracks:
-        artist = track.get('artist', {}).get('#text', '').lower()
-        for genre in common_genres:
-            if genre in artist:
-                genre_counts[genre] = genre_counts.get(genre, 0) + 1
-    
-    return sorted(genre_counts.items(), key=lambda x: x[1], reverse=True)[:limit]
+def fetch_artist_tags(artist, background=False):
+    """Fetch artist.getTopTags for the tag index; None if Last.fm does not know the artist"""
+    params = {'method': 'artist.getTopTags', 'artist': artist, 'autocorrect': 1,
+              'api_key': API_KEY, 'format': 'json'}
+    try:
+        # The batch a request waits for is an ordinary read; the interactive
+        # tier stays reserved for scrobble and now-playing writes
+        return _send_lastfm_request(params, priority=BACKGROUND if background else None)
+    except LastFMNotFoundError:
+        return None
+
+def get_top_genres(tracks, limit=10, plays_by_artist=None):
+    """Get top genres by play share, from the artist tag index"""
+    if plays_by_artist is None:
+        plays_by_artist = {}
+        for track in tracks:
+            artist = track.get('artist', {}).get('#text', '')
+            if artist:
+                plays_by_artist[artist] = plays_by_artist.get(artist, 0) + 1
+    return artist_tags.genres(plays_by_artist, limit)
 
 @app.route('/recent-tracks')
 @require_auth
@@ -527,6 +904,45 @@ def admin_clear_rate_limits():
         logger.error(f"Error clearing rate limits: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/admin/cache-stats')
+@require_admin
+def admin_cache_stats():
+    """Get Last.fm response cache statistics"""
+    return jsonify({
+        'success': True,
+        'cache': response_cache.get_stats(),
+        'metadata_cache': metadata_cache.get_stats(),
+        'image_cache': image_cache.get_stats(),
+        'artwork': artwork_store.get_stats(),
+        'history': history_store.get_stats(),
+        'backfill': backfill.get_stats(),
+        'aggregates': aggregates.get_stats(),
+        'sketches': sketches.get_stats(),
+        'artist_tags': artist_tags.get_stats(),
+        'recent_blocks': recent_blocks.get_stats(),
+        'scrobble_queue': scrobble_queue.get_stats(),
+        'coalescing': request_coalescer.get_stats()
+    })
+
+@app.route('/admin/upstream-stats')
+@require_admin
+def admin_upstream_stats():
+    """Get outbound Last.fm request budget statistics"""
+    return jsonify({
+        'success': True,
+        'governor': upstream_governor.get_stats(),
+        'circuit_breakers': circuit_breakers.snapshot()
+    })
+
+@app.route('/admin/clear-cache', methods=['POST'])
+@require_admin
+def admin_clear_cache():
+    """Clear the Last.fm response cache - admin only"""
+    response_cache.clear()
+    image_cache.clear()
+    logger.info(f"Response cache cleared by admin user: {session.get('user_name')}")
+    return jsonify({'success': True, 'message': 'Response cache cleared'})
+
 @app.route('/check-admin')
 @require_auth
 def check_admin_route():
@@ -556,23 +972,49 @@ def get_listening_stats():
         recent_data = get_user_recent_tracks(limit=50, page=1)
         tracks = recent_data.get('tracks', [])
         
-        # Get listening patterns
-        patterns = get_listening_patterns(tracks)
+        # Prefer the aggregates over the local history when it holds more
+        # than the sample, including a backfill that is still running
+        user_name = session.get('user_name')
+        approximate = request.args.get('approx', '1' if STATS_APPROXIMATE else '0') not in ('0', 'false')
+        local = aggregates.get(user_name)
+        from_history = local['scrobbles'] > len(tracks)
+        estimate = None
+        if approximate and from_history:
+            # Merged month sketches: bounded work however long the history
+            since, until = _chart_range(request.args) or (None, None)
+            estimate = sketches.summary(user_name, since, until, GENRE_ARTISTS)
+            patterns = local['patterns']
+            analyzed = local['scrobbles']
+            plays_by_artist = {entry['artist']: entry['plays'] for entry in estimate['top_artists']}
+        elif from_history:
+            patterns = local['patterns']
+            analyzed = local['scrobbles']
+            plays_by_artist = {entry['artist']: entry['plays']
+                               for entry in aggregates.top(user_name, 'artist', GENRE_ARTISTS)}
+        else:
+            patterns = ListeningAnalytics.from_tracks(tracks).patterns()
+            analyzed = len(tracks)
+            plays_by_artist = None
         
         # Calculate unique counts
         unique_artists = set()
         unique_albums = set()
         
-        for track in tracks:
-            if 'artist' in track:
-                unique_artists.add(track['artist'].get('#text', ''))
-            if 'album' in track:
-                unique_albums.add(track['album'].get('#text', ''))
+        if estimate is None:
+            for track in tracks:
+                if 'artist' in track:
+                    unique_artists.add(track['artist'].get('#text', ''))
+                if 'album' in track:
+                    unique_albums.add(track['album'].get('#text', ''))
         
         # Calculate average scrobbles per day (rough estimate)
         total_scrobbles = recent_data.get('total_tracks', 0)
         avg_per_day = 0
-        if tracks:
+        if from_history:
+            days = (time.time() - local['first_uts']) / (24 * 3600)
+            if days > 0:
+                avg_per_day = round(local['scrobbles'] / days, 1)
+        elif tracks:
             try:
                 oldest_track = tracks[-1]
                 if 'date' in oldest_track:
@@ -585,20 +1027,74 @@ def get_listening_stats():
         
         stats = {
             'total_scrobbles': total_scrobbles,
-            'unique_artists': len(unique_artists),
-            'unique_albums': len(unique_albums),
+            'unique_artists': max(len(unique_artists), local['unique_artists']),
+            'unique_albums': max(len(unique_albums), local['unique_albums']),
             'avg_per_day': avg_per_day,
-            'most_active_hour': get_most_active_hour(tracks),
+            'most_active_hour': get_peak_hour(patterns),
             'patterns': patterns,
-            'top_genres': get_top_genres(tracks, 8)
+            'top_genres': get_top_genres(tracks, 8, plays_by_artist),
+            'coverage': {
+                'analyzed_scrobbles': analyzed,
+                'backfill': backfill.progress(user_name)
+            }
         }
+        if estimate is not None:
+            stats['unique_artists'] = estimate['unique_artists']
+            stats['unique_albums'] = estimate['unique_albums']
+            stats['approximate'] = {
+                'from': estimate['from'],
+                'to': estimate['to'],
+                'scrobbles': estimate['scrobbles'],
+                'top_artists': estimate['top_artists'][:10],
+                'top_tracks': estimate['top_tracks'][:10],
+                'error': estimate['error']
+            }
         
         return jsonify({'success': True, 'stats': stats})
         
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid days or date range'}), 400
     except Exception as e:
         logger.error(f"Error getting listening stats: {e}")
         return jsonify({'success': False, 'error': 'Failed to get listening stats'}), 500
 
+def _chart_range(args):
+    """(since, until) for a chart from 'days' or 'from'/'to', or None for Last.fm's fixed periods"""
+    if args.get('days'):
+        days = int(args['days'])
+        if days < 1:
+            raise ValueError(f"Invalid day count: {days}")
+        today = int(time.time()) // 86400 * 86400
+        return today - (days - 1) * 86400, None
+    if args.get('from') or args.get('to'):
+        return _parse_history_time(args.get('from')), _parse_history_time(args.get('to'), end_of_day=True)
+    return None
+
+def local_top_chart(user_name, kind, chart_range, limit):
+    """Build a top chart for any date range from the local history's daily rollups"""
+    try:
+        sync_user_history(user_name)
+    except LastFMError as e:
+        logger.warning(f"History sync failed, charting local copy: {e}")
+        _mark_stale_response()
+    
+    since, until = chart_range
+    items = []
+    for rank, entry in enumerate(aggregates.top_range(user_name, kind, since, until, limit), start=1):
+        item = {'name': entry.get('name', entry['artist']), 'playcount': str(entry['plays']),
+                '@attr': {'rank': str(rank)}}
+        if kind != 'artist':
+            item['artist'] = {'name': entry['artist']}
+        items.append(item)
+    
+    # Complete when the contiguous local range reaches back to the start
+    state = history_store.get_state(user_name)
+    complete = state is not None and state['oldest_uts'] is not None and (
+        (since is not None and since >= state['oldest_uts'])
+        or history_store.covered_count(user_name) >= state['remote_total']
+    )
+    return items, {'from': since, 'to': until, 'source': 'local', 'complete': complete}
+
 @app.route('/top-artists')
 @require_auth
 # Removed @rate_limit decorator
@@ -608,23 +1104,36 @@ def get_top_artists():
         period = request.args.get('period', '7day')
         limit = min(int(request.args.get('limit', 10)), 50)
         
-        params = {
-            'method': 'user.getTopArtists',
-            'user': session.get('user_name'),
-            'api_key': API_KEY,
-            'period': period,
-            'limit': limit
-        }
+        chart_range = _chart_range(request.args)
+        if chart_range is not None:
+            artists, range_info = local_top_chart(session.get('user_name'), 'artist', chart_range, limit)
+        else:
+            params = {
+                'method': 'user.getTopArtists',
+                'user': session.get('user_name'),
+                'api_key': API_KEY,
+                'period': period,
+                'limit': limit
+            }
+            
+            data = make_lastfm_request(params)
+            artists = data.get('topartists', {}).get('artist', [])
+            range_info = None
+            
+            # Ensure artists is always a list
+            if isinstance(artists, dict):
+                artists = [artists]
         
-        data = make_lastfm_request(params)
-        artists = data.get('topartists', {}).get('artist', [])
+        if _wants_images():
+            add_chart_images(artists, 'artist')
         
-        # Ensure artists is always a list
-        if isinstance(artists, dict):
-            artists = [artists]
-            
-        return jsonify({'success': True, 'artists': artists})
+        result = {'success': True, 'artists': artists}
+        if range_info:
+            result['range'] = range_info
+        return jsonify(result)
         
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit, days or date range'}), 400
     except LastFMError as e:
         return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
@@ -640,23 +1149,36 @@ def get_top_tracks():
         period = request.args.get('period', '7day')
         limit = min(int(request.args.get('limit', 10)), 50)
         
-        params = {
-            'method': 'user.getTopTracks',
-            'user': session.get('user_name'),
-            'api_key': API_KEY,
-            'period': period,
-            'limit': limit
-        }
+        chart_range = _chart_range(request.args)
+        if chart_range is not None:
+            tracks, range_info = local_top_chart(session.get('user_name'), 'track', chart_range, limit)
+        else:
+            params = {
+                'method': 'user.getTopTracks',
+                'user': session.get('user_name'),
+                'api_key': API_KEY,
+                'period': period,
+                'limit': limit
+            }
+            
+            data = make_lastfm_request(params)
+            tracks = data.get('toptracks', {}).get('track', [])
+            range_info = None
+            
+            # Ensure tracks is always a list
+            if isinstance(tracks, dict):
+                tracks = [tracks]
         
-        data = make_lastfm_request(params)
-        tracks = data.get('toptracks', {}).get('track', [])
+        if _wants_images():
+            add_chart_images(tracks, 'track')
         
-        # Ensure tracks is always a list
-        if isinstance(tracks, dict):
-            tracks = [tracks]
-            
-        return jsonify({'success': True, 'tracks': tracks})
+        result = {'success': True, 'tracks': tracks}
+        if range_info:
+            result['range'] = range_info
+        return jsonify(result)
         
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit, days or date range'}), 400
     except LastFMError as e:
         return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
@@ -672,28 +1194,92 @@ def get_top_albums():
         period = request.args.get('period', '7day')
         limit = min(int(request.args.get('limit', 10)), 50)
         
-        params = {
-            'method': 'user.getTopAlbums',
-            'user': session.get('user_name'),
+        chart_range = _chart_range(request.args)
+        if chart_range is not None:
+            albums, range_info = local_top_chart(session.get('user_name'), 'album', chart_range, limit)
+        else:
+            params = {
+                'method': 'user.getTopAlbums',
+                'user': session.get('user_name'),
+                'api_key': API_KEY,
+                'period': period,
+                'limit': limit
+            }
+            
+            data = make_lastfm_request(params)
+            albums = data.get('topalbums', {}).get('album', [])
+            range_info = None
+            
+            # Ensure albums is always a list
+            if isinstance(albums, dict):
+                albums = [albums]
+        
+        if _wants_images():
+            add_chart_images(albums, 'album')
+        
+        result = {'success': True, 'albums': albums}
+        if range_info:
+            result['range'] = range_info
+        return jsonify(result)
+        
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit, days or date range'}), 400
+    except LastFMError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error getting top albums: {e}")
+        return jsonify({'success': False, 'error': 'Failed to get top albums'}), 500
+
+@app.route('/top-overview')
+@require_auth
+async def get_top_overview():
+    """Get top artists, tracks and albums with one concurrent upstream fan-out"""
+    try:
+        period = request.args.get('period', '7day')
+        limit = min(int(request.args.get('limit', 10)), 50)
+        user_name = session.get('user_name')
+        
+        methods = ('user.getTopArtists', 'user.getTopTracks', 'user.getTopAlbums')
+        requests_params = [{
+            'method': method,
+            'user': user_name,
             'api_key': API_KEY,
             'period': period,
             'limit': limit
-        }
+        } for method in methods]
         
-        data = make_lastfm_request(params)
-        albums = data.get('topalbums', {}).get('album', [])
-        
-        # Ensure albums is always a list
-        if isinstance(albums, dict):
-            albums = [albums]
+        async with create_async_client() as client:
+            results = await asyncio.gather(*(make_lastfm_request_async(client, params)
+                                             for params in requests_params), return_exceptions=True)
+            
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+            
+            charts = {}
+            for (key, kind), data in zip((('artists', 'artist'), ('tracks', 'track'), ('albums', 'album')), results):
+                items = data.get(f"top{key}", {}).get(kind, [])
+                # Ensure each chart is always a list
+                charts[kind] = [items] if isinstance(items, dict) else items
             
-        return jsonify({'success': True, 'albums': albums})
+            if _wants_images():
+                await asyncio.gather(*(add_chart_images_async(client, items, kind)
+                                       for kind, items in charts.items()))
         
+        return jsonify({
+            'success': True,
+            'artists': charts['artist'],
+            'tracks': charts['track'],
+            'albums': charts['album']
+        })
+        
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit'}), 400
     except LastFMError as e:
         return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
-        logger.error(f"Error getting top albums: {e}")
-        return jsonify({'success': False, 'error': 'Failed to get top albums'}), 500
+        logger.error(f"Error getting top overview: {e}")
+        return jsonify({'success': False, 'error': 'Failed to get top overview'}), 500
 
 # Continue with other routes (keeping existing functionality)...
 @app.route('/user-info')
@@ -785,23 +1371,27 @@ def scrobble():
         if len(artist) > 200 or len(track) > 200:
             return jsonify({'success': False, 'error': 'Artist and track names must be under 200 characters'}), 400
 
-        params = {
-            'method': 'track.scrobble',
-            'api_key': API_KEY,
-            'sk': session['oauth_token'],
-            'artist': artist,
-            'track': track,
-            'timestamp': timestamp
-        }
-        
-        if album:
-            params['album'] = album
-        
-        params['api_sig'] = get_api_signature(params)
-        
-        data = make_lastfm_request(params, method='POST')
-        
-        logger.info(f"Scrobbled: {artist} - {track} at {datetime.fromtimestamp(timestamp)} for user {session.get('user_name')}")
+        user_name = session.get('user_name')
+        try:
+            # Acknowledge once the entry is durable; the flusher sends it
+            entry_id = scrobble_queue.enqueue(user_name, session['oauth_token'], artist, track, album, timestamp)
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"Scrobble queue unavailable, sending directly: {e}")
+        else:
+            logger.info(f"Queued scrobble: {artist} - {track} at {datetime.fromtimestamp(timestamp)} for user {user_name}")
+            return jsonify({
+                'success': True,
+                'queued': True,
+                'id': entry_id,
+                'status_url': url_for('scrobble_status', entry_id=entry_id),
+                'message': 'Track queued for scrobbling'
+            }), 202
+        
+        results = send_scrobble_batch(user_name, session['oauth_token'], [(artist, track, album, timestamp)])
+        if results and not results[0]['accepted']:
+            return jsonify({'success': False, 'error': results[0]['ignored_message'] or 'Scrobble ignored by Last.fm'}), 400
+        
+        logger.info(f"Scrobbled: {artist} - {track} at {datetime.fromtimestamp(timestamp)} for user {user_name}")
         return jsonify({'success': True, 'message': 'Track scrobbled successfully'})
 
     except LastFMError as e:
@@ -810,6 +1400,31 @@ def scrobble():
         logger.error(f"Unexpected error in scrobble: {e}")
         return jsonify({'success': False, 'error': 'An unexpected error occurred'}), 500
 
+def scrobble_results(data):
+    """Per-track results of a track.scrobble response, in submission order"""
+    results = data.get('scrobbles', {}).get('scrobble', [])
+    return [results] if isinstance(results, dict) else results
+
+def scrobble_accepted(result):
+    """Whether Last.fm accepted a track.scrobble result; its ignored code may be a string or an int"""
+    return str(result.get('ignoredMessage', {}).get('code', '0')) == '0'
+
+def record_local_scrobble(user_name, data, albums):
+    """Add the accepted track.scrobble results to the local history and its aggregates"""
+    try:
+        # Store the names as Last.fm corrected them so the next sync matches these rows
+        accepted = [(
+            result.get('artist', {}).get('#text', ''),
+            result.get('track', {}).get('#text', ''),
+            result.get('album', {}).get('#text', album),
+            int(result['timestamp'])
+        ) for result, album in zip(scrobble_results(data), albums)
+            if scrobble_accepted(result)]
+        if accepted:
+            history_store.record_scrobbles(user_name, accepted)
+    except (AttributeError, KeyError, ValueError, sqlite3.Error) as e:
+        logger.warning(f"Could not record scrobble locally: {e}")
+
 @app.route('/search')
 @rate_limit
 def search():
@@ -906,33 +1521,246 @@ def theme_settings():
 @require_auth
 @rate_limit
 def batch_scrobble():
-    """Scrobble multiple tracks at once"""
+    """Scrobble up to 50 tracks in one signed track.scrobble request"""
     try:
-        json_data = request.json or {}
+        json_data = request.get_json(silent=True) or {}
         tracks = json_data.get('tracks', [])
-        if len(tracks) > 50:  # Last.fm limit
+        if not isinstance(tracks, list) or not tracks:
+            return jsonify({'success': False, 'error': 'No tracks to scrobble'}), 400
+        if len(tracks) > MAX_SCROBBLE_BATCH:  # Last.fm limit
             return jsonify({'success': False, 'error': 'Too many tracks. Maximum 50 tracks per batch.'}), 400
         
-        results = []
-        for track_data in tracks:
-            # Process each track
-            # Add to batch scrobble request
-            pass
+        errors, parsed = [], []
+        for index, track_data in enumerate(tracks):
+            try:
+                parsed.append(parse_batch_track(track_data))
+            except ValueError as e:
+                errors.append(f"Track {index + 1}: {e}")
+        if errors:
+            return jsonify({'success': False, 'errors': errors}), 400
+        
+        results = send_scrobble_batch(session.get('user_name'), session['oauth_token'], parsed)
+        accepted = sum(1 for result in results if result['accepted'])
         
-        return jsonify({'success': True, 'results': results})
+        logger.info(f"Batch scrobbled {accepted}/{len(tracks)} tracks for user {session.get('user_name')}")
+        return jsonify({'success': True, 'accepted': accepted, 'ignored': len(results) - accepted,
+                        'results': results})
+    except LastFMError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        logger.error(f"Unexpected error in batch scrobble: {e}")
+        return jsonify({'success': False, 'error': 'An unexpected error occurred'}), 500
+
+def send_scrobble_batch(user_name, session_key, tracks):
+    """
+    Scrobble (artist, track, album, timestamp) tuples in one signed track.scrobble
+    request, record the accepted ones locally and return per-track results
+    """
+    params = {
+        'method': 'track.scrobble',
+        'api_key': API_KEY,
+        'sk': session_key
+    }
+    for index, (artist, track, album, timestamp) in enumerate(tracks):
+        params[f"artist[{index}]"] = artist
+        params[f"track[{index}]"] = track
+        params[f"timestamp[{index}]"] = timestamp
+        if album:
+            params[f"album[{index}]"] = album
+    params['api_sig'] = get_api_signature(params)
+    
+    data = make_lastfm_request(params, method='POST')
+    record_local_scrobble(user_name, data, [album for _, _, album, _ in tracks])
+    
+    results = []
+    for index, result in enumerate(scrobble_results(data)):
+        ignored = result.get('ignoredMessage', {})
+        results.append({
+            'index': index,
+            'artist': result.get('artist', {}).get('#text', ''),
+            'track': result.get('track', {}).get('#text', ''),
+            'album': result.get('album', {}).get('#text', ''),
+            'timestamp': int(result.get('timestamp') or 0),
+            'accepted': scrobble_accepted(result),
+            'ignored_code': int(ignored.get('code') or 0),
+            'ignored_message': ignored.get('#text', '')
+        })
+    return results
+
+def scrobble_error_retryable(error):
+    """Whether a queued scrobble batch that failed with this error should be sent again later"""
+    return isinstance(error, (UpstreamUnavailableError, UpstreamBusyError)) or not isinstance(error, LastFMError)
+
+@app.route('/scrobble/status/<entry_id>')
+@require_auth
+def scrobble_status(entry_id):
+    """Report whether a queued scrobble has reached Last.fm"""
+    status = scrobble_queue.status(session.get('user_name'), entry_id)
+    if status is None:
+        return jsonify({'success': False, 'error': 'No such scrobble'}), 404
+    return jsonify({'success': True, 'scrobble': status})
+
+def parse_batch_track(track_data):
+    """(artist, track, album, timestamp) of one /batch-scrobble entry; raises ValueError if invalid"""
+    if not isinstance(track_data, dict):
+        raise ValueError('must be an object')
+    artist = str(track_data.get('artist') or '').strip()
+    track = str(track_data.get('track') or '').strip()
+    album = str(track_data.get('album') or '').strip()
+    if not artist or not track:
+        raise ValueError('artist and track are required')
+    if len(artist) > 200 or len(track) > 200:
+        raise ValueError('artist and track names must be under 200 characters')
+    
+    # A Unix 'timestamp' or an ISO 'scrobble_time' as on /scrobble; now by default
+    timestamp = track_data.get('timestamp')
+    custom_time = str(track_data.get('scrobble_time') or '').strip()
+    try:
+        if timestamp not in (None, ''):
+            timestamp = int(timestamp)
+        elif custom_time:
+            timestamp = int(datetime.fromisoformat(custom_time.replace('Z', '+00:00')).timestamp())
+        else:
+            timestamp = int(time.time())
+    except (ValueError, TypeError):
+        raise ValueError('invalid timestamp')
+    return artist, track, album, timestamp
+
+@app.route('/backfill', methods=['POST'])
+@require_auth
+def start_backfill():
+    """Start or resume importing the user's full scrobble history"""
+    progress = backfill.start(session.get('user_name'))
+    return jsonify({'success': True, 'progress': progress}), 202
+
+@app.route('/backfill/progress')
+@require_auth
+def backfill_progress():
+    """Report how far the user's history import has got"""
+    user_name = session.get('user_name')
+    backfill.resume_interrupted(user_name)
+    return jsonify({'success': True, 'progress': backfill.progress(user_name)})
+
+def _parse_history_time(value, end_of_day=False):
+    """Parse a history filter given as YYYY-MM-DD (UTC) or a Unix timestamp"""
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    day = datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    if end_of_day:
+        return int((day + timedelta(days=1)).timestamp()) - 1
+    return int(day.timestamp())
+
+def search_user_history(user_name, args):
+    """Search the local history from request arguments; raises ValueError on bad input"""
+    limit = min(max(int(args.get('limit', 50)), 1), 200)
+    cursor = args.get('cursor') or None
+    if cursor is None:
+        # First page only: pick up scrobbles made since the last sync
+        try:
+            sync_user_history(user_name)
+        except LastFMError as e:
+            logger.warning(f"History sync failed, searching local copy: {e}")
+            _mark_stale_response()
+    
+    return history_store.search(
+        user_name,
+        args.get('search', ''),
+        since=_parse_history_time(args.get('from')),
+        until=_parse_history_time(args.get('to'), end_of_day=True),
+        limit=limit,
+        cursor=cursor
+    )
 
 @app.route('/history')
 @require_auth
 def scrobble_history():
     """Advanced scrobble history with filtering"""
+    user_name = session.get('user_name')
     search = request.args.get('search', '')
-    date_from = request.args.get('from')
-    date_to = request.args.get('to')
+    date_from = request.args.get('from', '')
+    date_to = request.args.get('to', '')
+    
+    try:
+        result = search_user_history(user_name, request.args)
+        error, status = None, 200
+    except ValueError:
+        result = {'tracks': [], 'next_cursor': None}
+        error, status = 'Dates must look like 2025-01-31', 400
+    
+    next_url = None
+    if result['next_cursor']:
+        next_url = url_for('scrobble_history', search=search, cursor=result['next_cursor'],
+                           **{'from': date_from, 'to': date_to})
+    state = history_store.get_state(user_name)
+    return render_template('history.html',
+                         user_name=user_name,
+                         search=search,
+                         date_from=date_from,
+                         date_to=date_to,
+                         tracks=result['tracks'],
+                         next_url=next_url,
+                         error=error,
+                         stored=history_store.summary(user_name)['scrobbles'],
+                         remote_total=state['remote_total'] if state else 0,
+                         backfill=backfill.progress(user_name)), status
+
+@app.route('/history/search')
+@require_auth
+def search_history_api():
+    """Search the locally stored scrobble history"""
+    try:
+        result = search_user_history(session.get('user_name'), request.args)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid date, limit or cursor'}), 400
+    return jsonify({'success': True, 'tracks': result['tracks'], 'next_cursor': result['next_cursor']})
+
+def history_export_rows(user_name, source, since, until):
+    """Pick the row source for an export: the local copy when it covers the range, else Last.fm"""
+    if source not in ('auto', 'local', 'lastfm'):
+        raise ValueError(f"Unknown export source: {source}")
+    if source == 'auto':
+        try:
+            sync_user_history(user_name)
+        except LastFMError as e:
+            logger.warning(f"History sync failed before export: {e}")
+        state = history_store.get_state(user_name)
+        covered = state is not None and (
+            history_store.covered_count(user_name) >= state['remote_total']
+            or (since is not None and state['oldest_uts'] is not None and since >= state['oldest_uts'])
+        )
+        source = 'local' if covered else 'lastfm'
+    
+    if source == 'local':
+        return source, history_store.iter_rows(user_name, since=since, until=until)
+    return source, remote_rows(lambda extra: fetch_history_page(user_name, extra), since=since, until=until)
+
+@app.route('/history/export')
+@require_auth
+@rate_limit
+def export_history():
+    """Stream the user's scrobble history as CSV or NDJSON, optionally gzipped"""
+    user_name = session.get('user_name')
+    try:
+        source, rows = history_export_rows(
+            user_name,
+            request.args.get('source', 'auto'),
+            since=_parse_history_time(request.args.get('from')),
+            until=_parse_history_time(request.args.get('to'), end_of_day=True)
+        )
+        export = HistoryExport(rows, request.args.get('format', 'csv'),
+                               compress=request.args.get('gzip', '').lower() in ('1', 'true', 'yes'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
-    # Implementation for filtered history
-    return render_template('history.html')
+    # Rows are read as the body is sent; an upstream failure part-way
+    # through aborts the transfer rather than ending the file early
+    response = Response(stream_with_context(iter(export)), mimetype=export.mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{export.filename(user_name)}"'
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Export-Source'] = source
+    return response
 
 @app.route('/api-usage')
 @require_auth
@@ -962,6 +1790,302 @@ def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
 
+def _largest_image(images):
+    """Return the URL of the largest non-empty image in a Last.fm image list"""
+    for img in reversed(images or []):  # Start from largest
+        if isinstance(img, dict) and img.get('#text'):
+            return img['#text']
+    return ''
+
+def _image_cache_key(kind, names):
+    return image_cache.make_key({'image': kind, 'names': '\x1f'.join(n.strip().lower() for n in names)})
+
+def _remembered_image(key):
+    """Return a remembered lookup outcome: the URL, or None if unknown; raises if not found"""
+    cached = image_cache.get(key)
+    if cached is None:
+        return None
+    if 'not_found' in cached:
+        raise LastFMNotFoundError(cached['not_found'])
+    return cached['url']
+
+def _remember_image(key, image_url):
+    image_cache.set(key, {'url': image_url}, ttl=IMAGE_CACHE_TTL if image_url else IMAGE_MISS_TTL)
+    return image_url
+
+def _memoized_image(kind, names, resolve):
+    """
+    Return a remembered image lookup outcome, or run resolve() and remember it.
+    
+    Found images are kept for IMAGE_CACHE_TTL; "no image" and "not found"
+    outcomes for IMAGE_MISS_TTL. Not-found errors are re-raised from the
+    cache so callers see the same result either way. Transient failures
+    are never remembered.
+    """
+    key = _image_cache_key(kind, names)
+    cached = _remembered_image(key)
+    if cached is not None:
+        return cached
+    
+    try:
+        image_url = resolve()
+    except LastFMNotFoundError as e:
+        image_cache.set(key, {'not_found': str(e)}, ttl=IMAGE_MISS_TTL)
+        raise
+    return _remember_image(key, image_url)
+
+async def _memoized_image_async(kind, names, resolve):
+    """_memoized_image for a coroutine function resolve"""
+    key = _image_cache_key(kind, names)
+    cached = _remembered_image(key)
+    if cached is not None:
+        return cached
+    
+    try:
+        image_url = await resolve()
+    except LastFMNotFoundError as e:
+        image_cache.set(key, {'not_found': str(e)}, ttl=IMAGE_MISS_TTL)
+        raise
+    return _remember_image(key, image_url)
+
+def _image_info_params(kind, artist_name, name=None):
+    """Parameters of the artist/track/album.getInfo call carrying an item's artwork"""
+    params = {'method': f"{kind}.getInfo", 'artist': artist_name, 'api_key': API_KEY}
+    if kind != 'artist':
+        params[kind] = name
+    return params
+
+def _info_image(kind, response):
+    """Largest image in an artist/track/album.getInfo response (a track's is its album's)"""
+    info = response.get(kind, {})
+    if kind == 'track':
+        info = info.get('album', {})
+    return _largest_image(info.get('image', []))
+
+def resolve_artist_image(artist_name):
+    """Look up the largest image for an artist ('' if there is none)"""
+    def resolve():
+        return _info_image('artist', make_lastfm_request(_image_info_params('artist', artist_name)))
+    return _memoized_image('artist', (artist_name,), resolve)
+
+def resolve_track_image(track_name, artist_name):
+    """Look up a track's album art, falling back to the artist image"""
+    def resolve():
+        response = make_lastfm_request(_image_info_params('track', artist_name, track_name))
+        return _info_image('track', response) or resolve_artist_image(artist_name)
+    return _memoized_image('track', (artist_name, track_name), resolve)
+
+def resolve_album_image(album_name, artist_name):
+    """Look up an album's cover, falling back to the artist image"""
+    def resolve():
+        response = make_lastfm_request(_image_info_params('album', artist_name, album_name))
+        return _info_image('album', response) or resolve_artist_image(artist_name)
+    return _memoized_image('album', (artist_name, album_name), resolve)
+
+async def resolve_artist_image_async(client, artist_name):
+    """resolve_artist_image over an AsyncLastFMClient"""
+    async def resolve():
+        response = await make_lastfm_request_async(client, _image_info_params('artist', artist_name))
+        return _info_image('artist', response)
+    return await _memoized_image_async('artist', (artist_name,), resolve)
+
+async def resolve_track_image_async(client, track_name, artist_name):
+    """resolve_track_image over an AsyncLastFMClient"""
+    async def resolve():
+        response = await make_lastfm_request_async(client, _image_info_params('track', artist_name, track_name))
+        return _info_image('track', response) or await resolve_artist_image_async(client, artist_name)
+    return await _memoized_image_async('track', (artist_name, track_name), resolve)
+
+async def resolve_album_image_async(client, album_name, artist_name):
+    """resolve_album_image over an AsyncLastFMClient"""
+    async def resolve():
+        response = await make_lastfm_request_async(client, _image_info_params('album', artist_name, album_name))
+        return _info_image('album', response) or await resolve_artist_image_async(client, artist_name)
+    return await _memoized_image_async('album', (artist_name, album_name), resolve)
+
+IMAGE_RESOLVERS = {'artist': resolve_artist_image, 'track': resolve_track_image, 'album': resolve_album_image}
+ASYNC_IMAGE_RESOLVERS = {
+    'artist': resolve_artist_image_async,
+    'track': resolve_track_image_async,
+    'album': resolve_album_image_async
+}
+
+def _image_lookup(item):
+    """Turn a batch item into (dedup key, resolver args) or None if invalid; dedup key[0] is the type"""
+    kind = item.get('type')
+    artist_name = (item.get('artist') or '').strip()
+    name = (item.get(kind) or '').strip() if kind in ('track', 'album') else ''
+    if not artist_name or (kind in ('track', 'album') and not name):
+        return None
+    if kind == 'artist':
+        return ('artist', artist_name.lower()), (artist_name,)
+    if kind in ('track', 'album'):
+        return (kind, artist_name.lower(), name.lower()), (name, artist_name)
+    return None
+
+def _image_item_key(item):
+    """Key a batch item is reported under: its own 'key' or type:artist[:name]"""
+    kind = item.get('type')
+    parts = [kind, item.get('artist')]
+    if kind in ('track', 'album'):
+        parts.append(item.get(kind))
+    return str(item.get('key') or ':'.join(str(p) for p in parts if p))
+
+def _resolve_image_quietly(resolver, *args):
+    """Run an image resolver, treating Last.fm failures as 'no image'"""
+    try:
+        return resolver(*args)
+    except LastFMError as e:
+        logger.info(f"Image lookup failed for {args}: {e}")
+        return ''
+
+async def _resolve_image_quietly_async(resolver, client, *args):
+    """_resolve_image_quietly for an async resolver"""
+    try:
+        return await resolver(client, *args)
+    except LastFMError as e:
+        logger.info(f"Image lookup failed for {args}: {e}")
+        return ''
+
+def _plan_image_lookups(items):
+    """
+    Group batch items by lookup: (images, keys by dedup key, resolver args by dedup key).
+    
+    ``images`` already holds '' for invalid items.
+    """
+    keys_by_lookup = {}
+    lookups = {}
+    images = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        lookup = _image_lookup(item)
+        key = _image_item_key(item)
+        if lookup is None:
+            images[key] = ''
+            continue
+        dedup_key, args = lookup
+        keys_by_lookup.setdefault(dedup_key, []).append(key)
+        lookups.setdefault(dedup_key, args)
+    return images, keys_by_lookup, lookups
+
+def resolve_images(items):
+    """
+    Resolve images for many artists/tracks/albums concurrently.
+
+    Identical lookups (case-insensitive) are resolved once. Returns a map of
+    each item's ``key`` (default ``type:artist[:name]``) to an image URL,
+    with '' for items that have no image or could not be looked up.
+    """
+    images, keys_by_lookup, lookups = _plan_image_lookups(items)
+    futures = {dedup_key: image_executor.submit(_resolve_image_quietly, IMAGE_RESOLVERS[dedup_key[0]], *args)
+               for dedup_key, args in lookups.items()}
+    for dedup_key, future in futures.items():
+        image_url = future.result()
+        for key in keys_by_lookup[dedup_key]:
+            images[key] = image_url
+    return images
+
+async def resolve_images_async(client, items):
+    """resolve_images with the lookups awaited concurrently on one event loop"""
+    images, keys_by_lookup, lookups = _plan_image_lookups(items)
+    image_urls = await asyncio.gather(*(
+        _resolve_image_quietly_async(ASYNC_IMAGE_RESOLVERS[dedup_key[0]], client, *args)
+        for dedup_key, args in lookups.items()
+    ))
+    for dedup_key, image_url in zip(lookups, image_urls):
+        for key in keys_by_lookup[dedup_key]:
+            images[key] = image_url
+    return images
+
+def _wants_images():
+    """Check whether the request asked for server-side image enrichment"""
+    return request.args.get('with_images', '').lower() in ('1', 'true', 'yes')
+
+def add_chart_images(items, kind):
+    """
+    Set 'image_url' on each top-chart entry, resolving missing artwork.
+    
+    Entries that already carry an image keep it; the rest are resolved in
+    one resolve_images() batch, so lookups share the worker pool, dedup and
+    image cache.
+    """
+    lookups = _chart_image_lookups(items, kind)
+    if lookups:
+        _apply_chart_images(items, lookups, resolve_images(lookups))
+    return items
+
+async def add_chart_images_async(client, items, kind):
+    """add_chart_images resolving through resolve_images_async"""
+    lookups = _chart_image_lookups(items, kind)
+    if lookups:
+        _apply_chart_images(items, lookups, await resolve_images_async(client, lookups))
+    return items
+
+def _chart_image_lookups(items, kind):
+    """Set embedded images as 'image_url' and return batch items for the entries without one"""
+    lookups = []
+    for index, item in enumerate(items):
+        item['image_url'] = _largest_image(item.get('image'))
+        if item['image_url']:
+            continue
+        if kind == 'artist':
+            lookup = {'type': 'artist', 'artist': item.get('name')}
+        else:
+            artist = item.get('artist')
+            artist_name = artist.get('name') if isinstance(artist, dict) else artist
+            lookup = {'type': kind, 'artist': artist_name, kind: item.get('name')}
+        lookup['key'] = str(index)
+        lookups.append(lookup)
+    return lookups
+
+def _apply_chart_images(items, lookups, images):
+    for lookup in lookups:
+        items[int(lookup['key'])]['image_url'] = images.get(lookup['key'], '')
+
+@app.route('/artwork')
+@require_auth
+def artwork():
+    """Serve a cached, resized copy of Last.fm artwork"""
+    image_url = request.args.get('url', '')
+    size = request.args.get('size', type=int)
+    
+    try:
+        path, digest, content_type = artwork_store.get(image_url, size)
+    except ArtworkError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except OSError as e:
+        logger.error(f"Artwork cache error: {e}")
+        return jsonify({'success': False, 'error': 'Failed to load artwork'}), 500
+    
+    # Stored objects are named by their content digest and source artwork
+    # URLs are themselves content-addressed, so responses never change
+    response = send_file(path, mimetype=content_type, etag=digest, max_age=ARTWORK_MAX_AGE, conditional=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/fetch-images', methods=['POST'])
+@require_auth
+async def fetch_images():
+    """Resolve images for a batch of artists, tracks and albums"""
+    try:
+        data = request.get_json(silent=True) or {}
+        items = data.get('items')
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'success': False, 'error': 'List of items required'}), 400
+        if len(items) > MAX_IMAGE_BATCH:
+            return jsonify({'success': False, 'error': f"At most {MAX_IMAGE_BATCH} items per request"}), 400
+        
+        async with create_async_client() as client:
+            images = await resolve_images_async(client, items)
+        return jsonify({'success': True, 'images': images})
+        
+    except Exception as e:
+        logger.error(f"Unexpected error fetching images: {e}")
+        return jsonify({'success': False, 'error': 'Failed to fetch images'}), 500
+
 @app.route('/fetch-artist-image', methods=['POST'])
 @require_auth
 def fetch_artist_image():
@@ -972,25 +2096,8 @@ def fetch_artist_image():
         
         if not artist_name:
             return jsonify({'success': False, 'error': 'Artist name required'}), 400
-            
-        params = {
-            'method': 'artist.getInfo',
-            'artist': artist_name,
-            'api_key': API_KEY
-        }
         
-        response = make_lastfm_request(params)
-        artist_info = response.get('artist', {})
-        images = artist_info.get('image', [])
-        
-        # Get the largest image available
-        image_url = ''
-        for img in reversed(images):  # Start from largest
-            if img.get('#text'):
-                image_url = img['#text']
-                break
-                
-        return jsonify({'success': True, 'image': image_url})
+        return jsonify({'success': True, 'image': resolve_artist_image(artist_name)})
         
     except LastFMError as e:
         logger.error(f"Error fetching artist image: {e}")
@@ -1001,7 +2108,7 @@ def fetch_artist_image():
 
 @app.route('/fetch-track-image', methods=['POST'])
 @require_auth
-def fetch_track_image():
+async def fetch_track_image():
     """Fetch track/album image from Last.fm API"""
     try:
         data = request.get_json()
@@ -1010,32 +2117,9 @@ def fetch_track_image():
         
         if not track_name or not artist_name:
             return jsonify({'success': False, 'error': 'Track and artist names required'}), 400
-            
-        params = {
-            'method': 'track.getInfo',
-            'track': track_name,
-            'artist': artist_name,
-            'api_key': API_KEY
-        }
         
-        response = make_lastfm_request(params)
-        track_info = response.get('track', {})
-        
-        # Try to get album image first
-        album_info = track_info.get('album', {})
-        images = album_info.get('image', [])
-        
-        # If no album image, try artist image as fallback
-        if not images or not any(img.get('#text') for img in images):
-            return fetch_artist_image()  # Call the artist image function
-            
-        # Get the largest image available
-        image_url = ''
-        for img in reversed(images):  # Start from largest
-            if img.get('#text'):
-                image_url = img['#text']
-                break
-                
+        async with create_async_client() as client:
+            image_url = await resolve_track_image_async(client, track_name, artist_name)
         return jsonify({'success': True, 'image': image_url})
         
     except LastFMError as e:
@@ -1047,7 +2131,7 @@ def fetch_track_image():
 
 @app.route('/fetch-album-image', methods=['POST'])
 @require_auth
-def fetch_album_image():
+async def fetch_album_image():
     """Fetch album image from Last.fm API"""
     try:
         data = request.get_json()
@@ -1056,29 +2140,9 @@ def fetch_album_image():
         
         if not album_name or not artist_name:
             return jsonify({'success': False, 'error': 'Album and artist names required'}), 400
-            
-        params = {
-            'method': 'album.getInfo',
-            'album': album_name,
-            'artist': artist_name,
-            'api_key': API_KEY
-        }
         
-        response = make_lastfm_request(params)
-        album_info = response.get('album', {})
-        images = album_info.get('image', [])
-        
-        # If no album image, try artist image as fallback
-        if not images or not any(img.get('#text') for img in images):
-            return fetch_artist_image()  # Call the artist image function
-            
-        # Get the largest image available
-        image_url = ''
-        for img in reversed(images):  # Start from largest
-            if img.get('#text'):
-                image_url = img['#text']
-                break
-                
+        async with create_async_client() as client:
+            image_url = await resolve_album_image_async(client, album_name, artist_name)
         return jsonify({'success': True, 'image': image_url})
         
     except LastFMError as e:
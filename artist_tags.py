@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple, Callable, Iterable
+from sqlite_db import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 30 * 86400
+DEFAULT_MISS_TTL = 7 * 86400  # unknown artists are asked about again after this
+DEFAULT_WORKERS = 4
+DEFAULT_WAIT_FOR = 20  # new artists resolved before a request returns
+BACKGROUND_BATCH = 50  # artists fetched and committed together in the background
+DEFAULT_MAX_TAGS = 5
+DEFAULT_DATA_DIR = 'data'
+DEFAULT_FILENAME = 'artist_tags.sqlite3'
+LOOKUP_CHUNK = 500  # keys per IN (...) query, under SQLite's variable limit
+
+# Popular tags that say nothing about the music
+IGNORED_TAGS = frozenset({'seen live', 'favorites', 'favourite', 'favorite', 'albums i own', 'under 2000 listeners'})
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artist_tags (
+    key TEXT PRIMARY KEY,
+    artist TEXT NOT NULL,
+    tags TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+def _key(artist: str) -> str:
+    # Last.fm artist names are case-insensitive
+    return artist.strip().lower()
+
+def parse_top_tags(data: Dict[str, Any], max_tags: int = DEFAULT_MAX_TAGS) -> List[Tuple[str, int]]:
+    """
+    Extract (tag, weight) pairs from an artist.getTopTags response.
+
+    Tag names are lowercased, non-genre tags dropped and weights (0-100)
+    kept for the strongest ``max_tags``.
+    """
+    tags = data.get('toptags', {}).get('tag', [])
+    if isinstance(tags, dict):
+        tags = [tags]
+    parsed = []
+    for tag in tags:
+        name = str(tag.get('name', '')).strip().lower()
+        weight = int(tag.get('count') or 0)
+        if name and weight > 0 and name not in IGNORED_TAGS:
+            parsed.append((name, weight))
+    return sorted(parsed, key=lambda item: -item[1])[:max_tags]
+
+class ArtistTagIndex:
+    """
+    Persistent artist -> top tags index shared by every user.
+
+    Tags are looked up with artist.getTopTags once per artist and kept in
+    SQLite (WAL, one file per node, see SQLiteDatabase) for ``ttl``
+    seconds, so genre statistics cost no upstream calls for artists anyone
+    has listened to before. Artists not yet indexed are resolved in
+    batches: the most played ``wait_for`` before the caller continues, the
+    rest in the background. Each kind has its own worker pool, so a
+    request never queues behind background batches. ``fetch(artist,
+    background)`` returns the decoded response, None for an artist Last.fm
+    does not know (stored as untagged for ``miss_ttl``), or raises on other
+    failures, which are retried on a later request.
+    """
+
+    def __init__(self, path: str, fetch: Callable[[str, bool], Optional[Dict[str, Any]]],
+                 ttl: float = DEFAULT_TTL, miss_ttl: float = DEFAULT_MISS_TTL,
+                 workers: int = DEFAULT_WORKERS, wait_for: int = DEFAULT_WAIT_FOR,
+                 max_tags: int = DEFAULT_MAX_TAGS):
+        self.path = path
+        self.fetch = fetch
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.wait_for = wait_for
+        self.max_tags = max_tags
+        self._db = SQLiteDatabase(path, _SCHEMA)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='artist-tags')
+        self._background_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='artist-tags-bg')
+        self._lock = threading.Lock()
+        self._pending = set()  # keys being resolved in the background
+        self._stats = {'fetched': 0, 'unknown': 0, 'errors': 0, 'background': 0}
+
+    @classmethod
+    def from_env(cls, fetch: Callable[[str, bool], Optional[Dict[str, Any]]]) -> 'ArtistTagIndex':
+        """Create an index configured from environment variables"""
+        data_dir = os.environ.get('DATA_DIR', DEFAULT_DATA_DIR)
+        return cls(
+            path=os.environ.get('ARTIST_TAGS_PATH') or os.path.join(data_dir, DEFAULT_FILENAME),
+            fetch=fetch,
+            ttl=float(os.environ.get('ARTIST_TAGS_TTL_DAYS', DEFAULT_TTL / 86400)) * 86400,
+            workers=int(os.environ.get('ARTIST_TAGS_WORKERS', DEFAULT_WORKERS))
+        )
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += n
+
+    def lookup(self, artists: Iterable[str]) -> Dict[str, List[Tuple[str, int]]]:
+        """
+        Read indexed tags without contacting Last.fm.
+
+        Args:
+            artists: Artist names, in any case
+
+        Returns:
+            Dict[str, List[Tuple[str, int]]]: (tag, weight) pairs keyed by
+                lowercased artist name, for unexpired entries only
+        """
+        keys = list({_key(artist) for artist in artists})
+        found, now = {}, time.time()
+        try:
+            for start in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[start:start + LOOKUP_CHUNK]
+                rows = self._db.execute(
+                    f"SELECT key, tags FROM artist_tags WHERE expires_at > ? AND key IN ({','.join('?' * len(chunk))})",
+                    [now] + chunk
+                )
+                for key, tags in rows:
+                    found[key] = [tuple(tag) for tag in json.loads(tags)]
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Artist tag lookup failed: {e}")
+            self._count('errors')
+        return found
+
+    def _fetch_one(self, artist: str, background: bool) -> Optional[Tuple[str, str, Optional[List[Tuple[str, int]]]]]:
+        """Resolve one artist; None if the lookup failed and should be retried later"""
+        try:
+            data = self.fetch(artist, background)
+        except Exception as e:
+            logger.info(f"Tag lookup failed for {artist}: {e}")
+            self._count('errors')
+            return None
+        if data is None:
+            self._count('unknown')
+            return _key(artist), artist, None
+        self._count('fetched')
+        return _key(artist), artist, parse_top_tags(data, self.max_tags)
+
+    def _store(self, results: List[Tuple[str, str, Optional[List[Tuple[str, int]]]]]) -> None:
+        now = time.time()
+        rows = [(key, artist, json.dumps(tags or []), now, now + (self.ttl if tags is not None else self.miss_ttl))
+                for key, artist, tags in results]
+        if not rows:
+            return
+        try:
+            with self._db.transaction() as conn:
+                conn.executemany('INSERT OR REPLACE INTO artist_tags (key, artist, tags, fetched_at, expires_at) '
+                                 'VALUES (?, ?, ?, ?, ?)', rows)
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Artist tag write failed: {e}")
+            self._count('errors')
+
+    def _resolve(self, artists: List[str], background: bool = False) -> None:
+        """Fetch a batch concurrently and store it in one transaction"""
+        executor = self._background_executor if background else self._executor
+        results = [result for result in executor.map(lambda artist: self._fetch_one(artist, background), artists)
+                   if result is not None]
+        self._store(results)
+
+    def _resolve_background(self, artists: List[str]) -> None:
+        try:
+            for start in range(0, len(artists), BACKGROUND_BATCH):
+                self._resolve(artists[start:start + BACKGROUND_BATCH], background=True)
+        finally:
+            with self._lock:
+                self._pending.difference_update(_key(artist) for artist in artists)
+
+    def ensure(self, artists: List[str]) -> Dict[str, List[Tuple[str, int]]]:
+        """
+        Return tags for the given artists, resolving ones not yet indexed.
+
+        Args:
+            artists: Artist names, most important (e.g. most played) first
+
+        Returns:
+            Dict[str, List[Tuple[str, int]]]: Tags keyed by lowercased
+                artist name; artists still being resolved are absent
+        """
+        found = self.lookup(artists)
+        missing, seen = [], set(found)
+        for artist in artists:
+            key = _key(artist)
+            if key not in seen:
+                seen.add(key)
+                missing.append(artist)
+        if not missing:
+            return found
+
+        now_batch, later = missing[:self.wait_for], missing[self.wait_for:]
+        self._resolve(now_batch)
+        found.update(self.lookup(now_batch))
+
+        with self._lock:
+            later = [artist for artist in later if _key(artist) not in self._pending]
+            self._pending.update(_key(artist) for artist in later)
+        if later:
+            self._count('background', len(later))
+            threading.Thread(target=self._resolve_background, args=(later,), daemon=True).start()
+        return found
+
+    def genres(self, plays_by_artist: Dict[str, int], limit: int = 10) -> List[Tuple[str, int]]:
+        """
+        Compute a listener's genre distribution from the index.
+
+        Each artist's plays are split across its tags in proportion to the
+        tag weights.
+
+        Args:
+            plays_by_artist: Play counts keyed by artist name
+            limit: Maximum number of genres
+
+        Returns:
+            List[Tuple[str, int]]: (genre, plays) pairs, largest first
+        """
+        ranked = sorted(plays_by_artist, key=lambda artist: -plays_by_artist[artist])
+        tags_by_artist = self.ensure(ranked)
+        scores = Counter()
+        for artist in ranked:
+            tags = tags_by_artist.get(_key(artist))
+            if not tags:
+                continue
+            total = sum(weight for _, weight in tags)
+            for tag, weight in tags:
+                scores[tag] += plays_by_artist[artist] * weight / total
+        return [(tag, round(score)) for tag, score in scores.most_common(limit) if round(score) > 0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return lookup counters plus the number of indexed artists"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        stats['path'] = self.path
+        stats['artists'] = 0
+        if self._db.exists():
+            try:
+                stats['artists'] = self._db.execute('SELECT COUNT(*) FROM artist_tags').fetchone()[0]
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"Artist tag stats unavailable: {e}")
+        return stats
@@ -0,0 +1,254 @@
+import io
+import os
+import re
+import hashlib
+import logging
+import tempfile
+import threading
+from urllib.parse import urlparse
+from typing import Optional, Dict, Any, Tuple, Iterable
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - falls back to CDN size variants
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Thumbnail edge lengths in pixels; these match the Last.fm CDN size variants
+THUMBNAIL_SIZES = (34, 64, 174, 300)
+
+DEFAULT_ALLOWED_HOSTS = ('lastfm.freetls.fastly.net', 'lastfm-img2.akamaized.net', 'lastfm.akamaized.net')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_IMAGE_BYTES = 5 * 1024 * 1024
+
+CONTENT_TYPES = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
+_EXTENSION_TYPES = {ext: content_type for content_type, ext in CONTENT_TYPES.items()}
+_PIL_FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'gif': 'GIF', 'webp': 'WEBP'}
+
+# Size segment of Last.fm CDN paths, e.g. /i/u/300x300/<hash>.png or /i/u/64s/<hash>.png
+_CDN_SIZE_SEGMENT = re.compile(r'^(/i/u/)[^/]+(/[^/]+)$')
+
+class ArtworkError(Exception):
+    """Raised when artwork cannot be proxied (bad URL, disallowed host, bad upstream)"""
+    pass
+
+def snap_size(size: Optional[int]) -> int:
+    """Round a requested edge length up to the nearest supported thumbnail size"""
+    if not size:
+        return THUMBNAIL_SIZES[-1]
+    for candidate in THUMBNAIL_SIZES:
+        if size <= candidate:
+            return candidate
+    return THUMBNAIL_SIZES[-1]
+
+class ArtworkStore:
+    """
+    Content-addressed disk cache of artwork thumbnails.
+
+    Each (source URL, size) pair is fetched once. The image bytes are
+    stored under their SHA-256 digest, which also serves as a strong ETag,
+    and a small index file maps the lookup to that digest. Thumbnails are
+    resized locally with Pillow (see requirements.txt) from the largest
+    source image; should Pillow be missing, Last.fm CDN URLs are rewritten
+    to the CDN's own size variant instead. Disk use is capped by evicting the least recently served
+    objects. Only http(s) URLs on allowed hosts are fetched.
+    """
+
+    def __init__(self, root: str, fetch, max_bytes: int = DEFAULT_MAX_BYTES,
+                 allowed_hosts: Iterable[str] = DEFAULT_ALLOWED_HOSTS,
+                 max_image_bytes: int = DEFAULT_MAX_IMAGE_BYTES):
+        self.root = root
+        self._fetch = fetch
+        self.max_bytes = max_bytes
+        self.allowed_hosts = frozenset(h.strip().lower() for h in allowed_hosts if h.strip())
+        self.max_image_bytes = max_image_bytes
+        self._lock = threading.Lock()
+        self._bytes = None  # measured lazily on first write
+        self._stats = {'hits': 0, 'misses': 0, 'fetches': 0, 'evictions': 0, 'rejected': 0}
+
+    @classmethod
+    def from_env(cls, fetch) -> 'ArtworkStore':
+        """Create a store configured from environment variables"""
+        data_dir = os.environ.get('DATA_DIR', 'data')
+        hosts = os.environ.get('ARTWORK_ALLOWED_HOSTS')
+        return cls(
+            root=os.environ.get('ARTWORK_CACHE_DIR') or os.path.join(data_dir, 'artwork'),
+            fetch=fetch,
+            max_bytes=int(os.environ.get('ARTWORK_CACHE_MAX_MB', DEFAULT_MAX_BYTES // (1024 * 1024))) * 1024 * 1024,
+            allowed_hosts=hosts.split(',') if hosts else DEFAULT_ALLOWED_HOSTS
+        )
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def check_url(self, url: str) -> None:
+        """Reject anything that is not an http(s) URL on an allowed host"""
+        parsed = urlparse(url or '')
+        if parsed.scheme not in ('http', 'https') or (parsed.hostname or '').lower() not in self.allowed_hosts:
+            self._count('rejected')
+            raise ArtworkError('Image host not allowed')
+
+    def _object_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.root, 'objects', digest[:2], f"{digest}.{ext}")
+
+    def _index_path(self, url: str, size: int) -> str:
+        key = hashlib.sha256(f"{size}\n{url}".encode('utf-8')).hexdigest()
+        return os.path.join(self.root, 'index', key[:2], key)
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes) -> None:
+        """Write via a temp file and rename so readers never see partial files"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _lookup(self, url: str, size: int) -> Optional[Tuple[str, str, str]]:
+        """Return (path, digest, ext) for an already stored thumbnail"""
+        try:
+            with open(self._index_path(url, size), 'r') as f:
+                digest, ext = f.read().split()
+        except (OSError, ValueError):
+            return None
+        path = self._object_path(digest, ext)
+        if not os.path.exists(path):
+            return None
+        try:
+            os.utime(path)  # mark as recently used for LRU eviction
+        except OSError:
+            pass
+        return path, digest, ext
+
+    @staticmethod
+    def cdn_variant(url: str, size: int) -> Optional[str]:
+        """Rewrite a Last.fm CDN image URL to the given size variant"""
+        parsed = urlparse(url)
+        match = _CDN_SIZE_SEGMENT.match(parsed.path)
+        if not match:
+            return None
+        segment = '300x300' if size >= 300 else f"{size}s"
+        return parsed._replace(path=f"{match.group(1)}{segment}{match.group(2)}").geturl()
+
+    def _download(self, url: str) -> Tuple[bytes, str]:
+        """Fetch an image and return (bytes, extension)"""
+        self._count('fetches')
+        try:
+            response = self._fetch(url)
+        except Exception as e:
+            raise ArtworkError(f"Failed to fetch image: {e}")
+        content_type = (response.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+        if response.status_code != 200 or content_type not in CONTENT_TYPES:
+            raise ArtworkError('Upstream did not return an image')
+        if len(response.content) > self.max_image_bytes:
+            raise ArtworkError('Image too large')
+        return response.content, CONTENT_TYPES[content_type]
+
+    @staticmethod
+    def _resize(data: bytes, ext: str, size: int) -> bytes:
+        """Downscale an image so its longest edge is at most size pixels"""
+        with Image.open(io.BytesIO(data)) as image:
+            if max(image.size) <= size:
+                return data
+            image.thumbnail((size, size))
+            out = io.BytesIO()
+            image.save(out, format=_PIL_FORMATS[ext])
+            return out.getvalue()
+
+    def get(self, url: str, size: Optional[int] = None) -> Tuple[str, str, str]:
+        """
+        Get a stored thumbnail, fetching and storing it on first use.
+
+        Args:
+            url: Source image URL (must be on an allowed host)
+            size: Requested edge length; rounded up to a supported size
+
+        Returns:
+            Tuple[str, str, str]: File path, content digest (ETag) and content type
+
+        Raises:
+            ArtworkError: If the URL is not allowed or upstream has no usable image
+        """
+        self.check_url(url)
+        size = snap_size(size)
+
+        stored = self._lookup(url, size)
+        if stored is not None:
+            self._count('hits')
+            path, digest, ext = stored
+            return path, digest, _EXTENSION_TYPES[ext]
+
+        self._count('misses')
+        if Image is not None:
+            data, ext = self._download(self.cdn_variant(url, 300) or url)
+            try:
+                data = self._resize(data, ext, size)
+            except Exception as e:
+                logger.warning(f"Could not resize {url}: {e}")
+        else:
+            data, ext = self._download(self.cdn_variant(url, size) or url)
+
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest, ext)
+        if not os.path.exists(path):
+            self._write_atomic(path, data)
+            self._account(len(data))
+        self._write_atomic(self._index_path(url, size), f"{digest} {ext}".encode('ascii'))
+        return path, digest, _EXTENSION_TYPES[ext]
+
+    def _objects(self):
+        """Yield (mtime, size, path) for every stored object"""
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, 'objects')):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def _account(self, added: int) -> None:
+        """Track disk use and evict least recently used objects over the cap"""
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(size for _, size, _ in self._objects())
+            else:
+                self._bytes += added
+            if self._bytes <= self.max_bytes:
+                return
+
+            # Re-measure (other workers share the directory), then trim to 90%
+            objects = sorted(self._objects())
+            total = sum(size for _, size, _ in objects)
+            target = self.max_bytes * 0.9
+            for _, size, path in objects:
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+                self._stats['evictions'] += 1
+            self._bytes = total
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters and disk use"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['bytes'] = self._bytes
+        stats['max_bytes'] = self.max_bytes
+        stats['resize'] = 'pillow' if Image is not None else 'cdn'
+        return stats
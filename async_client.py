@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from typing import Optional, Dict, Any, Callable
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - optional at import time
+    aiohttp = None
+
+from http_client import DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT, DEFAULT_POOL_MAXSIZE
+from upstream_governor import UpstreamGovernor, GovernorTimeout, priority_for, RATE_LIMIT_ERROR_CODE
+from circuit_breaker import CircuitBreakerRegistry
+
+logger = logging.getLogger(__name__)
+
+class AsyncLastFMClient:
+    """
+    asyncio counterpart of ``_send_lastfm_request``.
+
+    Signs requests with the same signer, waits on the same outbound
+    governor, checks and feeds the same per-method circuit breakers and
+    turns failures into exceptions through the same
+    ``error_for(message, code=None, status=None)`` mapping as the
+    synchronous path, so async routes see the same errors as their sync
+    versions. A failure counts against its breaker when ``is_outage`` is
+    true for the mapped error. Caching and coalescing are layered on top by the caller
+    (``make_lastfm_request_async``). Use as an async context manager; the
+    underlying aiohttp session is bound to the running event loop.
+    """
+
+    def __init__(self, base_url: str, error_for: Callable[..., Exception],
+                 signer: Optional[Callable[[Dict[str, Any]], str]] = None,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 limit: int = DEFAULT_POOL_MAXSIZE,
+                 governor: Optional[UpstreamGovernor] = None,
+                 breakers: Optional[CircuitBreakerRegistry] = None,
+                 is_outage: Callable[[Exception], bool] = lambda error: True):
+        self.base_url = base_url
+        self.error_for = error_for
+        self.signer = signer
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.limit = limit
+        self.governor = governor
+        self.breakers = breakers
+        self.is_outage = is_outage
+        self._session = None
+
+    async def __aenter__(self) -> 'AsyncLastFMClient':
+        if aiohttp is None:
+            raise RuntimeError("Async Last.fm client requires aiohttp")
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.limit),
+            timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout,
+                                          sock_read=self.read_timeout)
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def request(self, params: Dict[str, Any], method: str = 'GET',
+                      sign: bool = False) -> Dict[str, Any]:
+        """
+        Make a request to the Last.fm API.
+
+        Args:
+            params: Request parameters (modified in place like the sync path)
+            method: 'GET' or 'POST'
+            sign: Add an api_sig computed by the configured signer
+
+        Returns:
+            Dict[str, Any]: Decoded JSON response
+        """
+        if sign:
+            params['api_sig'] = self.signer(params)
+        params['format'] = 'json'
+        return await self._send(params, method)
+
+    async def _send(self, params: Dict[str, Any], method: str) -> Dict[str, Any]:
+        """Send a request, keeping the method's circuit breaker informed"""
+        if self._session is None:
+            raise RuntimeError("Async Last.fm client is not open")
+
+        breaker = self.breakers.get(params.get('method')) if self.breakers is not None else None
+        if breaker is not None and not breaker.allow_request():
+            raise self.error_for("Last.fm is temporarily unavailable. Please try again shortly.")
+
+        try:
+            data = await self._fetch(params, method)
+        except GovernorTimeout as e:
+            if breaker is not None:
+                breaker.release()
+            logger.warning(f"Outbound request budget exhausted: {e}")
+            raise self.error_for("Last.fm is busy right now. Please try again shortly.",
+                                 code=RATE_LIMIT_ERROR_CODE)
+        except Exception as e:
+            if breaker is not None:
+                if self.is_outage(e):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            raise
+        except BaseException:
+            # Cancelled before Last.fm answered: free a half-open probe slot
+            if breaker is not None:
+                breaker.release()
+            raise
+        if breaker is not None:
+            breaker.record_success()
+        return data
+
+    async def _fetch(self, params: Dict[str, Any], method: str) -> Dict[str, Any]:
+        """Wait for the governor, send, and map failures through error_for"""
+        if self.governor is not None:
+            await self.governor.acquire_async(priority_for(params.get('method')))
+
+        # aiohttp only accepts str/int/float query values
+        fields = {k: str(v) for k, v in params.items()}
+        try:
+            if method == 'POST':
+                response = await self._session.post(self.base_url, data=fields)
+            else:
+                response = await self._session.get(self.base_url, params=fields)
+
+            async with response:
+                if response.status == 429 and self.governor is not None:
+                    self.governor.penalize()
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+        except aiohttp.ClientResponseError as e:
+            logger.error(f"Request error: {e}")
+            raise self.error_for("Failed to connect to Last.fm", status=e.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Request error: {e}")
+            raise self.error_for("Failed to connect to Last.fm")
+        except ValueError as e:
+            logger.error(f"JSON decode error: {e}")
+            raise self.error_for("Invalid response from Last.fm")
+
+        if not isinstance(data, dict):
+            logger.error("JSON decode error: response is not an object")
+            raise self.error_for("Invalid response from Last.fm")
+
+        if 'error' in data:
+            if data['error'] == RATE_LIMIT_ERROR_CODE and self.governor is not None:
+                self.governor.penalize()
+            error_msg = data.get('message', f"Last.fm API error: {data['error']}")
+            logger.error(f"Last.fm API error: {error_msg}")
+            raise self.error_for(error_msg, code=data['error'])
+
+        return data
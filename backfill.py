@@ -0,0 +1,310 @@
+import os
+import time
+import socket
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable
+from sqlite_db import SQLiteDatabase
+from history_store import HistoryStore, parse_recent_tracks
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_LEASE_SECONDS = 60.0
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_RETRY_DELAY = 2.0
+
+PENDING = 'pending'
+RUNNING = 'running'
+COMPLETE = 'complete'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backfill_jobs (
+    user TEXT PRIMARY KEY,
+    to_uts INTEGER NOT NULL,
+    total_pages INTEGER NOT NULL,
+    page_size INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    lease_owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS backfill_pages (
+    user TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    scrobbles INTEGER NOT NULL,
+    done_at REAL NOT NULL,
+    PRIMARY KEY (user, page)
+) WITHOUT ROWID;
+"""
+
+class Backfill:
+    """
+    Resumable full-history import into a HistoryStore.
+
+    A job pins ``to`` to the oldest scrobble the store already covers (or
+    the start time), so page N of user.getRecentTracks keeps meaning the
+    same scrobbles however long the job runs. Pages are fetched on a small
+    thread pool, each written to the store as it arrives and checkpointed,
+    so a restarted job only fetches the pages that are missing. Job rows
+    carry a lease so only one worker process runs a user's job at a time;
+    a job whose lease lapsed (crash, deploy) can be picked up again. A
+    completed job is replaced by a new one once a sync too far behind has
+    restarted the local range above its pinned ``to`` (see outdated).
+    """
+
+    def __init__(self, history_store: HistoryStore,
+                 fetch: Callable[[str, Dict[str, Any]], Dict[str, Any]],
+                 workers: int = DEFAULT_WORKERS,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 retry_delay: float = DEFAULT_RETRY_DELAY,
+                 owner: Optional[str] = None):
+        self.history_store = history_store
+        self._fetch = fetch
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._db = SQLiteDatabase(history_store.path, _SCHEMA)
+        self._lock = threading.Lock()
+        self._running = set()
+        self._owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+
+    @classmethod
+    def from_env(cls, history_store: HistoryStore,
+                 fetch: Callable[[str, Dict[str, Any]], Dict[str, Any]]) -> 'Backfill':
+        """Create a backfill runner configured from environment variables"""
+        return cls(
+            history_store, fetch,
+            workers=int(os.environ.get('BACKFILL_WORKERS', DEFAULT_WORKERS)),
+            lease_seconds=float(os.environ.get('BACKFILL_LEASE_SECONDS', DEFAULT_LEASE_SECONDS))
+        )
+
+    @staticmethod
+    def _user(user: str) -> str:
+        return user.strip().lower()
+
+    def _job(self, user: str) -> Optional[Dict[str, Any]]:
+        row = self._db.execute(
+            'SELECT to_uts, total_pages, page_size, status, started_at, finished_at, lease_until, error '
+            'FROM backfill_jobs WHERE user = ?', (self._user(user),)
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ('to_uts', 'total_pages', 'page_size', 'status', 'started_at', 'finished_at', 'lease_until', 'error')
+        return dict(zip(keys, row))
+
+    def _done_pages(self, user: str) -> set:
+        rows = self._db.execute('SELECT page FROM backfill_pages WHERE user = ?', (self._user(user),))
+        return {page for (page,) in rows}
+
+    def _claim(self, user: str) -> bool:
+        """Take or renew the job lease; False if another live worker holds it"""
+        now = time.time()
+        cursor = self._db.execute(
+            'UPDATE backfill_jobs SET lease_owner = ?, lease_until = ?, status = ? '
+            'WHERE user = ? AND status != ? AND (lease_until < ? OR lease_owner = ?)',
+            (self._owner, now + self.lease_seconds, RUNNING, self._user(user), COMPLETE, now, self._owner)
+        )
+        return cursor.rowcount == 1
+
+    def _finish(self, user: str, status: str, error: Optional[str] = None) -> None:
+        self._db.execute(
+            'UPDATE backfill_jobs SET status = ?, finished_at = ?, lease_until = 0, error = ? '
+            'WHERE user = ? AND lease_owner = ?',
+            (status, time.time(), error, self._user(user), self._owner)
+        )
+
+    def _fetch_page(self, user: str, page: int, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Fetch one page, retrying transient failures with linear backoff"""
+        params = {'page': page, 'limit': job['page_size'], 'to': job['to_uts']}
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                return self._fetch(user, params)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.info(f"Backfill page {page} for {user} failed (attempt {attempt}): {e}")
+                time.sleep(self.retry_delay * attempt)
+
+    def _store_page(self, user: str, page: int, data: Dict[str, Any]) -> int:
+        """Write a page's scrobbles, then checkpoint it"""
+        scrobbles, _, _ = parse_recent_tracks(data)
+        self.history_store.add_tracks(user, scrobbles)
+        self._db.execute(
+            'INSERT OR REPLACE INTO backfill_pages (user, page, scrobbles, done_at) VALUES (?, ?, ?, ?)',
+            (self._user(user), page, len(scrobbles), time.time())
+        )
+        return len(scrobbles)
+
+    def _create_job(self, user: str) -> None:
+        """Pin 'to', learn the page count from page 1 and store it as the first checkpoint"""
+        state = self.history_store.get_state(user)
+        to_uts = (state or {}).get('oldest_uts') or int(time.time())
+        page_size = self.history_store.page_size
+        data = self._fetch(user, {'page': 1, 'limit': page_size, 'to': to_uts})
+        _, _, attr = parse_recent_tracks(data)
+        total_pages = int(attr.get('totalPages') or 0) if int(attr.get('total') or 0) else 0
+
+        self._db.execute(
+            'INSERT OR IGNORE INTO backfill_jobs (user, to_uts, total_pages, page_size, status, started_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (self._user(user), to_uts, total_pages, page_size, PENDING, time.time())
+        )
+        if total_pages:
+            self._store_page(user, 1, data)
+
+    def outdated(self, user: str) -> bool:
+        """
+        Check whether a completed job no longer joins up with the local range.
+
+        HistoryStore.sync restarts the contiguous range at the newest
+        scrobbles when the delta is too large, leaving a gap between it and
+        everything at or before the job's pinned ``to``. Only a new job,
+        pinned at the new start of the range, fills that gap.
+        """
+        job = self._job(user)
+        if job is None or job['status'] != COMPLETE:
+            return False
+        state = self.history_store.get_state(user)
+        if state is None or state['oldest_uts'] is None or state['oldest_uts'] <= job['to_uts']:
+            return False
+        return self.history_store.covered_count(user) < state['remote_total']
+
+    def run(self, user: str) -> Optional[Dict[str, Any]]:
+        """
+        Run (or resume) a user's backfill in the calling thread.
+
+        Args:
+            user: Last.fm user name
+
+        Returns:
+            Optional[Dict[str, Any]]: Final progress, or None if another worker holds the job
+        """
+        if self.outdated(user):
+            logger.info(f"Local history for {user} no longer reaches the last backfill; starting a new one")
+            self.reset(user)
+        if self._job(user) is None:
+            self._create_job(user)
+        if not self._claim(user):
+            return None
+
+        job = self._job(user)
+        pending = sorted(set(range(1, job['total_pages'] + 1)) - self._done_pages(user))
+        failures = []
+        lease_lost = threading.Event()
+        last_renewal = [time.monotonic()]
+
+        def work(page):
+            if lease_lost.is_set():
+                return
+            try:
+                self._store_page(user, page, self._fetch_page(user, page, job))
+            except Exception as e:
+                logger.warning(f"Backfill page {page} for {user} gave up: {e}")
+                failures.append((page, str(e)))
+                return
+            with self._lock:
+                if time.monotonic() - last_renewal[0] > self.lease_seconds / 3:
+                    last_renewal[0] = time.monotonic()
+                    if not self._claim(user):
+                        lease_lost.set()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='backfill') as pool:
+            list(pool.map(work, pending))
+
+        if lease_lost.is_set():
+            logger.warning(f"Backfill lease for {user} was taken over by another worker")
+        elif failures:
+            self._finish(user, FAILED, f"{len(failures)} pages failed, e.g. page {failures[0][0]}: {failures[0][1]}")
+        else:
+            self._finish(user, COMPLETE)
+            self.history_store.extend_coverage(user, job['to_uts'])
+        return self.progress(user)
+
+    def start(self, user: str) -> Optional[Dict[str, Any]]:
+        """Run or resume a user's backfill on a background thread"""
+        key = self._user(user)
+        with self._lock:
+            if key in self._running:
+                return self.progress(user)
+            self._running.add(key)
+
+        def target():
+            try:
+                self.run(user)
+            except Exception as e:
+                logger.error(f"Backfill for {user} failed: {e}")
+            finally:
+                with self._lock:
+                    self._running.discard(key)
+
+        threading.Thread(target=target, name=f"backfill-{key}", daemon=True).start()
+        return self.progress(user)
+
+    def resume_interrupted(self, user: str) -> bool:
+        """Restart a job whose worker died (unfinished and lease expired)"""
+        job = self._job(user)
+        if job is None or job['status'] not in (PENDING, RUNNING) or job['lease_until'] >= time.time():
+            return False
+        self.start(user)
+        return True
+
+    def refill(self, user: str) -> bool:
+        """Start a new job if the user's completed one is outdated"""
+        if not self.outdated(user):
+            return False
+        self.start(user)
+        return True
+
+    def progress(self, user: str) -> Optional[Dict[str, Any]]:
+        """
+        Report a user's backfill progress.
+
+        Returns:
+            Optional[Dict[str, Any]]: Status, page and scrobble counts and an ETA, or None if no job exists
+        """
+        job = self._job(user)
+        if job is None:
+            return None
+        pages_done, scrobbles = self._db.execute(
+            'SELECT COUNT(*), COALESCE(SUM(scrobbles), 0) FROM backfill_pages WHERE user = ?',
+            (self._user(user),)
+        ).fetchone()
+
+        total = job['total_pages']
+        eta = None
+        if job['status'] == RUNNING and 0 < pages_done < total:
+            elapsed = time.time() - job['started_at']
+            eta = round(elapsed / pages_done * (total - pages_done))
+        return {
+            'user': user,
+            'status': job['status'],
+            'pages_done': pages_done,
+            'total_pages': total,
+            'scrobbles': scrobbles,
+            'percent': round(100.0 * pages_done / total, 1) if total else 100.0,
+            'eta_seconds': eta,
+            'started_at': job['started_at'],
+            'finished_at': job['finished_at'],
+            'error': job['error']
+        }
+
+    def reset(self, user: str) -> None:
+        """Forget a user's job so the next start begins from scratch"""
+        with self._db.transaction() as conn:
+            conn.execute('DELETE FROM backfill_jobs WHERE user = ?', (self._user(user),))
+            conn.execute('DELETE FROM backfill_pages WHERE user = ?', (self._user(user),))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return job counts by status and jobs running in this process"""
+        stats = {'running_here': len(self._running), 'jobs': {}}
+        if self._db.exists():
+            rows = self._db.execute('SELECT status, COUNT(*) FROM backfill_jobs GROUP BY status')
+            stats['jobs'] = {status: count for status, count in rows}
+        return stats
@@ -0,0 +1,93 @@
+"""
+Benchmark listening-pattern analytics: per-track loops vs ListeningAnalytics.
+
+The baseline is the dict-per-track implementation /stats used before
+(one datetime.fromtimestamp and strftime per scrobble, inside a bare
+try/except), reproduced below. ListeningAnalytics is timed both from an
+int64 array (how /stats reads the local history) and from track dicts,
+with whichever backend is installed (numpy, or the array fallback).
+
+Usage:
+    python benchmarks/bench_analytics.py [--scrobbles 1000000] [--iterations 3]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+from array import array
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from analytics import ListeningAnalytics  # noqa: E402
+
+def legacy_most_active_hour(tracks):
+    hours = {}
+    for track in tracks:
+        if 'date' in track:
+            try:
+                timestamp = int(track['date']['uts'])
+                hour = datetime.fromtimestamp(timestamp).hour
+                hours[hour] = hours.get(hour, 0) + 1
+            except:  # noqa: E722
+                continue
+    return max(hours.items(), key=lambda x: x[1])[0] if hours else 12
+
+def legacy_listening_patterns(tracks):
+    patterns = {
+        'hourly': {str(i): 0 for i in range(24)},
+        'daily': {str(i): 0 for i in range(7)},
+        'monthly': {}
+    }
+    for track in tracks:
+        if 'date' in track:
+            try:
+                timestamp = int(track['date']['uts'])
+                dt = datetime.fromtimestamp(timestamp)
+                patterns['hourly'][str(dt.hour)] += 1
+                patterns['daily'][str(dt.weekday())] += 1
+                month = dt.strftime('%Y-%m')
+                patterns['monthly'][month] = patterns['monthly'].get(month, 0) + 1
+            except:  # noqa: E722
+                continue
+    return patterns
+
+def timed(fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scrobbles', type=int, default=1000000)
+    parser.add_argument('--iterations', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    now = int(time.time())
+    timestamps = array('q', sorted((now - rng.randrange(10 * 365 * 86400) for _ in range(args.scrobbles)),
+                                   reverse=True))
+    tracks = [{'date': {'uts': str(uts)}} for uts in timestamps]
+
+    legacy = legacy_listening_patterns(tracks)
+    fast = ListeningAnalytics(timestamps).patterns()
+    assert legacy['hourly'] == fast['hourly'] and legacy['daily'] == fast['daily']
+    assert legacy['monthly'] == fast['monthly']
+
+    cases = [
+        ('legacy (track dicts)', lambda: (legacy_listening_patterns(tracks), legacy_most_active_hour(tracks))),
+        ('analytics (track dicts)', lambda: ListeningAnalytics.from_tracks(tracks).patterns()),
+        ('analytics (int64 array)', lambda: ListeningAnalytics(timestamps).patterns()),
+    ]
+    print(f"{args.scrobbles} scrobbles, backend: {ListeningAnalytics.engine()}")
+    print(f"{'implementation':<26} {'median ms':>10}")
+    for name, fn in cases:
+        print(f"{name:<26} {timed(fn, args.iterations):>10.1f}")
+
+if __name__ == '__main__':
+    main()
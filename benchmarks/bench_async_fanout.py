@@ -0,0 +1,82 @@
+"""
+Benchmark the dashboard's top-artists/tracks/albums fan-out.
+
+Compares the synchronous path (three sequential make_lastfm_request calls,
+as the /top-* routes make them) with the concurrent gather of
+make_lastfm_request_async calls used by /top-overview. Both run against
+fake_lastfm with fixed latency, and the response cache is cleared before
+every iteration so each call really goes upstream.
+
+Usage:
+    python benchmarks/bench_async_fanout.py [--latency-ms 80] [--iterations 20]
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as app_module  # noqa: E402
+from fake_lastfm import FakeLastFM, FakeLastFMConfig  # noqa: E402
+from upstream_governor import UpstreamGovernor  # noqa: E402
+
+METHODS = ('user.getTopArtists', 'user.getTopTracks', 'user.getTopAlbums')
+
+def _params(method):
+    return {'method': method, 'user': 'bench', 'api_key': 'bench', 'period': '7day', 'limit': 10}
+
+def run_sync(iterations):
+    timings = []
+    for _ in range(iterations):
+        app_module.response_cache.clear()
+        start = time.perf_counter()
+        for method in METHODS:
+            app_module.make_lastfm_request(_params(method))
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def run_async(iterations):
+    async def one():
+        async with app_module.create_async_client() as client:
+            await asyncio.gather(*(app_module.make_lastfm_request_async(client, _params(method))
+                                   for method in METHODS))
+
+    timings = []
+    for _ in range(iterations):
+        app_module.response_cache.clear()
+        start = time.perf_counter()
+        asyncio.run(one())
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+    print(f"{name:<28} mean {statistics.mean(timings) * 1000:8.1f} ms   "
+          f"p50 {statistics.median(timings) * 1000:8.1f} ms   p95 {p95 * 1000:8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency-ms', type=float, default=80)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    fake = FakeLastFM(config=FakeLastFMConfig(latency=f"fixed:{args.latency_ms}")).start()
+    app_module.BASE_URL = fake.url
+    # Measure the client paths, not the production request budget
+    app_module.upstream_governor = UpstreamGovernor(
+        rate=1e6, burst=1e6, state_path=os.path.join(tempfile.mkdtemp(), 'governor.state')
+    )
+
+    print(f"Fake upstream latency {args.latency_ms:.0f} ms, {args.iterations} iterations\n")
+    report('sync (3 sequential calls)', run_sync(args.iterations))
+    report('async (gather of 3 calls)', run_async(args.iterations))
+
+    fake.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark history export: building the whole export in memory vs streaming.
+
+Fills a temporary history store, then exports it as CSV and NDJSON (plain
+and gzipped) two ways: the buffered baseline reads every row into a list
+of track dicts and joins the output (how get_user_recent_tracks builds
+result['tracks']), while HistoryExport streams keyset batches through a
+fixed-size buffer. Reports wall time and peak traced memory for each
+(times include tracemalloc overhead, so compare them with each other only).
+
+Usage:
+    python benchmarks/bench_history_export.py [--scrobbles 200000]
+"""
+import os
+import sys
+import io
+import csv
+import time
+import random
+import tempfile
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from history_store import HistoryStore, format_uts  # noqa: E402
+from history_export import HistoryExport  # noqa: E402
+
+def fill(store, user, count):
+    rng = random.Random(1)
+    now = int(time.time())
+    batch = []
+    for i in range(count):
+        artist = f"Artist {rng.randrange(3000)}"
+        batch.append({'name': f"Track {rng.randrange(50000)}", 'artist': {'#text': artist},
+                      'album': {'#text': f"Album {rng.randrange(10000)}"},
+                      'url': f"https://www.last.fm/music/{artist.replace(' ', '+')}",
+                      'date': {'uts': str(now - i * 90)}})
+        if len(batch) == 5000:
+            store.add_tracks(user, batch)
+            batch = []
+    store.add_tracks(user, batch)
+
+def buffered_csv(store, user):
+    tracks = store.recent(user, 10 ** 9)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(('uts', 'date', 'artist', 'track', 'album', 'url'))
+    for track in tracks:
+        uts = int(track['date']['uts'])
+        writer.writerow((uts, format_uts(uts), track['artist']['#text'], track['name'],
+                         track['album']['#text'], track['url']))
+    return buffer.getvalue().encode('utf-8')
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scrobbles', type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = HistoryStore(os.path.join(tmp_dir, 'history.sqlite3'))
+        fill(store, 'bench', args.scrobbles)
+
+        def streamed(fmt, compress):
+            return lambda: sum(len(chunk) for chunk in HistoryExport(store.iter_rows('bench'), fmt, compress))
+
+        cases = [
+            ('buffered csv', lambda: len(buffered_csv(store, 'bench'))),
+            ('streamed csv', streamed('csv', False)),
+            ('streamed csv.gz', streamed('csv', True)),
+            ('streamed ndjson', streamed('ndjson', False)),
+            ('streamed ndjson.gz', streamed('ndjson', True)),
+        ]
+        print(f"{args.scrobbles} scrobbles")
+        print(f"{'export':<20} {'seconds':>8} {'peak MiB':>9} {'output MiB':>11}")
+        for name, fn in cases:
+            elapsed, peak, size = measure(fn)
+            print(f"{name:<20} {elapsed:>8.2f} {peak / 2 ** 20:>9.1f} {size / 2 ** 20:>11.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark /history search over a large local scrobble history.
+
+Fills a temporary history store with synthetic scrobbles for one user
+(plus a second user's to share the index), then times first pages, deep
+keyset pages, text searches and date ranges straight against the store.
+No upstream calls are involved.
+
+Usage:
+    python benchmarks/bench_history_search.py [--scrobbles 300000] [--iterations 20]
+"""
+import os
+import sys
+import time
+import random
+import itertools
+import tempfile
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from history_store import HistoryStore  # noqa: E402
+
+COMMON_WORDS = ['night', 'love', 'the', 'dream', 'fire', 'heart', 'live', 'remix', 'ghost', 'wolf']
+SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'sa', 'tor', 'vel', 'un', 'dra', 'quin', 'ze', 'po', 'lit', 'gan', 'hur']
+
+def _vocabulary(rng, size):
+    """Made-up words plus a few very common ones, drawn with a Zipf-like skew"""
+    words = list(COMMON_WORDS)
+    while len(words) < size:
+        words.append(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))))
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(words))))
+    return lambda: rng.choices(words, cum_weights=cum_weights)[0]
+
+def fill(store, user, count, seed):
+    rng = random.Random(seed)
+    word = _vocabulary(rng, 20000)
+    artists = [f"{word().title()} {word().title()}" for _ in range(3000)]
+    albums = {artist: [f"{word().title()} {word().title()}" for _ in range(4)] for artist in artists}
+    start = int(time.time()) - count * 180
+    batch = []
+    for i in range(count):
+        artist = rng.choice(artists)
+        batch.append({
+            'name': ' '.join(word() for _ in range(rng.randint(1, 3))).title(),
+            'artist': {'#text': artist},
+            'album': {'#text': rng.choice(albums[artist])},
+            'date': {'uts': str(start + i * 180)}
+        })
+        if len(batch) == 5000:
+            store.add_tracks(user, batch)
+            batch = []
+    store.add_tracks(user, batch)
+
+def timed(fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), max(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scrobbles', type=int, default=300000)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = HistoryStore(os.path.join(tmp_dir, 'history.sqlite3'))
+        start = time.perf_counter()
+        fill(store, 'bench', args.scrobbles, seed=1)
+        fill(store, 'other', args.scrobbles // 4, seed=2)
+        print(f"Stored {args.scrobbles} scrobbles in {time.perf_counter() - start:.1f}s")
+        store.search('bench', 'warmup')
+
+        sample = store.search('bench', '', limit=1)['tracks'][0]
+        artist = sample['artist']['#text']
+        deep_cursor = None
+        for _ in range(50):
+            deep_cursor = store.search('bench', '', limit=50, cursor=deep_cursor)['next_cursor']
+        midpoint = int(time.time()) - args.scrobbles * 90
+
+        cases = [
+            ('first page', lambda: store.search('bench', '')),
+            ('page 51 (keyset)', lambda: store.search('bench', '', cursor=deep_cursor)),
+            ('common word', lambda: store.search('bench', 'love')),
+            ('artist name', lambda: store.search('bench', artist)),
+            ('artist prefix', lambda: store.search('bench', artist[:4])),
+            ('track + artist', lambda: store.search('bench', f"{sample['name']} {artist}")),
+            ('one-week range', lambda: store.search('bench', '', since=midpoint, until=midpoint + 7 * 86400)),
+            ('word in range', lambda: store.search('bench', 'night', since=midpoint, until=midpoint + 30 * 86400)),
+        ]
+        print(f"{'query':<20} {'median ms':>10} {'max ms':>10}")
+        for name, fn in cases:
+            median, worst = timed(fn, args.iterations)
+            print(f"{name:<20} {median:>10.2f} {worst:>10.2f}")
+
+if __name__ == '__main__':
+    main()
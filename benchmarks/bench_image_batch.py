@@ -0,0 +1,91 @@
+"""
+Benchmark dashboard image loading: per-card lookups vs the batch endpoint.
+
+The per-card path replays what the dashboard used to do: for each of the
+three top lists (loaded in parallel) it POSTs /fetch-artist-image,
+/fetch-track-image or /fetch-album-image one card at a time. The batch path
+sends one /fetch-images request per list. Both run against fake_lastfm with
+fixed latency, and all caches are cleared before every iteration.
+
+Usage:
+    python benchmarks/bench_image_batch.py [--latency-ms 80] [--iterations 5] [--cards 10]
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as app_module  # noqa: E402
+from fake_lastfm import FakeLastFM, FakeLastFMConfig  # noqa: E402
+from metadata_cache import MetadataCache  # noqa: E402
+from upstream_governor import UpstreamGovernor  # noqa: E402
+
+def _lists(fake, cards):
+    """Build the three dashboard lists from the fake's catalogue"""
+    counts = fake.top_counts('bench', '7day')[:cards]
+    artists = [{'type': 'artist', 'artist': a['name']} for a, _, _ in counts]
+    tracks = [{'type': 'track', 'artist': a['name'], 'track': a['tracks'][i][0]} for a, i, _ in counts]
+    albums = [{'type': 'album', 'artist': a['name'], 'album': a['albums'][i]} for a, i, _ in counts]
+    return artists, tracks, albums
+
+def _client():
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess['oauth_token'] = 'bench'
+        sess['user_name'] = 'bench'
+    return client
+
+def _reset_caches(tmp_dir, n):
+    app_module.response_cache.clear()
+    app_module.metadata_cache = MetadataCache(os.path.join(tmp_dir, f"meta-{n}.sqlite3"))
+
+def per_card(items):
+    client = _client()
+    for item in items:
+        client.post(f"/fetch-{item['type']}-image", json=item)
+
+def batch(items):
+    _client().post('/fetch-images', json={'items': items})
+
+def run(fn, lists, iterations, tmp_dir):
+    timings = []
+    with ThreadPoolExecutor(max_workers=len(lists)) as pool:
+        for n in range(iterations):
+            _reset_caches(tmp_dir, f"{fn.__name__}-{n}")
+            start = time.perf_counter()
+            list(pool.map(fn, lists))
+            timings.append(time.perf_counter() - start)
+    return timings
+
+def report(name, timings, cards):
+    mean = statistics.mean(timings)
+    print(f"{name:<24} mean {mean * 1000:8.1f} ms   min {min(timings) * 1000:8.1f} ms   "
+          f"{cards * 3 / mean:7.1f} images/s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency-ms', type=float, default=80)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--cards', type=int, default=10)
+    args = parser.parse_args()
+
+    fake = FakeLastFM(config=FakeLastFMConfig(latency=f"fixed:{args.latency_ms}")).start()
+    app_module.BASE_URL = fake.url
+    tmp_dir = tempfile.mkdtemp()
+    app_module.upstream_governor = UpstreamGovernor(rate=1e6, burst=1e6, state_path=os.path.join(tmp_dir, 'governor.state'))
+    lists = _lists(fake, args.cards)
+
+    print(f"Fake upstream latency {args.latency_ms:.0f} ms, 3 lists x {args.cards} cards, "
+          f"{args.iterations} iterations\n")
+    report('per-card requests', run(per_card, lists, args.iterations, tmp_dir), args.cards)
+    report('batch /fetch-images', run(batch, lists, args.iterations, tmp_dir), args.cards)
+
+    fake.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark approximate range statistics: merged month sketches vs exact counts.
+
+Fills a temporary history store (with ListeningSketches attached) with
+several years of synthetic listening, then times ListeningSketches.summary
+against exact COUNT(DISTINCT) / GROUP BY queries over the raw scrobbles for
+a few ranges and reports the estimation error next to the documented bound.
+
+Usage:
+    python benchmarks/bench_sketches.py [--scrobbles 300000] [--iterations 10]
+"""
+import os
+import sys
+import time
+import calendar
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from history_store import HistoryStore  # noqa: E402
+from sketches import ListeningSketches  # noqa: E402
+from bench_top_range import fill, timed  # noqa: E402
+
+def exact(store, user, since, until):
+    unique = store._db.execute(
+        'SELECT COUNT(DISTINCT artist) FROM scrobbles WHERE user = ? AND uts BETWEEN ? AND ?', (user, since, until)
+    ).fetchone()[0]
+    top = store._db.execute(
+        'SELECT artist, COUNT(*) AS plays FROM scrobbles WHERE user = ? AND uts BETWEEN ? AND ? '
+        'GROUP BY artist ORDER BY plays DESC LIMIT 10', (user, since, until)
+    ).fetchall()
+    return unique, top
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scrobbles', type=int, default=300000)
+    parser.add_argument('--iterations', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = HistoryStore(os.path.join(tmp_dir, 'history.sqlite3'))
+        sketches = ListeningSketches(store)
+        start = time.perf_counter()
+        fill(store, 'bench', args.scrobbles)
+        print(f"Stored {args.scrobbles} scrobbles with sketches in {time.perf_counter() - start:.1f}s "
+              f"({sketches.get_stats()['bytes'] / 1024:.0f} KiB of sketches)")
+
+        now = int(time.time())
+        ranges = [('last 3 months', now - 90 * 86400), ('last year', now - 365 * 86400), ('all time', 0)]
+        print(f"{'range':<14} {'sketch ms':>10} {'exact ms':>9} {'artists':>8} {'estimate':>9} "
+              f"{'bound':>6} {'top1 gap':>9}")
+        for name, since in ranges:
+            sketch_ms = timed(lambda: sketches.summary('bench', since, now), args.iterations)
+            exact_ms = timed(lambda: exact(store, 'bench', since, now), args.iterations)
+            # Sketches cover whole months, so compare against the widened range
+            summary = sketches.summary('bench', since, now)
+            month_start = calendar.timegm(time.strptime(summary['from'], '%Y-%m'))
+            unique, top = exact(store, 'bench', min(since, month_start), now)
+            gap = top[0][1] - summary['top_artists'][0]['plays']
+            print(f"{name:<14} {sketch_ms:>10.1f} {exact_ms:>9.1f} {unique:>8} {summary['unique_artists']:>9} "
+                  f"{summary['error']['unique_relative']:>6.1%} {gap:>9}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark arbitrary-range top-N charts: rollups + heap vs scanning scrobbles.
+
+Fills a temporary history store (with ListeningAggregates attached, so the
+day/month/year rollups are maintained as the scrobbles go in) with several
+years of synthetic listening, then times ListeningAggregates.top_range
+against a GROUP BY over the raw scrobbles for a few ranges.
+
+Usage:
+    python benchmarks/bench_top_range.py [--scrobbles 300000] [--iterations 10]
+"""
+import os
+import sys
+import time
+import random
+import itertools
+import tempfile
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from history_store import HistoryStore  # noqa: E402
+from aggregates import ListeningAggregates  # noqa: E402
+
+def fill(store, user, count):
+    """Ten minutes apart, with Zipf-skewed artists and tracks like real listening"""
+    rng = random.Random(1)
+    now = int(time.time())
+    artists = [f"Artist {i}" for i in range(3000)]
+    artist_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(artists))))
+    track_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(40)))
+    batch = []
+    for i in range(count):
+        artist = rng.choices(artists, cum_weights=artist_weights)[0]
+        track = rng.choices(range(40), cum_weights=track_weights)[0]
+        batch.append({'name': f"Track {track}", 'artist': {'#text': artist},
+                      'album': {'#text': f"Album {track % 4}"}, 'date': {'uts': str(now - i * 600)}})
+        if len(batch) == 5000:
+            store.add_tracks(user, batch)
+            batch = []
+    store.add_tracks(user, batch)
+
+def scan_top(store, user, since, until, limit):
+    return store._db.execute(
+        'SELECT artist, COUNT(*) AS plays FROM scrobbles WHERE user = ? AND uts BETWEEN ? AND ? '
+        'GROUP BY artist ORDER BY plays DESC LIMIT ?', (user, since, until, limit)
+    ).fetchall()
+
+def timed(fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scrobbles', type=int, default=300000)
+    parser.add_argument('--iterations', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = HistoryStore(os.path.join(tmp_dir, 'history.sqlite3'))
+        aggregates = ListeningAggregates(store)
+        start = time.perf_counter()
+        fill(store, 'bench', args.scrobbles)
+        print(f"Stored {args.scrobbles} scrobbles with rollups in {time.perf_counter() - start:.1f}s")
+
+        now = int(time.time())
+        ranges = [('last 45 days', now - 45 * 86400), ('last year', now - 365 * 86400), ('all time', 0)]
+        print(f"{'range':<14} {'kind':<7} {'rollups ms':>11} {'scan ms':>9}")
+        for name, since in ranges:
+            for kind in ('artist', 'track'):
+                rollup = timed(lambda: aggregates.top_range('bench', kind, since, now, 10), args.iterations)
+                scan = timed(lambda: scan_top(store, 'bench', since, now, 10), args.iterations) if kind == 'artist' else None
+                scan_text = f"{scan:>9.1f}" if scan is not None else f"{'-':>9}"
+                print(f"{name:<14} {kind:<7} {rollup:>11.1f} {scan_text}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark the memory held by recent tracks: decoded Last.fm dicts vs TrackRecords.
+
+Builds a user.getRecentTracks-shaped JSON document of synthetic, Zipf-skewed
+listening (full entries: mbids, four image sizes, dates), decodes it the
+way the app receives it, and measures with tracemalloc the memory retained
+by the decoded track dicts and by the same tracks as TrackRecords.
+
+Usage:
+    python benchmarks/bench_track_record.py [--tracks 100000]
+"""
+import os
+import sys
+import gc
+import json
+import time
+import random
+import itertools
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from track_record import parse_track_records  # noqa: E402
+
+IMAGE_SIZES = (('small', '34s'), ('medium', '64s'), ('large', '174s'), ('extralarge', '300x300'))
+
+def response(count):
+    rng = random.Random(1)
+    weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(2000)))
+    now = int(time.time())
+    tracks = []
+    for i in range(count):
+        artist = rng.choices(range(2000), cum_weights=weights)[0]
+        track = rng.randrange(30)
+        art = f"{artist:08x}{track % 3:024x}"
+        tracks.append({
+            'artist': {'mbid': f"{artist:032x}", '#text': f"Artist {artist}"},
+            'streamable': '0',
+            'image': [{'size': size, '#text': f"https://lastfm.freetls.fastly.net/i/u/{path}/{art}.png"}
+                      for size, path in IMAGE_SIZES],
+            'mbid': '',
+            'album': {'mbid': '', '#text': f"Album {artist}-{track % 3}"},
+            'name': f"Track {artist}-{track}",
+            'url': f"https://www.last.fm/music/Artist+{artist}/_/Track+{artist}-{track}",
+            'date': {'uts': str(now - i * 240), '#text': '01 Jan 2025, 12:00'}
+        })
+    return json.dumps({'recenttracks': {'track': tracks, '@attr': {'total': str(count)}}})
+
+def retained(build):
+    """Bytes still allocated by build()'s result once it returns"""
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=100000)
+    args = parser.parse_args()
+
+    document = response(args.tracks)
+    tracks, dict_bytes = retained(lambda: json.loads(document)['recenttracks']['track'])
+    del tracks
+    records, record_bytes = retained(lambda: parse_track_records(json.loads(document))[0])
+    start = time.perf_counter()
+    page = [record.to_lastfm() for record in records[:50]]
+    to_dict_ms = (time.perf_counter() - start) * 1000
+
+    print(f"{args.tracks} tracks")
+    print(f"  decoded dicts  {dict_bytes / 2**20:8.1f} MiB  {dict_bytes / args.tracks:7.0f} B/track")
+    print(f"  TrackRecords   {record_bytes / 2**20:8.1f} MiB  {record_bytes / args.tracks:7.0f} B/track")
+    print(f"  reduction      {dict_bytes / record_bytes:8.1f}x")
+    print(f"  {len(page)}-track page back to dicts: {to_dict_ms:.2f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+
+class CircuitBreaker:
+    """
+    Circuit breaker for a single upstream method.
+
+    Opens after ``failure_threshold`` consecutive failures, rejects calls
+    while open, and after ``reset_timeout`` lets a single probe through in
+    the half-open state. A successful probe closes the breaker again; a
+    failed one re-opens it for another timeout.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+                 on_transition=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._on_transition = on_transition
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._stats = {'successes': 0, 'failures': 0, 'rejected': 0}
+
+    def _transition(self, new_state: str) -> None:
+        """Change state and report the transition (lock must be held)"""
+        old_state = self._state
+        if old_state == new_state:
+            return
+        self._state = new_state
+        if new_state == OPEN:
+            self._opened_at = time.monotonic()
+        logger.warning(f"Circuit breaker '{self.name}' {old_state} -> {new_state}")
+        if self._on_transition:
+            self._on_transition(self.name, old_state, new_state)
+
+    @property
+    def state(self) -> str:
+        """Current state, moving from open to half-open once the timeout passed"""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._transition(HALF_OPEN)
+            return self._state
+
+    def allow_request(self) -> bool:
+        """
+        Check whether a call may go upstream.
+
+        Returns:
+            bool: True if the call may proceed (in half-open state only one probe is allowed)
+        """
+        state = self.state
+        with self._lock:
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def record_success(self) -> None:
+        """Record a healthy upstream response"""
+        with self._lock:
+            self._stats['successes'] += 1
+            self._failures = 0
+            self._probe_in_flight = False
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        """Record a failed or timed-out upstream call"""
+        with self._lock:
+            self._stats['failures'] += 1
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._transition(OPEN)
+
+    def release(self) -> None:
+        """Give back a probe slot that was granted but never used"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def retry_in(self) -> float:
+        """Seconds until an open breaker lets a probe through"""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the breaker state for diagnostics"""
+        state = self.state
+        retry_in = self.retry_in()
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': state,
+                'consecutive_failures': self._failures,
+                'retry_in': round(retry_in, 1),
+                **self._stats
+            }
+
+class CircuitBreakerRegistry:
+    """Per-method circuit breakers plus a log of recent state transitions"""
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+                 history_size: int = 50):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self._transitions = deque(maxlen=history_size)
+
+    def _record_transition(self, name: str, old_state: str, new_state: str) -> None:
+        self._transitions.append({
+            'name': name,
+            'from': old_state,
+            'to': new_state,
+            'at': datetime.now().isoformat()
+        })
+
+    def get(self, name: Optional[str]) -> CircuitBreaker:
+        """Get or create the breaker for an upstream method"""
+        name = name or 'unknown'
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(name, self.failure_threshold, self.reset_timeout,
+                                         on_transition=self._record_transition)
+                self._breakers[name] = breaker
+            return breaker
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return all breakers and recent transitions, newest first"""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {
+            'breakers': [breaker.snapshot() for breaker in breakers],
+            'transitions': list(reversed(self._transitions))
+        }
+
+    def reset(self) -> None:
+        """Forget all breakers and recorded transitions"""
+        with self._lock:
+            self._breakers.clear()
+            self._transitions.clear()
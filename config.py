@@ -10,6 +10,7 @@ class Config:
     # Last.fm API Configuration
     LASTFM_API_KEY = os.environ.get('LASTFM_API_KEY')
     LASTFM_API_SECRET = os.environ.get('LASTFM_API_SECRET')
+    LASTFM_BASE_URL = os.environ.get('LASTFM_BASE_URL', 'https://ws.audioscrobbler.com/2.0/')
     
     # Security Configuration
     SESSION_COOKIE_SECURE = os.environ.get('SESSION_COOKIE_SECURE', 'False').lower() == 'true'
@@ -21,6 +22,54 @@ class Config:
     RATE_LIMIT_REQUESTS = int(os.environ.get('RATE_LIMIT_REQUESTS', '5'))
     RATE_LIMIT_WINDOW = int(os.environ.get('RATE_LIMIT_WINDOW', '60'))
     
+    # Upstream HTTP connection pool (per gunicorn worker)
+    LASTFM_POOL_CONNECTIONS = int(os.environ.get('LASTFM_POOL_CONNECTIONS', '4'))
+    LASTFM_POOL_MAXSIZE = int(os.environ.get('LASTFM_POOL_MAXSIZE', '10'))
+    LASTFM_CONNECT_TIMEOUT = float(os.environ.get('LASTFM_CONNECT_TIMEOUT', '3.05'))
+    LASTFM_READ_TIMEOUT = float(os.environ.get('LASTFM_READ_TIMEOUT', '10'))
+    
+    # Response cache for read-only Last.fm methods
+    LASTFM_CACHE_MAX_MB = int(os.environ.get('LASTFM_CACHE_MAX_MB', '32'))
+    
+    # Outbound Last.fm request budget shared by all workers on a node
+    LASTFM_RATE_PER_SEC = float(os.environ.get('LASTFM_RATE_PER_SEC', '5'))
+    LASTFM_RATE_BURST = float(os.environ.get('LASTFM_RATE_BURST', '10'))
+    LASTFM_GOVERNOR_STATE = os.environ.get('LASTFM_GOVERNOR_STATE')
+    
+    # Per-method circuit breakers for upstream outages
+    LASTFM_BREAKER_THRESHOLD = int(os.environ.get('LASTFM_BREAKER_THRESHOLD', '5'))
+    LASTFM_BREAKER_RESET = float(os.environ.get('LASTFM_BREAKER_RESET', '30'))
+    
+    # Threads resolving artwork for batch image requests
+    IMAGE_RESOLVER_WORKERS = int(os.environ.get('IMAGE_RESOLVER_WORKERS', '8'))
+    IMAGE_CACHE_TTL = int(os.environ.get('IMAGE_CACHE_TTL', '86400'))
+    IMAGE_MISS_TTL = int(os.environ.get('IMAGE_MISS_TTL', '21600'))
+    
+    # Local artwork thumbnail cache behind /artwork
+    ARTWORK_CACHE_DIR = os.environ.get('ARTWORK_CACHE_DIR')
+    ARTWORK_CACHE_MAX_MB = int(os.environ.get('ARTWORK_CACHE_MAX_MB', '256'))
+    ARTWORK_ALLOWED_HOSTS = os.environ.get('ARTWORK_ALLOWED_HOSTS')
+    
+    # Persistent data (SQLite caches and stores)
+    DATA_DIR = os.environ.get('DATA_DIR', 'data')
+    METADATA_CACHE_PATH = os.environ.get('METADATA_CACHE_PATH')
+    METADATA_CACHE_TTL_DAYS = float(os.environ.get('METADATA_CACHE_TTL_DAYS', '30'))
+    METADATA_REFRESH_DAYS = float(os.environ.get('METADATA_REFRESH_DAYS', '7'))
+    ARTIST_TAGS_PATH = os.environ.get('ARTIST_TAGS_PATH')
+    ARTIST_TAGS_TTL_DAYS = float(os.environ.get('ARTIST_TAGS_TTL_DAYS', '30'))
+    ARTIST_TAGS_WORKERS = int(os.environ.get('ARTIST_TAGS_WORKERS', '4'))
+    HISTORY_DB_PATH = os.environ.get('HISTORY_DB_PATH')
+    HISTORY_SYNC_INTERVAL = float(os.environ.get('HISTORY_SYNC_INTERVAL', '60'))
+    BACKFILL_WORKERS = int(os.environ.get('BACKFILL_WORKERS', '4'))
+    BACKFILL_LEASE_SECONDS = float(os.environ.get('BACKFILL_LEASE_SECONDS', '60'))
+    RECENT_BLOCK_TTL = float(os.environ.get('RECENT_BLOCK_TTL', '60'))
+    RECENT_BLOCK_CACHE_SIZE = int(os.environ.get('RECENT_BLOCK_CACHE_SIZE', '64'))
+    STATS_APPROXIMATE = os.environ.get('STATS_APPROXIMATE', 'false').lower() == 'true'
+    SCROBBLE_QUEUE_PATH = os.environ.get('SCROBBLE_QUEUE_PATH')
+    SCROBBLE_QUEUE_MAX_ATTEMPTS = int(os.environ.get('SCROBBLE_QUEUE_MAX_ATTEMPTS', '10'))
+    SCROBBLE_QUEUE_MAX_BACKOFF = float(os.environ.get('SCROBBLE_QUEUE_MAX_BACKOFF', '300'))
+    SCROBBLE_FLUSHER = os.environ.get('SCROBBLE_FLUSHER', 'true').lower() == 'true'
+    
     # Token Storage
     TOKEN_FILE_PATH = os.environ.get('TOKEN_FILE_PATH', 'tokens.json')
     
@@ -0,0 +1,737 @@
+"""
+Self-contained fake Last.fm API server for local load and failure testing.
+
+Implements the API methods this app calls with deterministic synthetic
+data, and can inject latency, errors, stalls and rate-limit responses.
+Point the app at it with ``LASTFM_BASE_URL=http://127.0.0.1:8765/2.0/``.
+
+Usage:
+    python fake_lastfm.py --port 8765 --latency lognormal:60:0.5 \\
+        --error-rate 0.01 --rate-limit 5
+"""
+import json
+import math
+import time
+import zlib
+import random
+import struct
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+# Last.fm error codes used by the fake
+ERROR_INVALID_METHOD = 3
+ERROR_INVALID_PARAMETERS = 6
+ERROR_OPERATION_FAILED = 8
+ERROR_INVALID_SESSION = 9
+ERROR_SERVICE_OFFLINE = 11
+ERROR_INVALID_SIGNATURE = 13
+ERROR_TEMPORARILY_UNAVAILABLE = 16
+ERROR_RATE_LIMIT = 29
+
+ERROR_MESSAGES = {
+    ERROR_INVALID_METHOD: 'Invalid Method - No method with that name in this package',
+    ERROR_INVALID_PARAMETERS: 'Invalid parameters - Your request is missing a required parameter',
+    ERROR_OPERATION_FAILED: 'Operation failed - Most likely the backend service failed. Please try again.',
+    ERROR_INVALID_SESSION: 'Invalid session key - Please re-authenticate',
+    ERROR_SERVICE_OFFLINE: 'Service Offline - This service is temporarily offline. Try again later.',
+    ERROR_INVALID_SIGNATURE: 'Invalid method signature supplied',
+    ERROR_TEMPORARILY_UNAVAILABLE: 'There was a temporary error processing your request. Please try again',
+    ERROR_RATE_LIMIT: 'Rate Limit Exceeded - Your IP has made too many requests in a short period',
+}
+
+IMAGE_SIZES = (('small', 34), ('medium', 64), ('large', 174), ('extralarge', 300))
+
+PERIOD_DAYS = {'7day': 7, '1month': 30, '3month': 90, '6month': 180, '12month': 365, 'overall': 3650}
+
+_ADJECTIVES = ('Velvet', 'Crimson', 'Silent', 'Electric', 'Golden', 'Hollow', 'Neon', 'Paper',
+               'Midnight', 'Glass', 'Wild', 'Lunar', 'Broken', 'Northern', 'Static', 'Burning',
+               'Quiet', 'Radiant', 'Faded', 'Arctic', 'Violet', 'Iron', 'Secret', 'Wandering')
+_NOUNS = ('Owls', 'Harbor', 'Machines', 'Tides', 'Foxes', 'Parade', 'Signals', 'Gardens',
+          'Satellites', 'Wolves', 'Echoes', 'Rivers', 'Lanterns', 'Horizons', 'Ghosts', 'Cities',
+          'Waves', 'Pilots', 'Mirrors', 'Comets', 'Dancers', 'Engines', 'Shadows', 'Birds')
+_WORDS = ('Love', 'Night', 'Fire', 'Heart', 'Dream', 'Light', 'Summer', 'Road', 'Home', 'Rain',
+          'Gold', 'Blue', 'Stars', 'Ocean', 'Winter', 'Storm', 'Song', 'Time', 'Sky', 'Run',
+          'Glow', 'Dust', 'Fever', 'Echo', 'Shine', 'Wonder', 'Lost', 'Young', 'Slow', 'Alive')
+_TAGS = ('rock', 'indie', 'pop', 'electronic', 'alternative', 'hip-hop', 'metal', 'jazz',
+         'folk', 'punk', 'soul', 'ambient', 'classical', 'shoegaze', 'synthpop', 'post-rock')
+
+def _png(width: int, height: int, rgb: Tuple[int, int, int]) -> bytes:
+    """Encode a solid-colour RGB PNG"""
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body) & 0xffffffff)
+
+    row = b'\x00' + bytes(rgb) * width
+    raw = row * height
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw))
+            + chunk(b'IEND', b''))
+
+class LatencyModel:
+    """
+    Response latency distribution parsed from a spec string.
+
+    Specs: ``fixed:MS``, ``uniform:MIN_MS:MAX_MS`` or
+    ``lognormal:MEDIAN_MS:SIGMA``. ``0`` disables added latency.
+    """
+
+    def __init__(self, spec: str = '0'):
+        self.spec = spec
+        parts = str(spec).split(':')
+        self.kind = parts[0] if len(parts) > 1 else 'fixed'
+        values = [float(p) for p in (parts[1:] if len(parts) > 1 else parts)]
+        if self.kind not in ('fixed', 'uniform', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {self.kind}")
+        self.values = values
+
+    def sample(self, rng: random.Random) -> float:
+        """Draw one latency in seconds"""
+        if self.kind == 'uniform':
+            return rng.uniform(self.values[0], self.values[1]) / 1000
+        if self.kind == 'lognormal':
+            median, sigma = self.values[0], self.values[1]
+            return rng.lognormvariate(math.log(max(median, 0.001)), sigma) / 1000
+        return self.values[0] / 1000
+
+class FakeLastFMConfig:
+    """Tunable behaviour of the fake server; can be changed while it runs"""
+
+    def __init__(self, latency: str = '0', method_latency: Optional[Dict[str, str]] = None,
+                 error_rate: float = 0.0, error_codes: Tuple[int, ...] = (ERROR_OPERATION_FAILED,
+                                                                          ERROR_TEMPORARILY_UNAVAILABLE),
+                 http_error_rate: float = 0.0, stall_rate: float = 0.0, stall_seconds: float = 30.0,
+                 rate_limit: float = 0.0, rate_limit_burst: float = 10.0, rate_limit_status: int = 429,
+                 history_size: int = 5000, artists: int = 500, missing_image_rate: float = 0.2,
+                 seed: int = 1):
+        self.latency = LatencyModel(latency)
+        self.method_latency = {m: LatencyModel(s) for m, s in (method_latency or {}).items()}
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.http_error_rate = http_error_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.rate_limit = rate_limit
+        self.rate_limit_burst = rate_limit_burst
+        self.rate_limit_status = rate_limit_status
+        self.history_size = history_size
+        self.artists = artists
+        self.missing_image_rate = missing_image_rate
+        self.seed = seed
+
+    def update(self, values: Dict[str, Any]) -> None:
+        """Apply runtime overrides, e.g. from POST /__fake/config"""
+        for key, value in values.items():
+            if key == 'latency':
+                self.latency = LatencyModel(value)
+            elif key == 'method_latency':
+                self.method_latency = {m: LatencyModel(s) for m, s in value.items()}
+            elif key == 'error_codes':
+                self.error_codes = tuple(int(code) for code in value)
+            elif hasattr(self, key):
+                setattr(self, key, type(getattr(self, key))(value))
+            else:
+                raise ValueError(f"Unknown setting: {key}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'latency': self.latency.spec,
+            'method_latency': {m: l.spec for m, l in self.method_latency.items()},
+            'error_rate': self.error_rate,
+            'error_codes': list(self.error_codes),
+            'http_error_rate': self.http_error_rate,
+            'stall_rate': self.stall_rate,
+            'stall_seconds': self.stall_seconds,
+            'rate_limit': self.rate_limit,
+            'rate_limit_burst': self.rate_limit_burst,
+            'rate_limit_status': self.rate_limit_status,
+            'history_size': self.history_size,
+            'artists': self.artists,
+            'missing_image_rate': self.missing_image_rate,
+            'seed': self.seed
+        }
+
+class Catalogue:
+    """Deterministic synthetic artists, albums and tracks"""
+
+    def __init__(self, size: int, seed: int, missing_image_rate: float, image_base: str):
+        rng = random.Random(seed)
+        self.image_base = image_base
+        self.artists = []
+        seen = set()
+        while len(self.artists) < size:
+            name = f"{rng.choice(('The ', '', ''))}{rng.choice(_ADJECTIVES)} {rng.choice(_NOUNS)}"
+            if name in seen:
+                name = f"{name} {len(self.artists)}"
+            seen.add(name)
+            albums = [self._title(rng) for _ in range(rng.randint(1, 4))]
+            self.artists.append({
+                'name': name,
+                'albums': albums,
+                'tracks': [[self._title(rng) for _ in range(rng.randint(6, 12))] for _ in albums],
+                'tags': rng.sample(_TAGS, 3),
+                'listeners': rng.randint(1000, 5000000),
+                'has_image': rng.random() >= missing_image_rate
+            })
+        self._by_name = {a['name'].lower(): a for a in self.artists}
+
+    @staticmethod
+    def _title(rng: random.Random) -> str:
+        return ' '.join(rng.sample(_WORDS, rng.randint(1, 3)))
+
+    def find(self, name: str) -> Optional[Dict[str, Any]]:
+        return self._by_name.get((name or '').strip().lower())
+
+    def pick(self, rng: random.Random) -> Tuple[Dict[str, Any], int, str]:
+        """Pick an (artist, album index, track) with a long-tailed distribution"""
+        artist = self.artists[int(len(self.artists) * rng.random() ** 3)]
+        album = rng.randrange(len(artist['albums']))
+        return artist, album, rng.choice(artist['tracks'][album])
+
+    def images(self, key: str, present: bool = True) -> List[Dict[str, str]]:
+        digest = format(zlib.crc32(key.encode('utf-8')), '08x')
+        return [{'size': size, '#text': f"{self.image_base}/i/u/{px}s/{digest}.png" if present else ''}
+                for size, px in IMAGE_SIZES]
+
+class FakeLastFM:
+    """
+    The fake API server.
+
+    Use ``start()``/``stop()`` (or a ``with`` block) to run it on a
+    background thread, or ``serve_forever()`` from the command line.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 config: Optional[FakeLastFMConfig] = None):
+        self.config = config or FakeLastFMConfig()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.config.seed)
+        self._anchor = int(time.time())
+        self._tokens = self.config.rate_limit_burst
+        self._tokens_at = time.monotonic()
+        self._live_scrobbles = {}
+        self._now_playing = {}
+        self.stats = {'requests': 0, 'by_method': {}, 'errors': 0, 'rate_limited': 0, 'stalled': 0}
+        self.catalogue = Catalogue(self.config.artists, self.config.seed,
+                                   self.config.missing_image_rate, self.base)
+
+    @property
+    def base(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def url(self) -> str:
+        """API root to use as the app's BASE_URL"""
+        return f"{self.base}/2.0/"
+
+    def start(self) -> 'FakeLastFM':
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        kwargs={'poll_interval': 0.05}, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def __enter__(self) -> 'FakeLastFM':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # -- fault injection -------------------------------------------------
+
+    def _rate_limited(self) -> bool:
+        if self.config.rate_limit <= 0:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.config.rate_limit_burst,
+                               self._tokens + (now - self._tokens_at) * self.config.rate_limit)
+            self._tokens_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return False
+            self.stats['rate_limited'] += 1
+            return True
+
+    def inject(self, method: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """Apply latency and pick an injected failure, if any"""
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['by_method'][method] = self.stats['by_method'].get(method, 0) + 1
+            roll = self._rng.random()
+            model = self.config.method_latency.get(method, self.config.latency)
+            delay = model.sample(self._rng)
+
+        if roll < self.config.stall_rate:
+            with self._lock:
+                self.stats['stalled'] += 1
+            time.sleep(self.config.stall_seconds)
+        elif delay > 0:
+            time.sleep(delay)
+
+        if self._rate_limited():
+            return self.config.rate_limit_status, _error(ERROR_RATE_LIMIT)
+
+        roll -= self.config.stall_rate
+        if 0 <= roll < self.config.http_error_rate:
+            with self._lock:
+                self.stats['errors'] += 1
+            return 503, {'message': 'Service Unavailable'}
+        roll -= self.config.http_error_rate
+        if 0 <= roll < self.config.error_rate:
+            with self._lock:
+                self.stats['errors'] += 1
+            return 200, _error(self._rng.choice(self.config.error_codes))
+        return None
+
+    # -- synthetic listening history -------------------------------------
+
+    SPACING = 200  # average seconds between synthetic scrobbles
+
+    def _synthetic_uts(self, index: int) -> int:
+        jitter = zlib.crc32(str(index).encode()) % (self.SPACING // 2)
+        return self._anchor - index * self.SPACING - jitter
+
+    def _synthetic_track(self, user: str, index: int) -> Dict[str, Any]:
+        rng = random.Random(f"{self.config.seed}:{user}:{index}")
+        artist, album, track = self.catalogue.pick(rng)
+        return self._track_entry(artist, artist['albums'][album], track, self._synthetic_uts(index))
+
+    def _track_entry(self, artist: Dict[str, Any], album: str, track: str,
+                     uts: Optional[int]) -> Dict[str, Any]:
+        entry = {
+            'artist': {'mbid': '', '#text': artist['name']},
+            'streamable': '0',
+            'image': self.catalogue.images(f"{artist['name']}/{album}", artist['has_image']),
+            'mbid': '',
+            'album': {'mbid': '', '#text': album},
+            'name': track,
+            'url': f"https://www.last.fm/music/{artist['name'].replace(' ', '+')}/_/{track.replace(' ', '+')}"
+        }
+        if uts is None:
+            entry['@attr'] = {'nowplaying': 'true'}
+        else:
+            entry['date'] = {
+                'uts': str(uts),
+                '#text': datetime.fromtimestamp(uts, timezone.utc).strftime('%d %b %Y, %H:%M')
+            }
+        return entry
+
+    def _first_index_at_or_before(self, uts: int) -> int:
+        """Smallest synthetic index whose timestamp is <= uts"""
+        lo, hi = 0, self.config.history_size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._synthetic_uts(mid) <= uts:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def recent_tracks(self, user: str, page: int, limit: int,
+                      from_uts: Optional[int], to_uts: Optional[int]) -> Dict[str, Any]:
+        with self._lock:
+            live = [s for s in self._live_scrobbles.get(user.lower(), [])
+                    if (from_uts is None or s[0] >= from_uts) and (to_uts is None or s[0] <= to_uts)]
+            now_playing = self._now_playing.get(user.lower())
+
+        start = self._first_index_at_or_before(to_uts) if to_uts is not None else 0
+        end = (self._first_index_at_or_before(from_uts - 1) if from_uts is not None
+               else self.config.history_size)
+        end = max(start, end)
+        total = len(live) + (end - start)
+        offset = (page - 1) * limit
+
+        tracks = []
+        for uts, artist, album, track in live[offset:offset + limit]:
+            tracks.append(self._track_entry(artist, album, track, uts))
+        synthetic_offset = max(0, offset - len(live))
+        for index in range(start + synthetic_offset, min(end, start + synthetic_offset + limit - len(tracks))):
+            tracks.append(self._synthetic_track(user, index))
+
+        if page == 1 and to_uts is None and now_playing and now_playing[0] > time.time():
+            _, artist, album, track = now_playing
+            tracks.insert(0, self._track_entry(artist, album, track, None))
+
+        return {'recenttracks': {'track': tracks, '@attr': {
+            'user': user, 'totalPages': str(max(1, math.ceil(total / limit))),
+            'page': str(page), 'perPage': str(limit), 'total': str(total)
+        }}}
+
+    def record_scrobble(self, user: str, artist_name: str, track: str, album: str, uts: int) -> None:
+        artist = self.catalogue.find(artist_name) or {'name': artist_name, 'has_image': False}
+        with self._lock:
+            entries = self._live_scrobbles.setdefault(user.lower(), [])
+            entries.append((uts, artist, album, track))
+            entries.sort(key=lambda s: s[0], reverse=True)
+
+    def set_now_playing(self, user: str, artist_name: str, track: str, album: str) -> None:
+        artist = self.catalogue.find(artist_name) or {'name': artist_name, 'has_image': False}
+        with self._lock:
+            self._now_playing[user.lower()] = (time.time() + 300, artist, album, track)
+
+    def top_counts(self, user: str, period: str) -> List[Tuple[Dict[str, Any], int, int]]:
+        """(artist, album index, playcount) triples for a user's period, most played first"""
+        rng = random.Random(f"{self.config.seed}:{user}:top")
+        scale = PERIOD_DAYS.get(period, 7)
+        counts = []
+        for rank, artist in enumerate(rng.sample(self.catalogue.artists, min(200, len(self.catalogue.artists)))):
+            plays = max(1, int(scale * 40 / (rank + 1) ** 0.9))
+            counts.append((artist, rank % len(artist['albums']), plays))
+        return counts
+
+def _error(code: int) -> Dict[str, Any]:
+    return {'error': code, 'message': ERROR_MESSAGES.get(code, 'Error')}
+
+def _as_int(value: Optional[str], default: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+class _Handler(BaseHTTPRequestHandler):
+    """Request handler dispatching Last.fm methods to the fake"""
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def fake(self) -> FakeLastFM:
+        return self.server.fake
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = 'application/json',
+              headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, payload: Dict[str, Any]) -> None:
+        self._send(status, json.dumps(payload).encode('utf-8'))
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path.startswith('/i/u/'):
+            return self._image(parsed.path)
+        if parsed.path == '/__fake/stats':
+            return self._json(200, self.fake.stats)
+        if parsed.path == '/__fake/config':
+            return self._json(200, self.fake.config.to_dict())
+        self._api({k: v[-1] for k, v in parse_qs(parsed.query).items()})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+        if urlparse(self.path).path == '/__fake/config':
+            try:
+                self.fake.config.update(json.loads(body or '{}'))
+            except (ValueError, TypeError) as e:
+                return self._json(400, {'error': str(e)})
+            return self._json(200, self.fake.config.to_dict())
+        self._api({k: v[-1] for k, v in parse_qs(body, keep_blank_values=True).items()})
+
+    def _image(self, path: str) -> None:
+        parts = path.strip('/').split('/')
+        size = _as_int(parts[2].rstrip('s') if len(parts) > 3 else None, 300)
+        digest = parts[-1].split('.')[0]
+        color = zlib.crc32(digest.encode()) & 0xffffff
+        body = _png(size, size, ((color >> 16) & 255, (color >> 8) & 255, color & 255))
+        self._send(200, body, 'image/png', {'Cache-Control': 'max-age=86400'})
+
+    def _api(self, params: Dict[str, str]) -> None:
+        method = params.get('method', '')
+        handler = _METHODS.get(method)
+        if handler is None:
+            return self._json(200, _error(ERROR_INVALID_METHOD))
+
+        injected = self.fake.inject(method)
+        if injected is not None:
+            return self._json(*injected)
+
+        try:
+            status, payload = 200, handler(self.fake, params)
+        except KeyError:
+            status, payload = 200, _error(ERROR_INVALID_PARAMETERS)
+        self._json(status, payload)
+
+# -- method implementations ----------------------------------------------
+
+def _require_signature(params: Dict[str, str], session: bool = True) -> Optional[Dict[str, Any]]:
+    if not params.get('api_sig'):
+        return _error(ERROR_INVALID_SIGNATURE)
+    if session and not params.get('sk'):
+        return _error(ERROR_INVALID_SESSION)
+    return None
+
+def _user_for_session(params: Dict[str, str]) -> str:
+    """Session keys issued by the fake are 'fake-sk-<user>'"""
+    sk = params.get('sk', '')
+    return sk[len('fake-sk-'):] if sk.startswith('fake-sk-') else 'fakeuser'
+
+def _recent_tracks(fake: FakeLastFM, params: Dict[str, str]) -> Dict[str, Any]:
+    user = params['user']
+    limit = min(max(_as_int(params.get('limit'), 50), 1), 200)
+    page = max(_as_int(params.get('page'), 1), 1)
+    from_uts = _as_int(params.get('from'), 0) or None
+    to_uts = _as_int(params.get('to'), 0) or None
+    return fake.recent_tracks(user, page, limit, from_uts, to_uts)
+
+def _paged(items: List[Dict[str, Any]], params: Dict[str, str], user: str) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+    limit = min(max(_as_int(params.get('limit'), 50), 1), 1000)
+    page = max(_as_int(params.get('page'), 1), 1)
+    chunk = items[(page - 1) * limit:page * limit]
+    for rank, item in enumerate(chunk, start=(page - 1) * limit + 1):
+        item['@attr'] = {'rank': str(rank)}
+    attr = {'user': user, 'totalPages': str(max(1, math.ceil(len(items) / limit))),
+            'page': str(page), 'perPage': str(limit), 'total': str(len(items))}
+    return chunk, attr
+
+def _top_artists(fake: FakeLastFM, params: Dict[str, str]) -> Dict[str, Any]:
+    user = params['user']
+    items = [{
+        'name': artist['name'], 'playcount': str(plays), 'mbid': '', 'streamable': '0',
+        'url': f"https://www.last.fm/music/{artist['name'].replace(' ', '+')}",
+        'image': fake.catalogue.images(artist['name'], artist['has_image'])
+    } for artist, _, plays in fake.top_counts(user, params.get('period', 'overall'))]
+    chunk, attr = _paged(items, params, user)
+    return {'topartists': {'artist': chunk, '@attr': attr}}
+
+def _top_albums(fake: FakeLastFM, params: Dict[str, str]) -> Dict[str, Any]:
+    user = params['user']
+    items = [{
+        'name': artist['albums'][album], 'playcount': str(plays), 'mbid': '',
+        'artist': {'name': artist['name'], 'mbid': '', 'url': ''},
+        'url': f"https://www.last.fm/music/{artist['name'].replace(' ', '+')}/{artist['albums'][album].replace(' ', '+')}",
+        'image': fake.catalogue.images(f"{artist['name']}/{artist['albums'][album]}", artist['has_image'])
+    } for artist, album, plays in fake.top_counts(user, params.get('period', 'overall'))]
+    chunk, attr = _paged(items, params, user)
+    return {'topalbums': {'album': chunk, '@attr': attr}}
+
+def _top_tracks(fake: FakeLastFM, params: Dict[str, str]) -> Dict[str, Any]:
+    user = params['user']
+    items = [{
+        'name': artist['tracks'][album][0], 'playcount': str(plays), 'mbid': '', 'duration': '215',
+        'artist': {'name': artist['name'], 'mbid': '', 'url': ''},
+        'url': f"https://www.last.fm/music/{artist['name'].replace(' ', '+')}/_/{artist['tracks'][album][0].replace(' ', '+')}",
+        'image': fake.catalogue.images(f"{artist['name']}/{artist['albums'][album]}", artist['has_image'])
+    } for artist, album, plays in fake.top_counts(user, params.get('period', 'overall'))]
+    chunk, attr = _paged(items, params, user)
+    return {'toptracks': {'track': chunk, '@attr': attr}}
+
+def _user_info(fake: FakeLastFM, params: Dict[str, str]) -> Dict[str, Any]:
+    user = params['user']
+    registered = fake._synthetic_uts(max(0, fake.config.history_size - 1))
+    return {'user': {
+        'name': user, 'realname': '', 'url': f"https://www.last.fm/user/{user}",
+        'image': fake.catalogue.images(f"user/{user}"), 'country': 'None', 'age': '0',
+        'gender': 'n', 'subscriber': '0', 'playcount': str(fake.config.history_size),
+        'playlists': '0', 'bootstrap': '0',
+        'registered': {'unixtime': str(registered), '#text': registered}
+    }}
+
+def _artist_or_error(fake: FakeLastFM, params: Dict[str, str]):
+    artist = fake.catalogue.find(params['artist'])
+    if artist is None:
+        return None, {'error': ERROR_INVALID_PARAMETERS, 'message': 'The artist you supplied could not be found'}
+    return artist, None
+
+def _artist_info(fake: FakeLastFM, params: Dict[str, str]) -> Dict[str, Any]:
+    artist, error = _artist_or_error(fake, params)
+    if error:
+        return error
+    return {'artist': {
+        'name': artist['name'], 'mbid': '', 'url': f"https://www.last.fm/music/{artist['name'].replace(' ', '+')}",
+        'image': fake.catalogue.images(artist['name'], artist['has_image']),
+        'stats': {'listeners': str(artist['listeners']), 'playcount': str(artist['listeners'] * 12)},
+        'tags': {'tag': [{'name': tag, 'url': f"https://www.last.fm/tag/{tag}"} for tag in artist['tags']]},
+        'bio': {'summary': f"{artist['name']} is a synthetic artist."}
+    }}
+
+def _artist_top_tags(fake: FakeLastFM, params: Dict[str, str]) -> Dict[str, Any]:
+    artist, error = _artist_or_error(fake, params)
+    if error:
+        return error
+    return {'toptags': {'tag': [{'name': tag, 'count': 100 - i * 30, 'url': f"https://www.last.fm/tag/{tag}"}
+                                for i, tag in enumerate(artist['tags'])],
+                        '@attr': {'artist': artist['name']}}}
+
+def _album_info(fake: FakeLastFM, params: Dict[str, str]) -> Dict[str, Any]:
+    artist, error = _artist_or_error(fake, params)
+    if error:
+        return error
+    title = params['album']
+    if title.lower() not in (a.lower() for a in artist['albums']):
+        return {'error': ERROR_INVALID_PARAMETERS, 'message': 'Album not found'}
+    return {'album': {
+        'name': title, 'artist': artist['name'], 'mbid': '', 'listeners': str(artist['listeners'] // 3),
+        'playcount': str(artist['listeners']), 'url': '',
+        'image': fake.catalogue.images(f"{artist['name']}/{title}", artist['has_image'])
+    }}
+
+def _track_info(fake: FakeLastFM, params: Dict[str, str]) -> Dict[str, Any]:
+    artist, error = _artist_or_error(fake, params)
+    if error:
+        return error
+    name = params['track']
+    for index, tracks in enumerate(artist['tracks']):
+        if name.lower() in (t.lower() for t in tracks):
+            album = artist['albums'][index]
+            return {'track': {
+                'name': name, 'mbid': '', 'url': '', 'duration': '215000',
+                'listeners': str(artist['listeners'] // 5), 'playcount': str(artist['listeners']),
+                'artist': {'name': artist['name'], 'mbid': '', 'url': ''},
+                'album': {'artist': artist['name'], 'title': album, 'url': '',
+                          'image': fake.catalogue.images(f"{artist['name']}/{album}", artist['has_image'])},
+                'toptags': {'tag': [{'name': tag} for tag in artist['tags']]}
+            }}
+    return {'track': {'name': name, 'artist': {'name': artist['name']}, 'listeners': '0', 'playcount': '0'}}
+
+def _track_search(fake: FakeLastFM, params: Dict[str, str]) -> Dict[str, Any]:
+    query = params['track'].lower()
+    limit = min(max(_as_int(params.get('limit'), 30), 1), 100)
+    matches = []
+    for artist in fake.catalogue.artists:
+        for tracks in artist['tracks']:
+            for track in tracks:
+                if query in track.lower() or query in artist['name'].lower():
+                    matches.append({
+                        'name': track, 'artist': artist['name'], 'url': '', 'streamable': 'FIXME',
+                        'listeners': str(artist['listeners'] // 5), 'mbid': '',
+                        'image': fake.catalogue.images(artist['name'], artist['has_image'])
+                    })
+    return {'results': {
+        'opensearch:Query': {'#text': '', 'role': 'request', 'startPage': '1'},
+        'opensearch:totalResults': str(len(matches)),
+        'trackmatches': {'track': matches[:limit]}
+    }}
+
+def _scrobble(fake: FakeLastFM, params: Dict[str, str]) -> Dict[str, Any]:
+    error = _require_signature(params)
+    if error:
+        return error
+    user = _user_for_session(params)
+    indexed = 'artist[0]' in params
+    suffixes = [f"[{i}]" for i in range(50) if f"artist[{i}]" in params] if indexed else ['']
+    if not suffixes:
+        return _error(ERROR_INVALID_PARAMETERS)
+
+    now = time.time()
+    results, accepted = [], 0
+    for suffix in suffixes:
+        artist, track = params[f"artist{suffix}"], params[f"track{suffix}"]
+        album = params.get(f"album{suffix}", '')
+        uts = _as_int(params.get(f"timestamp{suffix}"), 0)
+        code, message = 0, ''
+        if uts < now - 14 * 86400:
+            code, message = 3, 'Timestamp failed filter'
+        elif uts > now + 300:
+            code, message = 4, 'Timestamp failed filter'
+        else:
+            accepted += 1
+            fake.record_scrobble(user, artist, track, album, uts)
+        results.append({
+            'artist': {'corrected': '0', '#text': artist},
+            'album': {'corrected': '0', '#text': album},
+            'albumArtist': {'corrected': '0', '#text': ''},
+            'track': {'corrected': '0', '#text': track},
+            'timestamp': str(uts),
+            'ignoredMessage': {'code': str(code), '#text': message}
+        })
+    return {'scrobbles': {
+        'scrobble': results if indexed else results[0],
+        '@attr': {'accepted': accepted, 'ignored': len(results) - accepted}
+    }}
+
+def _update_now_playing(fake: FakeLastFM, params: Dict[str, str]) -> Dict[str, Any]:
+    error = _require_signature(params)
+    if error:
+        return error
+    fake.set_now_playing(_user_for_session(params), params['artist'], params['track'], params.get('album', ''))
+    return {'nowplaying': {
+        'artist': {'corrected': '0', '#text': params['artist']},
+        'track': {'corrected': '0', '#text': params['track']},
+        'album': {'corrected': '0', '#text': params.get('album', '')},
+        'albumArtist': {'corrected': '0', '#text': ''},
+        'ignoredMessage': {'code': '0', '#text': ''}
+    }}
+
+def _get_session(fake: FakeLastFM, params: Dict[str, str]) -> Dict[str, Any]:
+    error = _require_signature(params, session=False)
+    if error:
+        return error
+    token = params['token']
+    user = token.split(':', 1)[1] if token.startswith('user:') else 'fakeuser'
+    return {'session': {'name': user, 'key': f"fake-sk-{user}", 'subscriber': 0}}
+
+_METHODS = {
+    'user.getRecentTracks': _recent_tracks,
+    'user.getTopArtists': _top_artists,
+    'user.getTopAlbums': _top_albums,
+    'user.getTopTracks': _top_tracks,
+    'user.getInfo': _user_info,
+    'artist.getInfo': _artist_info,
+    'artist.getTopTags': _artist_top_tags,
+    'album.getInfo': _album_info,
+    'track.getInfo': _track_info,
+    'track.search': _track_search,
+    'track.scrobble': _scrobble,
+    'track.updateNowPlaying': _update_now_playing,
+    'auth.getSession': _get_session,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', default='0', help='fixed:MS, uniform:MIN:MAX or lognormal:MEDIAN:SIGMA')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of calls answering a Last.fm error')
+    parser.add_argument('--error-codes', default='8,16', help='comma-separated Last.fm error codes to inject')
+    parser.add_argument('--http-error-rate', type=float, default=0.0, help='fraction of calls answering HTTP 503')
+    parser.add_argument('--stall-rate', type=float, default=0.0, help='fraction of calls that hang')
+    parser.add_argument('--stall-seconds', type=float, default=30.0)
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='requests/second before error 29 (0 = off)')
+    parser.add_argument('--rate-limit-burst', type=float, default=10.0)
+    parser.add_argument('--history-size', type=int, default=5000, help='synthetic scrobbles per user')
+    parser.add_argument('--artists', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    config = FakeLastFMConfig(
+        latency=args.latency, error_rate=args.error_rate,
+        error_codes=tuple(int(c) for c in args.error_codes.split(',') if c),
+        http_error_rate=args.http_error_rate, stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds, rate_limit=args.rate_limit,
+        rate_limit_burst=args.rate_limit_burst, history_size=args.history_size,
+        artists=args.artists, seed=args.seed
+    )
+    fake = FakeLastFM(args.host, args.port, config)
+    print(f"Fake Last.fm listening on {fake.url}")
+    try:
+        fake.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import io
+import csv
+import json
+import time
+import zlib
+import logging
+from typing import Optional, Dict, Any, Callable, Iterable, Iterator, Tuple
+from history_store import parse_recent_tracks, format_uts, field_text, DEFAULT_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024  # bytes of output buffered before each yield
+GZIP_LEVEL = 6
+GZIP_WBITS = 31  # zlib header-less stream with a gzip header and trailer
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_RETRY_DELAY = 2.0
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson'
+}
+FIELDS = ('uts', 'date', 'artist', 'track', 'album', 'url')
+
+Row = Tuple[int, str, str, str, str]  # (uts, artist, track, album, url)
+
+def _fetch_page(fetch: Callable[[Dict[str, Any]], Dict[str, Any]], params: Dict[str, Any],
+                max_retries: int, retry_delay: float) -> Dict[str, Any]:
+    """Fetch one page, retrying transient failures with linear backoff"""
+    for attempt in range(1, max_retries + 1):
+        try:
+            return fetch(params)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            logger.info(f"Export page {params['page']} failed (attempt {attempt}): {e}")
+            time.sleep(retry_delay * attempt)
+
+def remote_rows(fetch: Callable[[Dict[str, Any]], Dict[str, Any]], page_size: int = DEFAULT_PAGE_SIZE,
+                since: Optional[int] = None, until: Optional[int] = None,
+                max_retries: int = DEFAULT_MAX_RETRIES, retry_delay: float = DEFAULT_RETRY_DELAY) -> Iterator[Row]:
+    """
+    Page through user.getRecentTracks newest first, one page in memory at a time.
+
+    ``to`` is pinned when the export starts so scrobbles made meanwhile do
+    not shift later pages and repeat rows. Pages are only requested as the
+    consumer reads, so a slow download throttles the upstream requests.
+    A failed page is retried as in Backfill, since by then the response
+    headers and earlier rows have already been sent.
+
+    Args:
+        fetch: Called with extra user.getRecentTracks parameters (page,
+            limit, to, from) and returning the decoded response
+        page_size: Scrobbles per request
+        since: Only scrobbles at or after this Unix timestamp
+        until: Only scrobbles at or before this Unix timestamp
+        max_retries: Attempts per page before the export is abandoned
+        retry_delay: Seconds to wait after the first failure, growing linearly
+    """
+    params = {'limit': page_size, 'to': until if until is not None else int(time.time())}
+    if since is not None:
+        params['from'] = since
+
+    page, total_pages = 1, 1
+    while page <= total_pages:
+        data = _fetch_page(fetch, dict(params, page=page), max_retries, retry_delay)
+        scrobbles, _, attr = parse_recent_tracks(data)
+        total_pages = int(attr.get('totalPages') or 0)
+        for track in scrobbles:
+            yield (int(track['date']['uts']), field_text(track.get('artist')), track.get('name') or '',
+                   field_text(track.get('album')), track.get('url') or '')
+        page += 1
+
+class HistoryExport:
+    """
+    Scrobble rows encoded as CSV or NDJSON, streamed in fixed-size chunks.
+
+    Iterating yields bytes; rows are pulled from the source only as the
+    response is written, encoded into a small buffer and optionally gzipped
+    on the fly, so memory use does not grow with the length of the history
+    and a slow client applies backpressure all the way to the source.
+    """
+
+    def __init__(self, rows: Iterable[Row], fmt: str = 'csv', compress: bool = False,
+                 chunk_size: int = CHUNK_SIZE):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        self.rows = rows
+        self.fmt = fmt
+        self.compress = compress
+        self.chunk_size = chunk_size
+        self.count = 0
+
+    @property
+    def mimetype(self) -> str:
+        return 'application/gzip' if self.compress else FORMATS[self.fmt]
+
+    def filename(self, user: str) -> str:
+        """Download name such as 'scrobbles-alice.csv.gz'"""
+        return f"scrobbles-{user.lower()}.{self.fmt}" + ('.gz' if self.compress else '')
+
+    def _encoded(self) -> Iterator[bytes]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        if self.fmt == 'csv':
+            writer.writerow(FIELDS)
+        for uts, artist, track, album, url in self.rows:
+            if self.fmt == 'csv':
+                writer.writerow((uts, format_uts(uts), artist, track, album, url))
+            else:
+                buffer.write(json.dumps(dict(zip(FIELDS, (uts, format_uts(uts), artist, track, album, url))),
+                                        ensure_ascii=False))
+                buffer.write('\n')
+            self.count += 1
+            if buffer.tell() >= self.chunk_size:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+
+    def __iter__(self) -> Iterator[bytes]:
+        if not self.compress:
+            yield from self._encoded()
+            return
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, GZIP_WBITS)
+        for chunk in self._encoded():
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
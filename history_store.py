@@ -0,0 +1,490 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+from array import array
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Tuple, Callable, Iterator
+from sqlite_db import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 200  # Last.fm maximum for user.getRecentTracks
+DEFAULT_SYNC_INTERVAL = 60
+DEFAULT_MAX_DELTA_PAGES = 50
+DEFAULT_FILENAME = 'history.sqlite3'
+DEFAULT_SEARCH_LIMIT = 50
+SELECTIVE_MATCHES = 2000  # below this many text matches, read them directly and sort
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scrobbles (
+    id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    uts INTEGER NOT NULL,
+    artist TEXT NOT NULL,
+    track TEXT NOT NULL,
+    album TEXT NOT NULL DEFAULT '',
+    url TEXT NOT NULL DEFAULT '',
+    images TEXT NOT NULL DEFAULT '',
+    UNIQUE (user, uts, artist, track)
+);
+CREATE INDEX IF NOT EXISTS scrobbles_user_time ON scrobbles (user, uts);
+CREATE TABLE IF NOT EXISTS sync_state (
+    user TEXT PRIMARY KEY,
+    newest_uts INTEGER,
+    oldest_uts INTEGER,
+    remote_total INTEGER NOT NULL DEFAULT 0,
+    synced_at REAL NOT NULL DEFAULT 0,
+    now_playing TEXT
+);
+"""
+
+# External-content full-text index over scrobbles, kept in step by triggers.
+# Created on first search so a SQLite build without FTS5 only loses search
+_SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS scrobbles_fts USING fts5(
+    artist, track, album,
+    content='scrobbles', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS scrobbles_fts_insert AFTER INSERT ON scrobbles BEGIN
+    INSERT INTO scrobbles_fts (rowid, artist, track, album) VALUES (new.id, new.artist, new.track, new.album);
+END;
+CREATE TRIGGER IF NOT EXISTS scrobbles_fts_delete AFTER DELETE ON scrobbles BEGIN
+    INSERT INTO scrobbles_fts (scrobbles_fts, rowid, artist, track, album)
+    VALUES ('delete', old.id, old.artist, old.track, old.album);
+END;
+"""
+
+def parse_recent_tracks(data: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Split a user.getRecentTracks response into its parts.
+
+    Returns:
+        Tuple: (dated scrobbles, now-playing track or None, the '@attr' dict)
+    """
+    recent = data.get('recenttracks', {})
+    tracks = recent.get('track', [])
+    if isinstance(tracks, dict):
+        tracks = [tracks]
+
+    scrobbles, now_playing = [], None
+    for track in tracks:
+        if track.get('@attr', {}).get('nowplaying'):
+            now_playing = track
+        elif str(track.get('date', {}).get('uts', '')).isdigit():
+            scrobbles.append(track)
+    return scrobbles, now_playing, recent.get('@attr', {})
+
+def field_text(value: Any) -> str:
+    """Read a Last.fm field that is either a string or a {'#text': ...} dict"""
+    if isinstance(value, dict):
+        return value.get('#text') or value.get('name') or ''
+    return value or ''
+
+def search_terms(text: str) -> List[str]:
+    """Split a search box entry into words, dropping FTS query syntax"""
+    return re.findall(r'\w+', text or '')
+
+def encode_cursor(uts: int, row_id: int) -> str:
+    """Build the keyset cursor for the row after which the next page starts"""
+    return f"{uts}.{row_id}"
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """Parse a keyset cursor; raises ValueError if it is malformed"""
+    uts, row_id = cursor.split('.')
+    return int(uts), int(row_id)
+
+def format_uts(uts: int) -> str:
+    """Format a timestamp the way Last.fm does in recent tracks ('01 Jan 2025, 12:00')"""
+    return datetime.fromtimestamp(uts, timezone.utc).strftime('%d %b %Y, %H:%M')
+
+class HistoryStore:
+    """
+    Local per-user copy of scrobble history, synced incrementally.
+
+    The first sync stores the newest page of user.getRecentTracks; every
+    later sync asks Last.fm only for scrobbles since the newest stored one
+    (the ``from`` parameter), so a fresh history costs one small request.
+    ``oldest_uts`` marks where the contiguous local copy begins; older
+    pages are served by Last.fm until a backfill has filled them in.
+    Reads return tracks in the same shape as the Last.fm API.
+    """
+
+    def __init__(self, path: str, page_size: int = DEFAULT_PAGE_SIZE,
+                 sync_interval: float = DEFAULT_SYNC_INTERVAL,
+                 max_delta_pages: int = DEFAULT_MAX_DELTA_PAGES):
+        self.path = path
+        self.page_size = page_size
+        self.sync_interval = sync_interval
+        self.max_delta_pages = max_delta_pages
+        self._db = SQLiteDatabase(path, _SCHEMA)
+        self._search_index = None  # None until checked, then True/False for FTS5
+        self._listeners = []
+
+    @classmethod
+    def from_env(cls) -> 'HistoryStore':
+        """Create a store configured from environment variables"""
+        data_dir = os.environ.get('DATA_DIR', 'data')
+        return cls(
+            path=os.environ.get('HISTORY_DB_PATH') or os.path.join(data_dir, DEFAULT_FILENAME),
+            sync_interval=float(os.environ.get('HISTORY_SYNC_INTERVAL', DEFAULT_SYNC_INTERVAL))
+        )
+
+    @staticmethod
+    def _user(user: str) -> str:
+        # Last.fm user names are case-insensitive
+        return user.strip().lower()
+
+    def get_state(self, user: str) -> Optional[Dict[str, Any]]:
+        """Return the sync checkpoint for a user, or None if never synced"""
+        row = self._db.execute(
+            'SELECT newest_uts, oldest_uts, remote_total, synced_at, now_playing FROM sync_state WHERE user = ?',
+            (self._user(user),)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'newest_uts': row[0],
+            'oldest_uts': row[1],
+            'remote_total': row[2],
+            'synced_at': row[3],
+            'now_playing': json.loads(row[4]) if row[4] else None
+        }
+
+    def add_listener(self, listener: Callable[[sqlite3.Connection, str, List[tuple]], None]) -> None:
+        """
+        Register a callback for newly stored scrobbles.
+
+        The listener runs inside the insert transaction with the connection,
+        the user and the inserted rows as (user, uts, artist, track, album,
+        url, images) tuples, so derived data commits or rolls back with them.
+        """
+        self._listeners.append(listener)
+
+    def needs_sync(self, user: str) -> bool:
+        """Check whether the local history is older than the sync interval"""
+        state = self.get_state(user)
+        return state is None or time.time() - state['synced_at'] >= self.sync_interval
+
+    def add_tracks(self, user: str, tracks: List[Dict[str, Any]]) -> int:
+        """
+        Store scrobbles, ignoring ones already present.
+
+        Args:
+            user: Last.fm user name
+            tracks: Dated track entries from user.getRecentTracks
+
+        Returns:
+            int: Number of newly stored scrobbles
+        """
+        user = self._user(user)
+        rows = [(
+            user,
+            int(track['date']['uts']),
+            field_text(track.get('artist')),
+            track.get('name') or '',
+            field_text(track.get('album')),
+            track.get('url') or '',
+            json.dumps(track.get('image') or [], separators=(',', ':'))
+        ) for track in tracks]
+        if not rows:
+            return 0
+
+        with self._db.transaction() as conn:
+            inserted = []
+            for row in rows:
+                if conn.execute('INSERT OR IGNORE INTO scrobbles (user, uts, artist, track, album, url, images) '
+                                'VALUES (?, ?, ?, ?, ?, ?, ?)', row).rowcount:
+                    inserted.append(row)
+                elif row[5]:
+                    # Fill in the link and artwork of a scrobble recorded locally before it synced
+                    conn.execute("UPDATE scrobbles SET url = ?, images = ? WHERE user = ? AND uts = ? "
+                                 "AND artist = ? AND track = ? AND url = ''", (row[5], row[6]) + row[:4])
+            if inserted:
+                for listener in self._listeners:
+                    listener(conn, user, inserted)
+            return len(inserted)
+
+    def record_scrobble(self, user: str, artist: str, track: str, album: str, uts: int) -> bool:
+        """Store a scrobble Last.fm just accepted, ahead of the next sync"""
+        return self.record_scrobbles(user, [(artist, track, album, uts)]) == 1
+
+    def record_scrobbles(self, user: str, scrobbles: List[Tuple[str, str, str, int]]) -> int:
+        """Store (artist, track, album, uts) scrobbles Last.fm just accepted, in one transaction"""
+        return self.add_tracks(user, [{
+            'name': track,
+            'artist': {'#text': artist},
+            'album': {'#text': album},
+            'date': {'uts': str(uts)}
+        } for artist, track, album, uts in scrobbles])
+
+    def _save_state(self, user: str, newest_uts: Optional[int], oldest_uts: Optional[int],
+                    remote_total: int, now_playing: Optional[Dict[str, Any]]) -> None:
+        self._db.execute(
+            'INSERT OR REPLACE INTO sync_state (user, newest_uts, oldest_uts, remote_total, synced_at, now_playing) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (self._user(user), newest_uts, oldest_uts, remote_total, time.time(),
+             json.dumps(now_playing) if now_playing else None)
+        )
+
+    def sync(self, user: str, fetch: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Pull scrobbles newer than the last checkpoint.
+
+        Args:
+            user: Last.fm user name
+            fetch: Called with extra user.getRecentTracks parameters (page,
+                limit, from) and returning the decoded response
+
+        Returns:
+            Dict[str, int]: Pages fetched and scrobbles stored
+        """
+        state = self.get_state(user)
+        since = state['newest_uts'] if state else None
+
+        page, total_pages, inserted = 1, 1, 0
+        newest, oldest, now_playing, remote_total = None, None, None, 0
+        while page <= total_pages and page <= self.max_delta_pages:
+            params = {'page': page, 'limit': self.page_size}
+            if since is not None:
+                params['from'] = since
+            scrobbles, playing, attr = parse_recent_tracks(fetch(params))
+            if page == 1:
+                now_playing = playing
+                remote_total = int(attr.get('total') or 0)
+                total_pages = int(attr.get('totalPages') or 1)
+            inserted += self.add_tracks(user, scrobbles)
+
+            for track in scrobbles:
+                uts = int(track['date']['uts'])
+                newest = uts if newest is None else max(newest, uts)
+                oldest = uts if oldest is None else min(oldest, uts)
+            if since is None:
+                break  # first sync: the newest page only, older pages stay remote
+            page += 1
+
+        if state is None:
+            self._save_state(user, newest, oldest, remote_total, now_playing)
+        elif page <= total_pages:
+            # Too far behind to close the gap now: restart the contiguous
+            # range at what was fetched and leave the rest to a backfill
+            logger.warning(f"History delta for {user} exceeds {self.max_delta_pages} pages")
+            self._save_state(user, newest or state['newest_uts'], oldest or state['oldest_uts'],
+                             state['remote_total'] + inserted, now_playing)
+        else:
+            self._save_state(user, newest or state['newest_uts'], state['oldest_uts'],
+                             state['remote_total'] + inserted, now_playing)
+
+        return {'pages': min(page, total_pages), 'inserted': inserted}
+
+    def covered_count(self, user: str) -> int:
+        """Number of stored scrobbles in the contiguous range ending at the newest one"""
+        state = self.get_state(user)
+        if state is None or state['oldest_uts'] is None:
+            return 0
+        return self._db.execute(
+            'SELECT COUNT(*) FROM scrobbles WHERE user = ? AND uts >= ?',
+            (self._user(user), state['oldest_uts'])
+        ).fetchone()[0]
+
+    def extend_coverage(self, user: str, through_uts: int) -> None:
+        """
+        Mark everything stored up to ``through_uts`` as part of the contiguous range.
+
+        Called once a backfill has fetched every scrobble at or before
+        ``through_uts``; ignored if the range no longer reaches that point.
+
+        Args:
+            user: Last.fm user name
+            through_uts: The newest timestamp the backfill covered
+        """
+        with self._db.transaction() as conn:
+            count, oldest, newest = conn.execute(
+                'SELECT COUNT(*), MIN(uts), MAX(uts) FROM scrobbles WHERE user = ?', (self._user(user),)
+            ).fetchone()
+            if not count:
+                return
+            row = conn.execute('SELECT oldest_uts FROM sync_state WHERE user = ?', (self._user(user),)).fetchone()
+            if row is None:
+                # Backfilled before any sync: the next sync continues from the newest scrobble
+                conn.execute(
+                    'INSERT INTO sync_state (user, newest_uts, oldest_uts, remote_total, synced_at) '
+                    'VALUES (?, ?, ?, ?, 0)',
+                    (self._user(user), newest, oldest, count)
+                )
+            elif row[0] is None or row[0] <= through_uts:
+                conn.execute('UPDATE sync_state SET oldest_uts = ? WHERE user = ?', (oldest, self._user(user)))
+
+    def summary(self, user: str) -> Dict[str, Any]:
+        """Count stored scrobbles, distinct artists and albums, and the time span"""
+        count, artists, albums, oldest, newest = self._db.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT artist), COUNT(DISTINCT NULLIF(album, '')), MIN(uts), MAX(uts) "
+            'FROM scrobbles WHERE user = ?', (self._user(user),)
+        ).fetchone()
+        return {'scrobbles': count, 'artists': artists, 'albums': albums,
+                'oldest_uts': oldest, 'newest_uts': newest}
+
+    def timestamps(self, user: str) -> array:
+        """Return every stored scrobble time for a user as a compact int64 array, newest first"""
+        rows = self._db.execute('SELECT uts FROM scrobbles WHERE user = ? ORDER BY uts DESC', (self._user(user),))
+        return array('q', (uts for (uts,) in rows))
+
+    @staticmethod
+    def _row_track(uts: int, artist: str, track: str, album: str, url: str, images: str) -> Dict[str, Any]:
+        return {
+            'name': track,
+            'artist': {'#text': artist},
+            'album': {'#text': album},
+            'url': url,
+            'image': json.loads(images) if images else [],
+            'date': {'uts': str(uts), '#text': format_uts(uts)}
+        }
+
+    def _ensure_search_index(self) -> bool:
+        """Create the full-text index once, rebuilding it for rows stored before it existed"""
+        if self._search_index is not None:
+            return self._search_index
+        try:
+            conn = self._db.connection()
+            conn.executescript(_SEARCH_SCHEMA)
+            indexed = conn.execute('SELECT COUNT(*) FROM scrobbles_fts_docsize').fetchone()[0]
+            stored = conn.execute('SELECT COUNT(*) FROM scrobbles').fetchone()[0]
+            if indexed != stored:
+                logger.info(f"Rebuilding history search index ({indexed} of {stored} scrobbles indexed)")
+                conn.execute("INSERT INTO scrobbles_fts (scrobbles_fts) VALUES ('rebuild')")
+            self._search_index = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Full-text search unavailable, falling back to LIKE: {e}")
+            self._search_index = False
+        return self._search_index
+
+    def search(self, user: str, text: str = '', since: Optional[int] = None, until: Optional[int] = None,
+               limit: int = DEFAULT_SEARCH_LIMIT, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Search stored scrobbles newest first with keyset pagination.
+
+        Words in ``text`` must all appear (as prefixes) in the artist, track
+        or album. Pages continue from ``cursor`` rather than an offset, so
+        every page costs the same however deep it is.
+
+        Args:
+            user: Last.fm user name
+            text: Free-text query
+            since: Earliest timestamp to include
+            until: Latest timestamp to include
+            limit: Maximum number of tracks
+            cursor: ``next_cursor`` from the previous page
+
+        Returns:
+            Dict[str, Any]: 'tracks' in Last.fm shape and 'next_cursor' (None on the last page)
+        """
+        terms = search_terms(text)
+        # Earlier words match whole words; the last, possibly half-typed, is a prefix
+        match = ' '.join(f'"{term}"' for term in terms[:-1]) + (f' "{terms[-1]}"*' if terms else '')
+        use_index = bool(terms) and self._ensure_search_index()
+        selective = use_index and self._db.execute(
+            'SELECT COUNT(*) FROM (SELECT rowid FROM scrobbles_fts WHERE scrobbles_fts MATCH ? LIMIT ?)',
+            (match, SELECTIVE_MATCHES)
+        ).fetchone()[0] < SELECTIVE_MATCHES
+
+        # A rare query fetches its few matches by id and sorts them ('+user'
+        # keeps SQLite off the time index); a common one walks the (user, uts)
+        # index newest first and stops at the limit
+        conditions, params = ['+user = ?' if selective else 'user = ?'], [self._user(user)]
+        if since is not None:
+            conditions.append('uts >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append('uts <= ?')
+            params.append(until)
+        if cursor:
+            uts, row_id = decode_cursor(cursor)
+            conditions.append('(uts < ? OR (uts = ? AND id < ?))')
+            params.extend([uts, uts, row_id])
+
+        if use_index:
+            conditions.append('id IN (SELECT rowid FROM scrobbles_fts WHERE scrobbles_fts MATCH ?)')
+            params.append(match)
+        else:
+            for term in terms:
+                conditions.append("(artist LIKE ? ESCAPE '\\' OR track LIKE ? ESCAPE '\\' OR album LIKE ? ESCAPE '\\')")
+                pattern = '%' + term.replace('_', '\\_') + '%'  # \w+ words never contain % or backslashes
+                params.extend([pattern] * 3)
+
+        rows = self._db.execute(
+            f"SELECT id, uts, artist, track, album, url, images FROM scrobbles "
+            f"WHERE {' AND '.join(conditions)} ORDER BY uts DESC, id DESC LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+
+        next_cursor = encode_cursor(rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+        return {
+            'tracks': [self._row_track(*row[1:]) for row in rows[:limit]],
+            'next_cursor': next_cursor
+        }
+
+    def recent(self, user: str, limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Read stored scrobbles newest first.
+
+        Args:
+            user: Last.fm user name
+            limit: Maximum number of tracks
+            offset: Number of newest tracks to skip
+
+        Returns:
+            List[Dict[str, Any]]: Tracks shaped like user.getRecentTracks entries
+        """
+        rows = self._db.execute(
+            'SELECT uts, artist, track, album, url, images FROM scrobbles '
+            'WHERE user = ? ORDER BY uts DESC, id DESC LIMIT ? OFFSET ?',
+            (self._user(user), limit, offset)
+        ).fetchall()
+        return [self._row_track(*row) for row in rows]
+
+    def iter_rows(self, user: str, since: Optional[int] = None, until: Optional[int] = None,
+                  batch_size: int = 1000) -> Iterator[Tuple[int, str, str, str, str]]:
+        """
+        Stream stored scrobbles newest first without loading them all.
+
+        Rows are read in keyset-paginated batches, so memory stays flat and
+        no read transaction is held open between batches (a slow consumer
+        never blocks syncs and backfills).
+
+        Args:
+            user: Last.fm user name
+            since: Only scrobbles at or after this Unix timestamp
+            until: Only scrobbles at or before this Unix timestamp
+
+        Yields:
+            Tuple: (uts, artist, track, album, url)
+        """
+        user = self._user(user)
+        upper = (until if until is not None else 2 ** 62, 2 ** 62)
+        lower = since if since is not None else 0
+        while True:
+            rows = self._db.execute(
+                'SELECT uts, id, artist, track, album, url FROM scrobbles '
+                'WHERE user = ? AND uts >= ? AND (uts < ? OR (uts = ? AND id < ?)) '
+                'ORDER BY uts DESC, id DESC LIMIT ?',
+                (user, lower, upper[0], upper[0], upper[1], batch_size)
+            ).fetchall()
+            for uts, _, artist, track, album, url in rows:
+                yield uts, artist, track, album, url
+            if len(rows) < batch_size:
+                return
+            upper = rows[-1][:2]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return the number of synced users and stored scrobbles"""
+        stats = {'path': self.path, 'users': 0, 'scrobbles': 0}
+        if not self._db.exists():
+            return stats
+        try:
+            stats['users'] = self._db.execute('SELECT COUNT(*) FROM sync_state').fetchone()[0]
+            stats['scrobbles'] = self._db.execute('SELECT COUNT(*) FROM scrobbles').fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning(f"History stats unavailable: {e}")
+        return stats
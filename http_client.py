@@ -0,0 +1,109 @@
+import os
+import logging
+import threading
+from typing import Optional, Dict, Any, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10.0
+
+class HTTPClient:
+    """
+    Process-wide HTTP client with pooled keep-alive connections.
+
+    Wraps a single ``requests.Session`` per process so every upstream call
+    reuses already-open TCP/TLS connections instead of paying a new
+    handshake each time. The session is rebuilt after a fork, so a client
+    created before gunicorn forks its workers never shares sockets between
+    processes.
+    """
+
+    def __init__(self, pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 pool_block: bool = False):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_block = pool_block
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+
+    @classmethod
+    def from_env(cls) -> 'HTTPClient':
+        """Create a client configured from environment variables"""
+        return cls(
+            pool_connections=int(os.environ.get('LASTFM_POOL_CONNECTIONS', DEFAULT_POOL_CONNECTIONS)),
+            pool_maxsize=int(os.environ.get('LASTFM_POOL_MAXSIZE', DEFAULT_POOL_MAXSIZE)),
+            connect_timeout=float(os.environ.get('LASTFM_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)),
+            read_timeout=float(os.environ.get('LASTFM_READ_TIMEOUT', DEFAULT_READ_TIMEOUT)),
+        )
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        """(connect, read) timeout tuple passed to requests"""
+        return (self.connect_timeout, self.read_timeout)
+
+    def _build_session(self) -> requests.Session:
+        """Create a session with a pooled adapter mounted for both schemes"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+            max_retries=0
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        logger.debug(f"Created HTTP session for pid {os.getpid()} "
+                     f"(pools={self.pool_connections}, maxsize={self.pool_maxsize})")
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        """Return the session for the current process, creating it if needed"""
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    # Never close a session inherited from the parent process:
+                    # its sockets still belong to the parent.
+                    self._session = self._build_session()
+                    self._pid = pid
+        return self._session
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None,
+            timeout: Optional[Any] = None, **kwargs) -> requests.Response:
+        """Send a GET request over the pooled session"""
+        return self.session.get(url, params=params, timeout=timeout or self.timeout, **kwargs)
+
+    def post(self, url: str, data: Optional[Dict[str, Any]] = None,
+             timeout: Optional[Any] = None, **kwargs) -> requests.Response:
+        """Send a POST request over the pooled session"""
+        return self.session.post(url, data=data, timeout=timeout or self.timeout, **kwargs)
+
+    def close(self) -> None:
+        """Close pooled connections owned by this process"""
+        with self._lock:
+            if self._session is not None and self._pid == os.getpid():
+                self._session.close()
+            self._session = None
+            self._pid = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return the pool configuration for diagnostics"""
+        return {
+            'pool_connections': self.pool_connections,
+            'pool_maxsize': self.pool_maxsize,
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.read_timeout,
+            'active': self._session is not None and self._pid == os.getpid()
+        }
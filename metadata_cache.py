@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Optional, Dict, Any, Tuple
+from sqlite_db import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+# Slow-changing catalogue lookups worth keeping across restarts
+METADATA_METHODS = frozenset({'artist.getInfo', 'album.getInfo', 'track.getInfo'})
+
+DEFAULT_TTL = 30 * 86400
+DEFAULT_REFRESH_AFTER = 7 * 86400
+DEFAULT_PURGE_EVERY = 1000  # writes between sweeps of expired entries
+DEFAULT_DATA_DIR = 'data'
+DEFAULT_FILENAME = 'metadata_cache.sqlite3'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    method TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+class MetadataCache:
+    """
+    Persistent SQLite cache for artist, album and track info responses.
+
+    The database (see SQLiteDatabase) runs in WAL mode so every worker on
+    the node can read it concurrently while one writes, and is opened
+    lazily so importing the app never touches the disk. Entries live for
+    ``ttl`` seconds; once older than ``refresh_after`` they are still
+    served but reported as due for a background refresh. Every
+    ``purge_every`` writes by this instance also delete expired entries,
+    so the shared file stays bounded. Database errors are logged and
+    treated as misses.
+    """
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL,
+                 refresh_after: float = DEFAULT_REFRESH_AFTER,
+                 methods: frozenset = METADATA_METHODS,
+                 purge_every: int = DEFAULT_PURGE_EVERY):
+        self.path = path
+        self.ttl = ttl
+        self.refresh_after = refresh_after
+        self.methods = methods
+        self.purge_every = purge_every
+        self._db = SQLiteDatabase(path, _SCHEMA)
+        self._stats_lock = threading.Lock()
+        self._writes_since_purge = 0
+        self._stats = {'hits': 0, 'misses': 0, 'refreshes_due': 0, 'writes': 0,
+                       'expirations': 0, 'purged': 0, 'errors': 0}
+
+    @classmethod
+    def from_env(cls) -> 'MetadataCache':
+        """Create a cache configured from environment variables"""
+        data_dir = os.environ.get('DATA_DIR', DEFAULT_DATA_DIR)
+        return cls(
+            path=os.environ.get('METADATA_CACHE_PATH') or os.path.join(data_dir, DEFAULT_FILENAME),
+            ttl=float(os.environ.get('METADATA_CACHE_TTL_DAYS', DEFAULT_TTL / 86400)) * 86400,
+            refresh_after=float(os.environ.get('METADATA_REFRESH_DAYS', DEFAULT_REFRESH_AFTER / 86400)) * 86400
+        )
+
+    def handles(self, method: Optional[str]) -> bool:
+        """Check whether a Last.fm method is stored in this cache"""
+        return method in self.methods
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def get(self, key: str) -> Optional[Tuple[Any, bool]]:
+        """
+        Look up a stored response.
+
+        Args:
+            key: Cache key (see ResponseCache.make_key)
+
+        Returns:
+            Optional[Tuple[Any, bool]]: The response and whether it is due for
+            refresh, or None on miss or expiry
+        """
+        try:
+            row = self._db.connection().execute(
+                'SELECT payload, fetched_at, expires_at FROM metadata WHERE key = ?', (key,)
+            ).fetchone()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Metadata cache read failed: {e}")
+            self._count('errors')
+            return None
+
+        if row is None:
+            self._count('misses')
+            return None
+
+        payload, fetched_at, expires_at = row
+        now = time.time()
+        if now >= expires_at:
+            self._count('expirations')
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        refresh_due = now - fetched_at >= self.refresh_after
+        if refresh_due:
+            self._count('refreshes_due')
+        return json.loads(payload), refresh_due
+
+    def set(self, key: str, value: Any, method: str) -> bool:
+        """
+        Store or replace a response.
+
+        Args:
+            key: Cache key (see ResponseCache.make_key)
+            value: JSON-serializable response
+            method: Last.fm method the response belongs to
+
+        Returns:
+            bool: True if the value was written
+        """
+        if not self.handles(method):
+            return False
+
+        now = time.time()
+        try:
+            payload = json.dumps(value, separators=(',', ':'))
+            self._db.connection().execute(
+                'INSERT OR REPLACE INTO metadata (key, method, payload, fetched_at, expires_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, method, payload, now, now + self.ttl)
+            )
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Response not cacheable: {e}")
+            return False
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Metadata cache write failed: {e}")
+            self._count('errors')
+            return False
+
+        self._count('writes')
+        with self._stats_lock:
+            self._writes_since_purge += 1
+            purge_due = self._writes_since_purge >= self.purge_every
+            if purge_due:
+                self._writes_since_purge = 0
+        if purge_due:
+            self.purge_expired()
+        return True
+
+    def purge_expired(self) -> int:
+        """Delete expired entries and return how many were removed"""
+        try:
+            cursor = self._db.connection().execute('DELETE FROM metadata WHERE expires_at <= ?', (time.time(),))
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Metadata cache purge failed: {e}")
+            self._count('errors')
+            return 0
+        with self._stats_lock:
+            self._stats['purged'] += cursor.rowcount
+        return cursor.rowcount
+
+    def clear(self) -> None:
+        """Delete all stored entries"""
+        try:
+            self._db.connection().execute('DELETE FROM metadata')
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Metadata cache clear failed: {e}")
+            self._count('errors')
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters plus entry count and file size"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+
+        stats['path'] = self.path
+        stats['entries'] = 0
+        stats['bytes'] = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if stats['bytes']:
+            try:
+                stats['entries'] = self._db.connection().execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
+            except (sqlite3.Error, OSError):
+                pass
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
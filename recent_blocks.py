@@ -0,0 +1,197 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Callable
+from single_flight import SingleFlight
+from history_store import DEFAULT_PAGE_SIZE
+from track_record import TrackRecord, parse_track_records
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCK_SIZE = DEFAULT_PAGE_SIZE  # Last.fm maximum for user.getRecentTracks
+DEFAULT_TTL = 60.0  # how long page 1 keeps serving the same snapshot
+DEFAULT_IDLE_TTL = 900.0  # how long an unused snapshot's blocks stay valid
+DEFAULT_MAX_BLOCKS = 64
+DEFAULT_PREFETCH_MARGIN = 60  # tracks left in a block when the next one is fetched
+
+class RecentTracksBlocks:
+    """
+    Recent-tracks pages sliced out of cached 200-track upstream pages.
+
+    The infinite scroll asks for small pages; each upstream request instead
+    fetches a whole superblock (the largest page Last.fm allows) and the
+    client pages are cut from it. Each user has a snapshot pinned just past
+    their newest scrobble, taken from the synced local history when there
+    is one (an anchor) or else from an unbounded fetch of block 0; blocks
+    are requested with ``to`` set to it, so scrobbles made while scrolling
+    never shift the blocks and repeat tracks. When a page ends near the end
+    of its block the next block is fetched in the background. Blocks are
+    kept in a bounded LRU as TrackRecords, converted back to Last.fm's
+    shape only for the page being served; an unanchored snapshot is renewed
+    when page 1 is reloaded after the TTL or after it has sat unused.
+    """
+
+    def __init__(self, fetch: Callable[[str, Dict[str, Any], bool], Dict[str, Any]],
+                 block_size: int = DEFAULT_BLOCK_SIZE, ttl: float = DEFAULT_TTL,
+                 idle_ttl: float = DEFAULT_IDLE_TTL, max_blocks: int = DEFAULT_MAX_BLOCKS,
+                 prefetch_margin: int = DEFAULT_PREFETCH_MARGIN, prefetch_workers: int = 2):
+        self.fetch = fetch
+        self.block_size = block_size
+        self.ttl = ttl
+        self.idle_ttl = idle_ttl
+        self.max_blocks = max_blocks
+        self.prefetch_margin = prefetch_margin
+        self._lock = threading.Lock()
+        self._snapshots = {}  # user -> snapshot dict
+        self._blocks = OrderedDict()  # (user, to_uts, index) -> track records
+        self._flight = SingleFlight()
+        self._executor = ThreadPoolExecutor(max_workers=prefetch_workers, thread_name_prefix='recent-prefetch')
+        self._stats = {'hits': 0, 'misses': 0, 'prefetched': 0, 'prefetch_errors': 0, 'snapshots': 0}
+
+    @classmethod
+    def from_env(cls, fetch: Callable[[str, Dict[str, Any], bool], Dict[str, Any]]) -> 'RecentTracksBlocks':
+        """Create block caching configured from environment variables"""
+        return cls(
+            fetch,
+            ttl=float(os.environ.get('RECENT_BLOCK_TTL', DEFAULT_TTL)),
+            max_blocks=int(os.environ.get('RECENT_BLOCK_CACHE_SIZE', DEFAULT_MAX_BLOCKS))
+        )
+
+    @staticmethod
+    def _user(user: str) -> str:
+        return user.strip().lower()
+
+    def _store_block(self, key: tuple, tracks: List[TrackRecord]) -> None:
+        with self._lock:
+            self._blocks[key] = tracks
+            self._blocks.move_to_end(key)
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+
+    def _install(self, user: str, to_uts: int, total: int, now_playing: Optional[Dict[str, Any]],
+                 anchored: bool) -> Dict[str, Any]:
+        """Make a new snapshot current, dropping the previous snapshot's blocks"""
+        now = time.time()
+        snapshot = {'to_uts': to_uts, 'total': total, 'now_playing': now_playing,
+                    'anchored': anchored, 'created': now, 'used': now}
+        with self._lock:
+            old = self._snapshots.get(user)
+            self._snapshots[user] = snapshot
+            self._stats['snapshots'] += 1
+            if old is not None and old['to_uts'] != to_uts:
+                for key in [key for key in self._blocks if key[0] == user and key[1] == old['to_uts']]:
+                    del self._blocks[key]
+        return snapshot
+
+    def _new_snapshot(self, user: str) -> Dict[str, Any]:
+        """Fetch block 0 unbounded and pin the snapshot to its newest scrobble"""
+        scrobbles, now_playing, attr = parse_track_records(
+            self.fetch(user, {'limit': self.block_size, 'page': 1}, False)
+        )
+        to_uts = scrobbles[0].uts + 1 if scrobbles else int(time.time())
+        snapshot = self._install(user, to_uts, int(attr.get('total') or len(scrobbles)), now_playing, False)
+        self._store_block((user, to_uts, 0), scrobbles)
+        return snapshot
+
+    def _snapshot(self, user: str, page: int, anchor: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            snapshot = self._snapshots.get(user)
+        if anchor is not None:
+            if snapshot is None or snapshot['to_uts'] != anchor['to_uts'] or not snapshot['anchored']:
+                return self._install(user, anchor['to_uts'], anchor['total'], anchor.get('now_playing'), True)
+        elif snapshot is None or snapshot['anchored'] or now - snapshot['used'] > self.idle_ttl or \
+                (page == 1 and now - snapshot['created'] > self.ttl):
+            return self._flight.do(('snapshot', user), lambda: self._new_snapshot(user))
+        snapshot['used'] = now
+        return snapshot
+
+    def _block(self, user: str, snapshot: Dict[str, Any], index: int, background: bool = False) -> List[TrackRecord]:
+        """Return a cached block or fetch it (concurrent callers share one request)"""
+        key = (user, snapshot['to_uts'], index)
+        with self._lock:
+            tracks = self._blocks.get(key)
+            if tracks is not None:
+                self._blocks.move_to_end(key)
+                if not background:
+                    self._stats['hits'] += 1
+                return tracks
+            if not background:
+                self._stats['misses'] += 1
+
+        def load():
+            scrobbles, _, _ = parse_track_records(self.fetch(
+                user, {'limit': self.block_size, 'page': index + 1, 'to': snapshot['to_uts']}, background
+            ))
+            self._store_block(key, scrobbles)
+            return scrobbles
+
+        return self._flight.do(key, load)
+
+    def _prefetch(self, user: str, snapshot: Dict[str, Any], index: int) -> None:
+        with self._lock:
+            if (user, snapshot['to_uts'], index) in self._blocks:
+                return
+
+        def run():
+            try:
+                self._block(user, snapshot, index, background=True)
+                with self._lock:
+                    self._stats['prefetched'] += 1
+            except Exception as e:
+                with self._lock:
+                    self._stats['prefetch_errors'] += 1
+                logger.info(f"Recent tracks prefetch failed for {user} block {index}: {e}")
+
+        self._executor.submit(run)
+
+    def page(self, user: str, limit: int, page: int, anchor: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Read one client page of recent tracks.
+
+        Args:
+            user: Last.fm user name
+            limit: Tracks per client page
+            page: 1-based client page number
+            anchor: Optional 'to_uts', 'total' and 'now_playing' from a fresh
+                sync, used as the snapshot instead of fetching block 0
+
+        Returns:
+            Dict[str, Any]: 'tracks' (the now-playing track first on page 1),
+                'total_pages', 'current_page' and 'total_tracks'
+        """
+        user = self._user(user)
+        snapshot = self._snapshot(user, page, anchor)
+        total = snapshot['total']
+        start, end = (page - 1) * limit, min(page * limit, total)
+
+        tracks = []
+        if start < end:
+            first, last = start // self.block_size, (end - 1) // self.block_size
+            for index in range(first, last + 1):
+                offset = index * self.block_size
+                tracks.extend(record.to_lastfm() for record in
+                              self._block(user, snapshot, index)[max(start - offset, 0):end - offset])
+            next_index = last + 1
+            if next_index * self.block_size < total and next_index * self.block_size - end <= self.prefetch_margin:
+                self._prefetch(user, snapshot, next_index)
+        if page == 1 and snapshot['now_playing']:
+            tracks.insert(0, snapshot['now_playing'])
+
+        return {
+            'tracks': tracks,
+            'total_pages': max(1, -(-total // limit)),
+            'current_page': page,
+            'total_tracks': total
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return block hit/miss and prefetch counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['blocks'] = len(self._blocks)
+            stats['users'] = len(self._snapshots)
+        return stats
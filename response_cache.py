@@ -0,0 +1,197 @@
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# Per-method freshness in seconds. Methods not listed here are never cached.
+DEFAULT_METHOD_TTLS = {
+    'user.getTopArtists': 600,
+    'user.getTopTracks': 600,
+    'user.getTopAlbums': 600,
+    'user.getInfo': 3600,
+    'artist.getInfo': 86400,
+    'album.getInfo': 86400,
+    'track.getInfo': 86400,
+}
+
+# Never served fresh, but the last good response is kept as an outage fallback
+DEFAULT_STALE_ONLY_METHODS = frozenset({'user.getRecentTracks'})
+
+# Signed and mutating methods always go straight to Last.fm
+UNCACHEABLE_METHODS = frozenset({
+    'track.scrobble',
+    'track.updateNowPlaying',
+    'auth.getSession',
+})
+
+# Parameters that never take part in the cache key
+EXCLUDED_KEY_PARAMS = frozenset({'api_sig', 'sk', 'format'})
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_MAX_STALE = 24 * 3600
+
+class ResponseCache:
+    """
+    In-memory LRU cache of Last.fm responses with per-method TTLs.
+
+    Entries are stored as serialized JSON so that the memory cap can be
+    enforced on real payload sizes and so that callers always receive a
+    private copy they are free to mutate. Expired entries stay in the LRU
+    until evicted so get_stale() can fall back to them during outages.
+    """
+
+    def __init__(self, method_ttls: Optional[Dict[str, int]] = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 stale_methods: Optional[frozenset] = None,
+                 max_stale: float = DEFAULT_MAX_STALE):
+        self.method_ttls = dict(DEFAULT_METHOD_TTLS if method_ttls is None else method_ttls)
+        self.max_bytes = max_bytes
+        self.stale_methods = DEFAULT_STALE_ONLY_METHODS if stale_methods is None else stale_methods
+        self.max_stale = max_stale
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, payload)
+        self._bytes = 0
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0,
+                       'bypassed': 0, 'stale_hits': 0}
+
+    def is_cacheable(self, params: Dict[str, Any]) -> bool:
+        """Check whether a request may be served from or stored in the cache"""
+        method = params.get('method')
+        cacheable = method not in UNCACHEABLE_METHODS and self.method_ttls.get(method, 0) > 0
+        if not cacheable:
+            with self._lock:
+                self._stats['bypassed'] += 1
+        return cacheable
+
+    @staticmethod
+    def make_key(params: Dict[str, Any]) -> str:
+        """Build a normalized cache key from request parameters"""
+        normalized = sorted(
+            (str(k).strip(), str(v).strip())
+            for k, v in params.items()
+            if k not in EXCLUDED_KEY_PARAMS and v is not None
+        )
+        return json.dumps(normalized, separators=(',', ':'), ensure_ascii=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Get a fresh cached response.
+
+        Args:
+            key: Cache key from make_key()
+
+        Returns:
+            Optional[Any]: A copy of the cached response, or None on miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+
+            expires_at, payload = entry
+            if time.time() >= expires_at:
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+
+        return json.loads(payload)
+
+    def get_stale(self, key: str) -> Optional[Any]:
+        """
+        Get the last stored response even if it has expired.
+
+        Args:
+            key: Cache key from make_key()
+
+        Returns:
+            Optional[Any]: A copy of the response, or None if absent or older than max_stale
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, payload = entry
+            if time.time() >= expires_at + self.max_stale:
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats['stale_hits'] += 1
+
+        return json.loads(payload)
+
+    def set(self, key: str, value: Any, method: Optional[str] = None,
+            ttl: Optional[float] = None) -> bool:
+        """
+        Store a response.
+
+        Args:
+            key: Cache key from make_key()
+            value: JSON-serializable response
+            method: Last.fm method name used to look up the TTL
+            ttl: Explicit TTL in seconds, overriding the method TTL
+
+        Returns:
+            bool: True if the value was stored
+        """
+        if ttl is None:
+            ttl = self.method_ttls.get(method, 0)
+        if ttl <= 0:
+            if method not in self.stale_methods:
+                return False
+            ttl = 0  # stored only as a stale fallback
+
+        try:
+            payload = json.dumps(value, separators=(',', ':'))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Response not cacheable: {e}")
+            return False
+
+        size = len(payload)
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            while self._entries and self._bytes + size > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._stats['evictions'] += 1
+
+            self._entries[key] = (time.time() + ttl, payload)
+            self._bytes += size
+
+        return True
+
+    def _remove(self, key: str) -> None:
+        """Remove an entry and account for its size (lock must be held)"""
+        _, payload = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def clear(self) -> None:
+        """Drop all cached entries"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters and current size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            stats['max_bytes'] = self.max_bytes
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
@@ -0,0 +1,356 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import random
+import sqlite3
+import logging
+import threading
+from typing import Optional, Dict, Any, List, Tuple, Callable, Protocol
+from sqlite_db import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 50  # Last.fm maximum for one track.scrobble request
+DEFAULT_MAX_ATTEMPTS = 10
+DEFAULT_BASE_BACKOFF = 2.0
+DEFAULT_MAX_BACKOFF = 300.0
+DEFAULT_LEASE_SECONDS = 60.0  # a claimed batch is retried by any worker after this
+DEFAULT_POLL_INTERVAL = 5.0  # how often an idle flusher looks for due retries
+DEFAULT_RETENTION = 7 * 86400  # finished entries are kept this long for status lookups
+DEFAULT_DATA_DIR = 'data'
+DEFAULT_FILENAME = 'scrobble_queue.sqlite3'
+
+# Entry states
+QUEUED = 'queued'
+ACCEPTED = 'accepted'
+IGNORED = 'ignored'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scrobble_queue (
+    seq INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    user TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    session_key TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    track TEXT NOT NULL,
+    album TEXT NOT NULL DEFAULT '',
+    uts INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    queued_at REAL NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    finished_at REAL,
+    error TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS scrobble_queue_due ON scrobble_queue (status, next_attempt_at);
+"""
+
+class Cipher(Protocol):
+    """Symmetric encryption of strings, e.g. a TokenStore"""
+
+    def encrypt(self, data: str) -> str: ...
+
+    def decrypt(self, encrypted_data: str) -> str: ...
+
+def _session_id(session_key: str) -> str:
+    # Fernet output is randomized, so entries are grouped by a digest of the key
+    return hashlib.sha256(session_key.encode()).hexdigest()
+
+class _Pending:
+    """An enqueue waiting for the group commit that makes it durable"""
+    __slots__ = ('row', 'done', 'error')
+
+    def __init__(self, row: Tuple):
+        self.row = row
+        self.done = False
+        self.error = None
+
+class ScrobbleQueue:
+    """
+    Durable write-ahead queue between /scrobble and Last.fm.
+
+    An entry is acknowledged once it is committed to its own SQLite file
+    with synchronous=FULL, i.e. fsynced to the write-ahead log, so
+    scrobbles survive worker restarts and upstream outages. Concurrent
+    enqueues share commits: while one commit is being synced, new entries
+    gather and the next caller commits them all at once. A flusher thread
+    per worker process (start) drains due entries in batches of up to
+    ``batch_size`` for one user and session key through ``send``; batches
+    are claimed with a lease as in Backfill, so several workers can flush
+    safely and a batch abandoned by a crashed worker is picked up again
+    (delivery is at least once). Session keys are stored encrypted with
+    ``cipher`` (the TokenStore's key in the app) and cleared once their
+    entry is finished. ``send(user, session_key, tracks)`` takes (artist, track, album, uts)
+    tuples and returns one result dict per track with at least 'accepted'
+    and 'ignored_message'. Failures for which ``retryable`` is true are
+    retried with exponential backoff up to ``max_attempts``; others fail
+    the batch at once. Every entry's status can be read by its id.
+    """
+
+    def __init__(self, path: str, send: Callable[[str, str, List[Tuple[str, str, str, int]]], List[Dict[str, Any]]],
+                 cipher: Cipher,
+                 retryable: Callable[[Exception], bool] = lambda error: True,
+                 batch_size: int = DEFAULT_BATCH_SIZE, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 base_backoff: float = DEFAULT_BASE_BACKOFF, max_backoff: float = DEFAULT_MAX_BACKOFF,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 retention: float = DEFAULT_RETENTION):
+        self.path = path
+        self.send = send
+        self.cipher = cipher
+        self.retryable = retryable
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._db = SQLiteDatabase(path, _SCHEMA, synchronous='FULL')
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._commit_lock = threading.Condition()
+        self._pending = []
+        self._committing = False
+        self._wake = threading.Event()
+        self._flusher = None
+        self._flusher_pid = None
+        self._lock = threading.Lock()
+        self._stats = {'enqueued': 0, 'commits': 0, 'batches': 0, 'accepted': 0, 'ignored': 0,
+                       'retries': 0, 'failed': 0}
+
+    @classmethod
+    def from_env(cls, send: Callable[[str, str, List[Tuple[str, str, str, int]]], List[Dict[str, Any]]],
+                 cipher: Cipher,
+                 retryable: Callable[[Exception], bool] = lambda error: True) -> 'ScrobbleQueue':
+        """Create a queue configured from environment variables"""
+        data_dir = os.environ.get('DATA_DIR', DEFAULT_DATA_DIR)
+        return cls(
+            path=os.environ.get('SCROBBLE_QUEUE_PATH') or os.path.join(data_dir, DEFAULT_FILENAME),
+            send=send,
+            cipher=cipher,
+            retryable=retryable,
+            max_attempts=int(os.environ.get('SCROBBLE_QUEUE_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)),
+            max_backoff=float(os.environ.get('SCROBBLE_QUEUE_MAX_BACKOFF', DEFAULT_MAX_BACKOFF))
+        )
+
+    @staticmethod
+    def _user(user: str) -> str:
+        return user.strip().lower()
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += n
+
+    def _commit(self, batch: List[_Pending]) -> None:
+        try:
+            with self._db.transaction() as conn:
+                conn.executemany(
+                    'INSERT INTO scrobble_queue (id, user, session_id, session_key, artist, track, album, uts, '
+                    'status, queued_at, next_attempt_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [entry.row for entry in batch]
+                )
+            self._count('commits')
+        except (sqlite3.Error, OSError) as e:
+            for entry in batch:
+                entry.error = e
+
+    def enqueue(self, user: str, session_key: str, artist: str, track: str, album: str, uts: int) -> str:
+        """
+        Durably queue a scrobble for sending.
+
+        Args:
+            user: Last.fm user name
+            session_key: The user's session key, used to sign the request
+            artist: Artist name
+            track: Track name
+            album: Album name, or ''
+            uts: Scrobble time as a Unix timestamp
+
+        Returns:
+            str: The entry id for status lookups
+
+        Raises:
+            sqlite3.Error, OSError: The entry could not be stored
+        """
+        now = time.time()
+        entry_id = uuid.uuid4().hex
+        entry = _Pending((entry_id, self._user(user), _session_id(session_key), self.cipher.encrypt(session_key),
+                          artist, track, album or '', int(uts), QUEUED, now, now))
+        with self._commit_lock:
+            self._pending.append(entry)
+            while not entry.done:
+                if self._committing:
+                    self._commit_lock.wait()
+                    continue
+                # Commit everything gathered so far, ours included, in one sync
+                batch, self._pending = self._pending, []
+                self._committing = True
+                self._commit_lock.release()
+                try:
+                    self._commit(batch)
+                finally:
+                    self._commit_lock.acquire()
+                    self._committing = False
+                    for pending in batch:
+                        pending.done = True
+                    self._commit_lock.notify_all()
+        if entry.error is not None:
+            raise entry.error
+        self._count('enqueued')
+        self._wake.set()
+        return entry_id
+
+    def _claim(self) -> Optional[Tuple[str, str, List[Tuple]]]:
+        """Lease the oldest due batch: (user, session key, entry rows)"""
+        now = time.time()
+        with self._db.transaction() as conn:
+            head = conn.execute(
+                'SELECT user, session_id, session_key FROM scrobble_queue WHERE status = ? '
+                'AND next_attempt_at <= ? AND lease_until < ? ORDER BY seq LIMIT 1', (QUEUED, now, now)
+            ).fetchone()
+            if head is None:
+                return None
+            rows = conn.execute(
+                'SELECT seq, artist, track, album, uts, attempts FROM scrobble_queue WHERE user = ? '
+                'AND session_id = ? AND status = ? AND next_attempt_at <= ? AND lease_until < ? '
+                'ORDER BY seq LIMIT ?', head[:2] + (QUEUED, now, now, self.batch_size)
+            ).fetchall()
+            conn.executemany('UPDATE scrobble_queue SET lease_owner = ?, lease_until = ? WHERE seq = ?',
+                             [(self._owner, now + self.lease_seconds, row[0]) for row in rows])
+        return head[0], head[2], rows
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _finish(self, rows: List[Tuple], results: List[Dict[str, Any]]) -> None:
+        now = time.time()
+        updates = []
+        for row, result in zip(rows, results):
+            status = ACCEPTED if result.get('accepted') else IGNORED
+            self._count(status)
+            updates.append((status, row[5] + 1, now, result.get('ignored_message') or None,
+                            json.dumps(result, separators=(',', ':')), row[0]))
+        for row in rows[len(results):]:
+            self._count('failed')
+            updates.append((FAILED, row[5] + 1, now, 'No result from Last.fm', None, row[0]))
+        with self._db.transaction() as conn:
+            conn.executemany(
+                "UPDATE scrobble_queue SET status = ?, attempts = ?, finished_at = ?, error = ?, result = ?, "
+                "session_key = '', lease_until = 0 WHERE seq = ?", updates
+            )
+
+    def _fail(self, rows: List[Tuple], error: Exception) -> None:
+        now = time.time()
+        retry = self.retryable(error)
+        updates = []
+        for row in rows:
+            attempts = row[5] + 1
+            if retry and attempts < self.max_attempts:
+                self._count('retries')
+                updates.append((QUEUED, attempts, now + self._backoff(attempts), None, str(error), False, row[0]))
+            else:
+                self._count('failed')
+                updates.append((FAILED, attempts, now, now, str(error), True, row[0]))
+        with self._db.transaction() as conn:
+            conn.executemany(
+                "UPDATE scrobble_queue SET status = ?, attempts = ?, next_attempt_at = ?, finished_at = ?, "
+                "error = ?, session_key = CASE WHEN ? THEN '' ELSE session_key END, lease_until = 0 "
+                "WHERE seq = ?", updates
+            )
+
+    def flush(self) -> int:
+        """
+        Send every due entry now, one batch per request.
+
+        Returns:
+            int: Number of entries sent or given up on
+        """
+        handled = 0
+        while True:
+            claimed = self._claim()
+            if claimed is None:
+                break
+            user, session_key, rows = claimed
+            if not rows:
+                break
+            self._count('batches')
+            try:
+                results = self.send(user, self.cipher.decrypt(session_key), [row[1:5] for row in rows])
+            except Exception as e:
+                logger.warning(f"Scrobble batch of {len(rows)} for {user} failed: {e}")
+                self._fail(rows, e)
+            else:
+                self._finish(rows, results)
+            handled += len(rows)
+        self._db.execute('DELETE FROM scrobble_queue WHERE status != ? AND finished_at < ?',
+                         (QUEUED, time.time() - self.retention))
+        return handled
+
+    def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                self.flush()
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"Scrobble queue flush failed: {e}")
+            self._wake.wait(self.poll_interval)
+
+    def start(self) -> None:
+        """Start this process's flusher thread if it is not running"""
+        pid = os.getpid()
+        if self._flusher_pid == pid and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher_pid != pid or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._run, name='scrobble-flusher', daemon=True)
+                self._flusher_pid = pid
+                self._flusher.start()
+
+    def status(self, user: str, entry_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Read the state of one queued scrobble.
+
+        Args:
+            user: Last.fm user name the entry must belong to
+            entry_id: Id returned by enqueue
+
+        Returns:
+            Optional[Dict[str, Any]]: 'id', 'status' (queued, accepted,
+                ignored or failed), 'artist', 'track', 'album', 'timestamp',
+                'attempts', 'queued_at', 'next_attempt_at' while queued,
+                'finished_at', 'error' and Last.fm's per-track 'result'; None
+                if there is no such entry for the user
+        """
+        row = self._db.execute(
+            'SELECT id, status, artist, track, album, uts, attempts, queued_at, next_attempt_at, finished_at, '
+            'error, result FROM scrobble_queue WHERE id = ? AND user = ?', (entry_id, self._user(user))
+        ).fetchone()
+        if row is None:
+            return None
+        status = dict(zip(('id', 'status', 'artist', 'track', 'album', 'timestamp', 'attempts', 'queued_at',
+                           'next_attempt_at', 'finished_at', 'error', 'result'), row))
+        status['result'] = json.loads(status['result']) if status['result'] else None
+        if status['status'] != QUEUED:
+            del status['next_attempt_at']
+        return status
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return enqueue/commit/send counters and entries by status"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['flusher'] = self._flusher is not None and self._flusher_pid == os.getpid() and self._flusher.is_alive()
+        stats['entries'] = {}
+        if self._db.exists():
+            try:
+                stats['entries'] = dict(self._db.execute(
+                    'SELECT status, COUNT(*) FROM scrobble_queue GROUP BY status').fetchall())
+            except sqlite3.Error as e:
+                logger.warning(f"Scrobble queue stats unavailable: {e}")
+        return stats
@@ -0,0 +1,145 @@
+import copy
+import asyncio
+import logging
+import threading
+from typing import Callable, Awaitable, Dict, Any, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+class _Call:
+    """An in-flight call that followers wait on"""
+    __slots__ = ('done', 'result', 'error', 'followers', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+        self.waiters = []  # (loop, future) of async followers
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into one execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive with the same key while it is still running block until it
+    finishes and receive a copy of its result, or the same exception.
+    When there were followers the leader receives a copy as well, so no
+    caller can mutate an object another caller is still copying.
+    Threads (do) and coroutines (do_async) share one set of in-flight
+    calls, so a sync and an async request for the same key are coalesced.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'executed': 0, 'coalesced': 0, 'shared_errors': 0}
+
+    def _join(self, key: Hashable, loop: asyncio.AbstractEventLoop = None) -> Tuple[_Call, bool, Any]:
+        """Find or start the call for key: (call, is leader, waiter future)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self._stats['coalesced'] += 1
+                waiter = None
+                if loop is not None:
+                    waiter = loop.create_future()
+                    call.waiters.append((loop, waiter))
+                return call, False, waiter
+            call = _Call()
+            self._calls[key] = call
+            self._stats['executed'] += 1
+            return call, True, None
+
+    def _follow(self, call: _Call) -> Any:
+        """A follower's share of a finished call"""
+        if call.error is not None:
+            with self._lock:
+                self._stats['shared_errors'] += 1
+            raise call.error
+        return copy.deepcopy(call.result)
+
+    def _finish(self, key: Hashable, call: _Call) -> Any:
+        """Release the followers of a finished call and return the leader's result"""
+        with self._lock:
+            del self._calls[key]
+            followers = call.followers
+        call.done.set()
+        for loop, waiter in call.waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                pass  # the follower's loop has already closed
+        if followers:
+            logger.debug(f"Coalesced {followers} identical calls")
+        if call.error is not None:
+            return None
+        # Once shared, call.result is only read (copied) by followers; the
+        # leader gets its own copy so it can mutate it while they copy theirs
+        return copy.deepcopy(call.result) if followers else call.result
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn once for all concurrent callers with the same key.
+
+        Args:
+            key: Identity of the call, e.g. a response cache key
+            fn: Zero-argument callable performing the work
+
+        Returns:
+            Any: The result of fn
+        """
+        call, leader, _ = self._join(key)
+        if not leader:
+            call.done.wait()
+            return self._follow(call)
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            result = self._finish(key, call)
+        return result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Coroutine version of do(): await fn() once for all concurrent callers.
+
+        Followers wait without blocking the event loop, whether the leader
+        is a coroutine or a thread.
+
+        Args:
+            key: Identity of the call, e.g. a response cache key
+            fn: Zero-argument coroutine function performing the work
+
+        Returns:
+            Any: The result of fn
+        """
+        call, leader, waiter = self._join(key, asyncio.get_running_loop())
+        if not leader:
+            await waiter
+            return self._follow(call)
+
+        try:
+            call.result = await fn()
+        except BaseException as e:
+            # A cancelled leader hands its followers an error, not a None result
+            call.error = e if isinstance(e, Exception) else RuntimeError('Coalesced call was cancelled')
+            raise
+        finally:
+            result = self._finish(key, call)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return counters for executed and saved calls"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        return stats
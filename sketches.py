@@ -0,0 +1,321 @@
+import math
+import json
+import time
+import zlib
+import hashlib
+import sqlite3
+import logging
+from datetime import datetime, timezone
+from collections import Counter
+from typing import Optional, Dict, Any, List, Tuple, Iterable
+from sqlite_db import SQLiteDatabase
+from history_store import HistoryStore
+
+logger = logging.getLogger(__name__)
+
+# Bump when the sketch encoding or parameters change; users stored under
+# another version are rebuilt from their scrobbles on next use
+SKETCHES_VERSION = 1
+
+HLL_PRECISION = 11  # 2048 one-byte registers: ~2.3% standard error
+HEAVY_HITTER_CAPACITY = 200  # counters per heavy-hitter summary
+KEY_SEPARATOR = '\x1f'
+
+# Sketch kinds stored per user and month
+UNIQUE_KINDS = ('artist', 'album')
+HEAVY_KINDS = ('top_artist', 'top_track')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sketch_state (
+    user TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sketches (
+    user TEXT NOT NULL,
+    month INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (user, month, kind)
+) WITHOUT ROWID;
+"""
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+class HyperLogLog:
+    """
+    Distinct-count sketch with 2^precision one-byte registers.
+
+    The relative standard error of ``count()`` is 1.04 / sqrt(2^precision)
+    (about 2.3% at the default precision), independent of how many items
+    were added. Sketches with the same precision merge losslessly by
+    taking the register-wise maximum, so per-month sketches combine into
+    an estimate for any run of months.
+    """
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: Optional[bytes] = None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    @property
+    def relative_error(self) -> float:
+        """Relative standard error of count()"""
+        return 1.04 / math.sqrt(self.size)
+
+    def add(self, value: str) -> None:
+        hashed = _hash64(value)
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge HyperLogLog sketches of different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            # Small cardinalities: linear counting is far more accurate
+            estimate = self.size * math.log(self.size / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(bytes([self.precision]) + bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        raw = zlib.decompress(data)
+        return cls(raw[0], raw[1:])
+
+class HeavyHitters:
+    """
+    Mergeable heavy-hitter summary (Misra-Gries, the dual of space-saving)
+    keeping at most ``capacity`` counters.
+
+    Counts are never overestimated, and each is short of the true count by
+    at most ``max_error`` = (total - sum of kept counts) / (capacity + 1),
+    which is never more than total / (capacity + 1). Summaries merge by
+    adding counters and, when more than ``capacity`` remain, subtracting
+    the (capacity + 1)-th largest count from every counter; the bound
+    holds for merged summaries (Agarwal et al., Mergeable Summaries), so
+    per-month summaries combine into a summary of any run of months.
+    """
+
+    def __init__(self, capacity: int = HEAVY_HITTER_CAPACITY, counts: Optional[Dict[str, int]] = None,
+                 total: int = 0):
+        self.capacity = capacity
+        self.counts = dict(counts or {})
+        self.total = total
+
+    def update(self, counts: Dict[str, int]) -> 'HeavyHitters':
+        """Add exact play counts for many keys"""
+        return self.merge(HeavyHitters(len(counts), counts, sum(counts.values())))
+
+    def merge(self, other: 'HeavyHitters') -> 'HeavyHitters':
+        merged = Counter(self.counts)
+        merged.update(other.counts)
+        if len(merged) > self.capacity:
+            ranked = merged.most_common()
+            floor = ranked[self.capacity][1]
+            merged = {key: plays - floor for key, plays in ranked[:self.capacity] if plays > floor}
+        self.counts = dict(merged)
+        self.total += other.total
+        return self
+
+    @property
+    def max_error(self) -> int:
+        """Largest amount by which any count may fall short"""
+        return (self.total - sum(self.counts.values())) // (self.capacity + 1)
+
+    def top(self, limit: int) -> List[Tuple[str, int]]:
+        """(key, estimated count) pairs, largest first"""
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(json.dumps([self.capacity, self.total, self.counts],
+                                        separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HeavyHitters':
+        capacity, total, counts = json.loads(zlib.decompress(data))
+        return cls(capacity, counts, total)
+
+def _month_index(uts: int) -> int:
+    """Calendar month (years * 12 + month - 1, UTC) of a Unix timestamp"""
+    when = datetime.fromtimestamp(uts, timezone.utc)
+    return when.year * 12 + when.month - 1
+
+def _month_label(month: int) -> str:
+    return f"{month // 12:04d}-{month % 12 + 1:02d}"
+
+def _sketch(kind: str, data: Optional[bytes] = None):
+    if kind in UNIQUE_KINDS:
+        return HyperLogLog.from_bytes(data) if data else HyperLogLog()
+    return HeavyHitters.from_bytes(data) if data else HeavyHitters()
+
+class ListeningSketches:
+    """
+    Fixed-size per-user, per-month listening sketches for approximate stats.
+
+    Registered as a HistoryStore listener like ListeningAggregates, it
+    folds every batch of new scrobbles into a HyperLogLog of distinct
+    artists and albums and a heavy-hitter summary of artist and track
+    plays for each UTC calendar month the batch touches. A month costs a
+    few kilobytes whatever the listening volume, and any range of months
+    is answered by merging that many sketches, so unique counts and top
+    lists stay cheap on histories far too large to count exactly. Error
+    bounds: distinct counts have a relative standard error of
+    1.04 / sqrt(2^HLL_PRECISION) (about 2.3%); heavy-hitter play counts
+    are lower bounds at most HeavyHitters.max_error short. Users stored
+    under another SKETCHES_VERSION are rebuilt from their scrobbles.
+    """
+
+    def __init__(self, history_store: HistoryStore):
+        self.history_store = history_store
+        self._db = SQLiteDatabase(history_store.path, _SCHEMA)
+        self._tables_ready = False
+        history_store.add_listener(self._on_insert)
+
+    @staticmethod
+    def _user(user: str) -> str:
+        return user.strip().lower()
+
+    def _version(self, conn: sqlite3.Connection, user: str) -> Optional[int]:
+        row = conn.execute('SELECT version FROM sketch_state WHERE user = ?', (user,)).fetchone()
+        return row[0] if row else None
+
+    def _apply(self, conn: sqlite3.Connection, user: str, rows: Iterable[Tuple]) -> None:
+        """Fold (user, uts, artist, track, album, ...) rows into the months they fall in"""
+        by_month = {}
+        for row in rows:
+            month = by_month.setdefault(_month_index(row[1]), {
+                'artist': set(), 'album': set(), 'top_artist': Counter(), 'top_track': Counter()
+            })
+            month['artist'].add(row[2])
+            if row[4]:
+                month['album'].add(row[2] + KEY_SEPARATOR + row[4])
+            month['top_artist'][row[2]] += 1
+            month['top_track'][row[2] + KEY_SEPARATOR + row[3]] += 1
+
+        for month, batch in by_month.items():
+            stored = dict(conn.execute('SELECT kind, data FROM sketches WHERE user = ? AND month = ?',
+                                       (user, month)).fetchall())
+            updated = []
+            for kind, values in batch.items():
+                sketch = _sketch(kind, stored.get(kind))
+                if kind in UNIQUE_KINDS:
+                    for value in values:
+                        sketch.add(value)
+                else:
+                    sketch.update(values)
+                updated.append((user, month, kind, sketch.to_bytes()))
+            conn.executemany('INSERT OR REPLACE INTO sketches (user, month, kind, data) VALUES (?, ?, ?, ?)',
+                             updated)
+        conn.execute('UPDATE sketch_state SET updated_at = ? WHERE user = ?', (time.time(), user))
+
+    def _rebuild(self, conn: sqlite3.Connection, user: str) -> None:
+        """Recompute a user's sketches from every stored scrobble"""
+        conn.execute('DELETE FROM sketches WHERE user = ?', (user,))
+        conn.execute('INSERT OR REPLACE INTO sketch_state (user, version, updated_at) VALUES (?, ?, ?)',
+                     (user, SKETCHES_VERSION, time.time()))
+        rows = conn.execute('SELECT user, uts, artist, track, album FROM scrobbles WHERE user = ?', (user,)).fetchall()
+        if rows:
+            self._apply(conn, user, rows)
+        logger.info(f"Rebuilt listening sketches for {user} from {len(rows)} scrobbles")
+
+    def _on_insert(self, conn: sqlite3.Connection, user: str, rows: List[Tuple]) -> None:
+        if not self._tables_ready:
+            # Same transaction as the insert, see ListeningAggregates._on_insert
+            for statement in filter(str.strip, _SCHEMA.split(';')):
+                conn.execute(statement)
+            self._tables_ready = True
+        if self._version(conn, user) != SKETCHES_VERSION:
+            self._rebuild(conn, user)  # already includes the new rows
+        else:
+            self._apply(conn, user, rows)
+
+    def _ensure_current(self, user: str) -> None:
+        if self._version(self._db.connection(), user) != SKETCHES_VERSION:
+            with self._db.transaction() as conn:
+                if self._version(conn, user) != SKETCHES_VERSION:
+                    self._rebuild(conn, user)
+
+    def summary(self, user: str, since: Optional[int] = None, until: Optional[int] = None,
+                limit: int = 10) -> Dict[str, Any]:
+        """
+        Estimate distinct counts and most played entries for a date range.
+
+        The range is widened to whole UTC calendar months, whose sketches
+        are merged.
+
+        Args:
+            user: Last.fm user name
+            since: Range start as a Unix timestamp, or None for the first month
+            until: Range end as a Unix timestamp, or None for the last month
+            limit: Maximum number of top artists and tracks
+
+        Returns:
+            Dict[str, Any]: 'from'/'to' months ('YYYY-MM', None when empty),
+                'scrobbles', 'unique_artists', 'unique_albums', 'top_artists'
+                and 'top_tracks' (shaped like ListeningAggregates.top, with
+                plays as lower bounds) and 'error' holding the bounds:
+                'unique_relative' (standard error of the unique counts) and
+                'top_artist_plays' / 'top_track_plays' (maximum shortfall)
+        """
+        user = self._user(user)
+        self._ensure_current(user)
+        first = _month_index(since) if since is not None else 0
+        last = _month_index(until) if until is not None else 1 << 31
+
+        merged = {kind: _sketch(kind) for kind in UNIQUE_KINDS + HEAVY_KINDS}
+        months = set()
+        for month, kind, data in self._db.execute(
+                'SELECT month, kind, data FROM sketches WHERE user = ? AND month BETWEEN ? AND ?',
+                (user, first, last)):
+            months.add(month)
+            merged[kind].merge(_sketch(kind, data))
+
+        def entries(kind):
+            result = []
+            for key, plays in merged[kind].top(limit):
+                artist, _, name = key.partition(KEY_SEPARATOR)
+                entry = {'artist': artist, 'plays': plays}
+                if kind != 'top_artist':
+                    entry['name'] = name
+                result.append(entry)
+            return result
+
+        return {
+            'from': _month_label(min(months)) if months else None,
+            'to': _month_label(max(months)) if months else None,
+            'scrobbles': merged['top_artist'].total,
+            'unique_artists': merged['artist'].count(),
+            'unique_albums': merged['album'].count(),
+            'top_artists': entries('top_artist'),
+            'top_tracks': entries('top_track'),
+            'error': {
+                'unique_relative': round(merged['artist'].relative_error, 4),
+                'top_artist_plays': merged['top_artist'].max_error,
+                'top_track_plays': merged['top_track'].max_error
+            }
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return the number of users and stored sketches and their total size"""
+        stats = {'version': SKETCHES_VERSION, 'users': 0, 'sketches': 0, 'bytes': 0}
+        if self._db.exists():
+            try:
+                stats['users'] = self._db.execute('SELECT COUNT(*) FROM sketch_state').fetchone()[0]
+                stats['sketches'], stats['bytes'] = self._db.execute(
+                    'SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM sketches').fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Sketch stats unavailable: {e}")
+        return stats
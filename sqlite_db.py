@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+class SQLiteDatabase:
+    """
+    Lazily opened SQLite database shared by threads and worker processes.
+
+    Each thread gets its own connection (reopened after fork), created on
+    first use so importing the app never touches the disk. The database
+    runs in WAL mode so readers in every worker proceed while one writer
+    commits. ``schema`` is executed once per process on the first
+    connection. ``synchronous`` NORMAL suits caches and rebuildable data;
+    FULL also fsyncs the WAL on every commit, for data that must survive
+    a power loss.
+    """
+
+    def __init__(self, path: str, schema: str = '', busy_timeout: float = 5.0, synchronous: str = 'NORMAL'):
+        self.path = path
+        self.schema = schema
+        self.busy_timeout = busy_timeout
+        self.synchronous = synchronous
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        pid = os.getpid()
+        if conn is not None and self._local.pid == pid:
+            return conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        with self._schema_lock:
+            if not self._schema_ready and self.schema:
+                conn.executescript(self.schema)
+            self._schema_ready = True
+
+        self._local.conn = conn
+        self._local.pid = pid
+        return conn
+
+    def execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        """Run a single statement in autocommit mode"""
+        return self.connection().execute(sql, params)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run several statements atomically, taking the write lock up front"""
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def exists(self) -> bool:
+        """Check whether the database file has been created"""
+        return os.path.exists(self.path)
@@ -2,8 +2,20 @@ import pytest
 import os
 import tempfile
 from unittest.mock import patch, MagicMock
+
+# Keep the outbound request governor out of the way of unit tests
+os.environ.setdefault('LASTFM_RATE_PER_SEC', '1000')
+os.environ.setdefault('LASTFM_RATE_BURST', '1000')
+os.environ.setdefault('LASTFM_GOVERNOR_STATE', os.path.join(tempfile.mkdtemp(), 'governor.state'))
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp())
+# Tests drain the scrobble queue explicitly with scrobble_queue.flush()
+os.environ.setdefault('SCROBBLE_FLUSHER', 'false')
+
+import app as app_module
 from app import app
 from token_store import TokenStore
+from history_store import HistoryStore
+from scrobble_queue import ScrobbleQueue
 
 @pytest.fixture
 def client():
@@ -23,8 +35,9 @@ def client():
 
 @pytest.fixture
 def mock_lastfm_api():
-    """Mock Last.fm API responses"""
-    with patch('app.make_lastfm_request') as mock_request:
+    """Mock Last.fm API responses (async routes' reads go through the same mock)"""
+    with patch('app.make_lastfm_request') as mock_request, \
+            patch('app.make_lastfm_request_async', side_effect=lambda client, params: mock_request(params)):
         yield mock_request
 
 @pytest.fixture
@@ -81,4 +94,27 @@ def sample_recent_tracks():
                 }
             ]
         }
-    }
\ No newline at end of file
+    }
+
+def make_track(uts, artist, name, album=''):
+    """Build a scrobble as user.getRecentTracks returns it"""
+    return {'name': name, 'artist': {'#text': artist}, 'album': {'#text': album}, 'date': {'uts': str(uts)}}
+
+@pytest.fixture
+def store(tmp_path):
+    """Create a history store in a temporary directory"""
+    return HistoryStore(str(tmp_path / 'history.sqlite3'))
+
+@pytest.fixture
+def app_history(store):
+    """Point the app at the temporary history store"""
+    with patch.object(app_module, 'history_store', store):
+        yield store
+
+@pytest.fixture
+def app_scrobble_queue(tmp_path, test_token_store):
+    """Point the app at a scrobble queue in a temporary directory, drained with flush()"""
+    queue = ScrobbleQueue(str(tmp_path / 'queue.sqlite3'), app_module.send_scrobble_batch, test_token_store,
+                          app_module.scrobble_error_retryable)
+    with patch.object(app_module, 'scrobble_queue', queue):
+        yield queue
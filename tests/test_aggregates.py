@@ -0,0 +1,155 @@
+import pytest
+import json
+from unittest.mock import patch
+import app as app_module
+from history_store import HistoryStore
+from aggregates import ListeningAggregates, AGGREGATES_VERSION
+from analytics import ListeningAnalytics
+from conftest import make_track
+
+BATCH_ONE = [
+    make_track(1700000000, 'Radiohead', 'Airbag', 'OK Computer'),
+    make_track(1700003600, 'Radiohead', 'Reckoner', 'In Rainbows'),
+    make_track(1700007200, 'Portishead', 'Roads', 'Dummy'),
+]
+BATCH_TWO = [
+    make_track(1702000000, 'Radiohead', 'Airbag', 'OK Computer'),
+    make_track(1702090000, 'Björk', 'Jóga', ''),
+]
+
+@pytest.fixture
+def aggregates(store):
+    """Attach listening aggregates to the store"""
+    return ListeningAggregates(store)
+
+class TestListeningAggregates:
+    """Test cases for incrementally maintained listening aggregates"""
+
+    def test_incremental_counts(self, store, aggregates):
+        """Test that each stored batch updates counts and distinct totals"""
+        store.add_tracks('alice', BATCH_ONE)
+        store.add_tracks('alice', BATCH_TWO)
+
+        stats = aggregates.get('Alice')
+        assert stats['scrobbles'] == 5
+        assert stats['unique_artists'] == 3
+        assert stats['unique_albums'] == 3
+        assert stats['unique_tracks'] == 4
+        assert stats['first_uts'] == 1700000000 and stats['last_uts'] == 1702090000
+        assert aggregates.top('alice', 'artist', 1) == [{'artist': 'Radiohead', 'plays': 3}]
+        assert aggregates.top('alice', 'track', 1) == [{'artist': 'Radiohead', 'name': 'Airbag', 'plays': 2}]
+
+    def test_duplicates_not_counted(self, store, aggregates):
+        """Test that scrobbles already stored do not count twice"""
+        store.add_tracks('alice', BATCH_ONE)
+        store.add_tracks('alice', BATCH_ONE + BATCH_TWO)
+        assert aggregates.get('alice')['scrobbles'] == 5
+
+    def test_patterns_match_full_analysis(self, store, aggregates):
+        """Test that the incremental histograms equal a from-scratch analysis"""
+        store.add_tracks('alice', BATCH_ONE)
+        store.add_tracks('alice', BATCH_TWO)
+
+        expected = ListeningAnalytics(store.timestamps('alice')).patterns()
+        assert aggregates.get('alice')['patterns'] == expected
+
+    def test_existing_history_is_rebuilt(self, store):
+        """Test that history stored before aggregates existed is counted on first read"""
+        store.add_tracks('alice', BATCH_ONE)
+        aggregates = ListeningAggregates(store)
+        assert aggregates.get('alice')['scrobbles'] == 3
+
+        store.add_tracks('alice', BATCH_TWO)
+        assert aggregates.get('alice')['scrobbles'] == 5
+
+    def test_version_change_rebuilds(self, store, aggregates):
+        """Test that aggregates stored under another version are recomputed"""
+        store.add_tracks('alice', BATCH_ONE)
+        aggregates._db.execute("UPDATE aggregate_counts SET plays = 99 WHERE kind = 'artist'")
+
+        with patch('aggregates.AGGREGATES_VERSION', AGGREGATES_VERSION + 1):
+            assert aggregates.top('alice', 'artist', 1)[0]['plays'] == 2
+            assert aggregates.get_stats()['version'] == AGGREGATES_VERSION + 1
+
+    def test_survives_restart(self, store, aggregates):
+        """Test that a new process reads the stored aggregates without rebuilding"""
+        store.add_tracks('alice', BATCH_ONE)
+        reopened = ListeningAggregates(HistoryStore(store.path))
+        with patch.object(ListeningAggregates, '_rebuild') as rebuild:
+            assert reopened.get('alice')['scrobbles'] == 3
+        rebuild.assert_not_called()
+
+    def test_unknown_top_kind(self, aggregates):
+        """Test that only artist, album and track rankings exist"""
+        with pytest.raises(ValueError):
+            aggregates.top('alice', 'month')
+
+class TestRangeCharts:
+    """Test cases for top charts over arbitrary date ranges"""
+
+    def test_top_range(self, store, aggregates):
+        """Test that only plays inside the range count, whole UTC days included"""
+        store.add_tracks('alice', BATCH_ONE)
+        store.add_tracks('alice', BATCH_TWO)
+
+        november = aggregates.top_range('alice', 'artist', since=1699999999, until=1700010000)
+        assert november == [{'artist': 'Radiohead', 'plays': 2}, {'artist': 'Portishead', 'plays': 1}]
+        december = aggregates.top_range('alice', 'track', since=1701993600)
+        assert december == [{'artist': 'Björk', 'name': 'Jóga', 'plays': 1},
+                            {'artist': 'Radiohead', 'name': 'Airbag', 'plays': 1}]
+        assert aggregates.top_range('alice', 'album', limit=1) == [
+            {'artist': 'Radiohead', 'name': 'OK Computer', 'plays': 2}]
+
+    def test_top_range_matches_scan(self, store, aggregates):
+        """Test that rollup charts equal counting the stored scrobbles directly"""
+        tracks = [make_track(1690000000 + i * 7919, f"Artist {i % 7}", f"Track {i % 13}") for i in range(500)]
+        store.add_tracks('alice', tracks[:250])
+        store.add_tracks('alice', tracks[250:])
+        since, until = 1691000000, 1692500000
+
+        expected = {}
+        for track in tracks:
+            day = int(track['date']['uts']) // 86400
+            if since // 86400 <= day <= until // 86400:
+                expected[track['artist']['#text']] = expected.get(track['artist']['#text'], 0) + 1
+        charted = aggregates.top_range('alice', 'artist', since, until, limit=50)
+        assert {entry['artist']: entry['plays'] for entry in charted} == expected
+
+class TestScrobbleUpdatesAggregates:
+    """Test that /scrobble feeds the local history and aggregates"""
+
+    def test_accepted_scrobble_recorded(self, authenticated_session, mock_lastfm_api, app_history, aggregates,
+                                        app_scrobble_queue):
+        """Test that an accepted scrobble is stored under Last.fm's corrected names"""
+        mock_lastfm_api.return_value = {'scrobbles': {
+            'scrobble': {
+                'artist': {'corrected': '1', '#text': 'Radiohead'},
+                'track': {'corrected': '0', '#text': 'Reckoner'},
+                'album': {'corrected': '0', '#text': 'In Rainbows'},
+                'timestamp': '1700000000',
+                'ignoredMessage': {'code': '0', '#text': ''}
+            },
+            '@attr': {'accepted': 1, 'ignored': 0}
+        }}
+        with patch.object(app_module, 'get_api_signature', return_value='sig'), \
+                patch.object(app_module.rate_limiter, 'is_allowed', return_value=True):
+            response = authenticated_session.post('/scrobble', data={'artist': 'radiohed', 'track': 'Reckoner'})
+            app_scrobble_queue.flush()
+
+        assert json.loads(response.data)['success'] is True
+        assert aggregates.top('testuser', 'artist') == [{'artist': 'Radiohead', 'plays': 1}]
+
+    def test_range_chart_route(self, authenticated_session, store, aggregates):
+        """Test that /top-artists answers a date range locally"""
+        store.add_tracks('testuser', BATCH_ONE + BATCH_TWO)
+        store._save_state('testuser', 1702090000, 1700000000, 5, None)
+        with patch.object(app_module, 'history_store', store), \
+                patch.object(app_module, 'aggregates', aggregates), \
+                patch.object(app_module, 'make_lastfm_request') as upstream:
+            data = json.loads(authenticated_session.get('/top-artists?from=2023-11-14&to=2023-11-30').data)
+            bad = authenticated_session.get('/top-artists?days=0')
+        upstream.assert_not_called()
+
+        assert data['artists'][0] == {'name': 'Radiohead', 'playcount': '2', '@attr': {'rank': '1'}}
+        assert data['range']['source'] == 'local' and data['range']['complete'] is True
+        assert bad.status_code == 400
@@ -0,0 +1,74 @@
+import random
+import pytest
+from array import array
+from collections import Counter
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+from analytics import ListeningAnalytics
+
+def _expected(timestamps, tz):
+    """Bucket the slow way, one datetime per scrobble"""
+    hourly, daily, monthly, heatmap = Counter(), Counter(), Counter(), Counter()
+    for uts in timestamps:
+        dt = datetime.fromtimestamp(uts, tz)
+        hourly[dt.hour] += 1
+        daily[dt.weekday()] += 1
+        monthly[dt.strftime('%Y-%m')] += 1
+        heatmap[(dt.weekday(), dt.hour)] += 1
+    return hourly, daily, monthly, heatmap
+
+@pytest.fixture
+def timestamps():
+    """Random scrobble times over three years, including two DST changes a year"""
+    rng = random.Random(7)
+    start = int(datetime(2022, 1, 1, tzinfo=timezone.utc).timestamp())
+    return [start + rng.randrange(3 * 365 * 86400) for _ in range(5000)]
+
+class TestListeningAnalytics:
+    """Test cases for the array-based listening analytics"""
+
+    @pytest.mark.parametrize('tz', [timezone.utc, ZoneInfo('Europe/London'), ZoneInfo('America/Los_Angeles'),
+                                    ZoneInfo('Australia/Adelaide')])
+    def test_matches_per_track_bucketing(self, timestamps, tz):
+        """Test that every bucket agrees with datetime-based bucketing"""
+        analytics = ListeningAnalytics(array('q', timestamps), tz=tz)
+        hourly, daily, monthly, heatmap = _expected(timestamps, tz)
+
+        assert analytics.hourly() == [hourly[h] for h in range(24)]
+        assert analytics.daily() == [daily[d] for d in range(7)]
+        assert analytics.monthly() == dict(sorted(monthly.items()))
+        assert analytics.heatmap() == [[heatmap[(d, h)] for h in range(24)] for d in range(7)]
+
+    def test_dst_transition_hours(self):
+        """Test that scrobbles on a DST change day use the offset in force at the time"""
+        tz = ZoneInfo('Europe/London')
+        before = int(datetime(2024, 3, 31, 0, 30, tzinfo=tz).timestamp())
+        after = int(datetime(2024, 3, 31, 2, 30, tzinfo=tz).timestamp())
+        hourly = ListeningAnalytics([before, after], tz=tz).hourly()
+        assert hourly[0] == 1 and hourly[2] == 1
+
+    def test_from_tracks_skips_undated(self):
+        """Test that now-playing and malformed entries are ignored"""
+        tracks = [
+            {'name': 'Live', '@attr': {'nowplaying': 'true'}},
+            {'name': 'Bad', 'date': {'uts': 'soon'}},
+            {'name': 'Good', 'date': {'uts': '1700000000'}}
+        ]
+        analytics = ListeningAnalytics.from_tracks(tracks, tz=timezone.utc)
+        assert len(analytics) == 1
+        assert analytics.most_active_hour() == 22
+
+    def test_patterns_shape(self, timestamps):
+        """Test that patterns keep the keys the dashboard reads"""
+        patterns = ListeningAnalytics(timestamps).patterns()
+        assert list(patterns['hourly']) == [str(h) for h in range(24)]
+        assert list(patterns['daily']) == [str(d) for d in range(7)]
+        assert sum(patterns['hourly'].values()) == len(timestamps)
+        assert len(patterns['heatmap']) == 7
+
+    def test_empty(self):
+        """Test the defaults with no scrobbles"""
+        analytics = ListeningAnalytics([])
+        assert analytics.most_active_hour() == 12
+        assert analytics.monthly() == {}
+        assert sum(analytics.hourly()) == 0
@@ -1,7 +1,10 @@
+import time
 import pytest
 import json
 from unittest.mock import patch, MagicMock
+import app as app_module
 from app import app, LastFMError, get_api_signature, validate_input
+from fake_lastfm import FakeLastFM
 
 class TestApp:
     """Test cases for the main Flask application"""
@@ -91,7 +94,7 @@ class TestAuthentication:
 class TestScrobbling:
     """Test scrobbling functionality"""
     
-    def test_scrobble_success(self, authenticated_session, mock_lastfm_api):
+    def test_scrobble_success(self, authenticated_session, mock_lastfm_api, app_scrobble_queue):
         """Test successful scrobble"""
         mock_lastfm_api.return_value = {'scrobbles': {'@attr': {'accepted': 1}}}
         
@@ -101,9 +104,12 @@ class TestScrobbling:
             'album': 'Test Album'
         })
         
-        assert response.status_code == 200
+        assert response.status_code == 202
         data = json.loads(response.data)
         assert data['success'] is True
+        assert data['queued'] is True and data['status_url'].endswith(data['id'])
+        assert app_scrobble_queue.status('testuser', data['id'])['track'] == 'Test Track'
+        mock_lastfm_api.assert_not_called()
     
     def test_scrobble_missing_fields(self, authenticated_session):
         """Test scrobble with missing required fields"""
@@ -128,7 +134,7 @@ class TestScrobbling:
         data = json.loads(response.data)
         assert 'Authentication required' in data['error']
     
-    def test_scrobble_custom_time(self, authenticated_session, mock_lastfm_api):
+    def test_scrobble_custom_time(self, authenticated_session, mock_lastfm_api, app_scrobble_queue):
         """Test scrobble with custom timestamp"""
         mock_lastfm_api.return_value = {'scrobbles': {'@attr': {'accepted': 1}}}
         
@@ -138,10 +144,87 @@ class TestScrobbling:
             'scrobble_time': '30'  # 30 minutes ago
         })
         
-        assert response.status_code == 200
+        assert response.status_code == 202
         data = json.loads(response.data)
         assert data['success'] is True
 
+class TestBatchScrobble:
+    """Test cases for multi-track scrobbling in one request"""
+
+    def test_batch_is_one_signed_request(self, authenticated_session, mock_lastfm_api, app_history):
+        """Test that tracks are sent as indexed params and per-track results returned"""
+        mock_lastfm_api.return_value = {'scrobbles': {
+            'scrobble': [
+                {'artist': {'corrected': '1', '#text': 'Radiohead'}, 'track': {'#text': 'Reckoner'},
+                 'album': {'#text': 'In Rainbows'}, 'timestamp': '1700000000',
+                 'ignoredMessage': {'code': '0', '#text': ''}},
+                {'artist': {'#text': 'Portishead'}, 'track': {'#text': 'Roads'}, 'album': {'#text': ''},
+                 'timestamp': '1600000000', 'ignoredMessage': {'code': '3', '#text': 'Timestamp failed filter'}}
+            ],
+            '@attr': {'accepted': 1, 'ignored': 1}
+        }}
+        with patch.object(app_module.rate_limiter, 'is_allowed', return_value=True):
+            response = authenticated_session.post('/batch-scrobble', json={'tracks': [
+                {'artist': 'radiohed', 'track': 'Reckoner', 'album': 'In Rainbows', 'timestamp': 1700000000},
+                {'artist': 'Portishead', 'track': 'Roads', 'scrobble_time': '2020-09-13T12:26:40Z'}
+            ]})
+
+        mock_lastfm_api.assert_called_once()
+        params = mock_lastfm_api.call_args[0][0]
+        assert mock_lastfm_api.call_args[1] == {'method': 'POST'}
+        assert params['artist[0]'] == 'radiohed' and params['track[1]'] == 'Roads'
+        assert params['timestamp[1]'] == 1600000000 and 'album[1]' not in params
+        unsigned = {key: value for key, value in params.items() if key not in ('api_sig', 'format')}
+        assert params['api_sig'] == get_api_signature(unsigned)
+
+        data = json.loads(response.data)
+        assert data['success'] is True and (data['accepted'], data['ignored']) == (1, 1)
+        assert data['results'][0]['artist'] == 'Radiohead' and data['results'][0]['accepted'] is True
+        assert data['results'][1]['ignored_code'] == 3
+        assert app_history.summary('testuser')['scrobbles'] == 1
+
+    def test_integer_ignored_codes(self, app_history):
+        """Test that an integer code 0 counts as accepted both in the results and locally"""
+        data = {'scrobbles': {'scrobble': [
+            {'artist': {'#text': 'Radiohead'}, 'track': {'#text': 'Reckoner'}, 'album': {'#text': ''},
+             'timestamp': '1700000000', 'ignoredMessage': {'code': 0, '#text': ''}},
+            {'artist': {'#text': 'Portishead'}, 'track': {'#text': 'Roads'}, 'album': {'#text': ''},
+             'timestamp': '1600000000', 'ignoredMessage': {'code': 3, '#text': 'Timestamp failed filter'}}
+        ]}}
+        app_module.record_local_scrobble('testuser', data, ['', ''])
+
+        assert [app_module.scrobble_accepted(result) for result in app_module.scrobble_results(data)] == [True, False]
+        assert app_history.summary('testuser')['scrobbles'] == 1
+
+    def test_batch_against_fake_lastfm(self, authenticated_session, app_history):
+        """Test that fifty tracks cost a single upstream call"""
+        fake = FakeLastFM().start()
+        now = int(time.time())
+        tracks = [{'artist': f"Artist {i}", 'track': f"Track {i}", 'timestamp': now - i * 240} for i in range(50)]
+        try:
+            with patch.object(app_module, 'BASE_URL', fake.url), \
+                    patch.object(app_module.rate_limiter, 'is_allowed', return_value=True):
+                data = json.loads(authenticated_session.post('/batch-scrobble', json={'tracks': tracks}).data)
+        finally:
+            fake.stop()
+
+        assert fake.stats['by_method']['track.scrobble'] == 1
+        assert data['accepted'] == 50 and [result['track'] for result in data['results']][:2] == ['Track 0', 'Track 1']
+
+    def test_batch_validation(self, authenticated_session, mock_lastfm_api):
+        """Test that invalid batches are rejected before contacting Last.fm"""
+        with patch.object(app_module.rate_limiter, 'is_allowed', return_value=True):
+            too_many = authenticated_session.post('/batch-scrobble', json={'tracks': [
+                {'artist': 'A', 'track': 'T'}] * 51})
+            empty = authenticated_session.post('/batch-scrobble', json={'tracks': []})
+            invalid = authenticated_session.post('/batch-scrobble', json={'tracks': [
+                {'artist': 'A', 'track': 'T'}, {'artist': 'A'}, {'artist': 'A', 'track': 'T', 'timestamp': 'soon'}]})
+
+        assert too_many.status_code == empty.status_code == invalid.status_code == 400
+        assert json.loads(invalid.data)['errors'] == ['Track 2: artist and track are required',
+                                                      'Track 3: invalid timestamp']
+        mock_lastfm_api.assert_not_called()
+
 class TestSearch:
     """Test search functionality"""
     
@@ -260,4 +343,143 @@ class TestRateLimiting:
         assert response.status_code != 429
         
         # Second request might be blocked (depends on timing)
-        # This test is simplified - real rate limiting tests need more setup
\ No newline at end of file
+        # This test is simplified - real rate limiting tests need more setup
+
+class TestImageEndpoints:
+    """Test image lookup endpoints"""
+    
+    @pytest.fixture(autouse=True)
+    def clear_image_cache(self):
+        import app as app_module
+        app_module.image_cache.clear()
+        yield
+        app_module.image_cache.clear()
+    
+    @staticmethod
+    def _fake_lastfm(params):
+        images = {
+            'artist.getInfo': {'artist': {'image': [{'#text': 'small.jpg'}, {'#text': f"artist-{params.get('artist')}.jpg"}]}},
+            'album.getInfo': {'album': {'image': [{'#text': ''}]}},
+            'track.getInfo': {'track': {'album': {'image': [{'#text': f"cover-{params.get('track')}.jpg"}]}}},
+        }
+        return images[params['method']]
+    
+    def test_batch_resolves_and_dedups(self, authenticated_session, mock_lastfm_api):
+        """Test that a batch resolves every item and looks up duplicates once"""
+        mock_lastfm_api.side_effect = self._fake_lastfm
+        
+        response = authenticated_session.post('/fetch-images', json={'items': [
+            {'type': 'artist', 'artist': 'Muse', 'key': 'a1'},
+            {'type': 'artist', 'artist': 'muse', 'key': 'a2'},
+            {'type': 'track', 'artist': 'Muse', 'track': 'Uprising'},
+            {'type': 'album', 'artist': 'Muse', 'album': 'Drones'},
+            {'type': 'album', 'artist': 'Muse'}
+        ]})
+        
+        data = json.loads(response.data)
+        assert data['success'] is True
+        assert data['images'] == {
+            'a1': 'artist-Muse.jpg',
+            'a2': 'artist-Muse.jpg',
+            'track:Muse:Uprising': 'cover-Uprising.jpg',
+            'album:Muse:Drones': 'artist-Muse.jpg',  # no cover, artist fallback
+            'album:Muse': ''
+        }
+        artist_calls = [c for c in mock_lastfm_api.call_args_list if c.args[0]['method'] == 'artist.getInfo']
+        assert len(artist_calls) == 1  # the album fallback reuses the memoized artist lookup
+    
+    def test_batch_item_errors_become_empty(self, authenticated_session, mock_lastfm_api):
+        """Test that a failed lookup does not fail the whole batch"""
+        mock_lastfm_api.side_effect = LastFMError('Artist not found')
+        
+        response = authenticated_session.post('/fetch-images', json={'items': [
+            {'type': 'artist', 'artist': 'Nobody'}
+        ]})
+        
+        data = json.loads(response.data)
+        assert data['images'] == {'artist:Nobody': ''}
+    
+    def test_batch_validation(self, authenticated_session):
+        """Test that empty and oversized batches are rejected"""
+        assert authenticated_session.post('/fetch-images', json={'items': []}).status_code == 400
+        oversized = {'items': [{'type': 'artist', 'artist': str(i)} for i in range(101)]}
+        assert authenticated_session.post('/fetch-images', json=oversized).status_code == 400
+    
+    def test_single_album_image_falls_back_to_artist(self, authenticated_session, mock_lastfm_api):
+        """Test the per-item album endpoint's artist fallback"""
+        mock_lastfm_api.side_effect = self._fake_lastfm
+        
+        response = authenticated_session.post('/fetch-album-image', json={'album': 'Drones', 'artist': 'Muse'})
+        
+        data = json.loads(response.data)
+        assert data == {'success': True, 'image': 'artist-Muse.jpg'}
+    
+    def test_missing_images_are_remembered(self, authenticated_session, mock_lastfm_api):
+        """Test that an album with no cover and no artist image costs nothing on repeat"""
+        mock_lastfm_api.side_effect = lambda params: {'album': {'image': []}, 'artist': {'image': []}}
+        
+        for _ in range(3):
+            response = authenticated_session.post('/fetch-album-image', json={'album': 'Rare', 'artist': 'Obscure'})
+            assert json.loads(response.data) == {'success': True, 'image': ''}
+        
+        assert mock_lastfm_api.call_count == 2  # album.getInfo + artist.getInfo, once
+    
+    def test_not_found_is_remembered(self, authenticated_session, mock_lastfm_api):
+        """Test that unknown artists are not looked up again"""
+        from app import LastFMNotFoundError
+        mock_lastfm_api.side_effect = LastFMNotFoundError('The artist you supplied could not be found')
+        
+        for _ in range(2):
+            response = authenticated_session.post('/fetch-artist-image', json={'artist': 'Nobody'})
+            assert response.status_code == 400
+        
+        assert mock_lastfm_api.call_count == 1
+    
+    def test_transient_errors_are_not_remembered(self, authenticated_session, mock_lastfm_api):
+        """Test that outages do not poison the image cache"""
+        from app import UpstreamUnavailableError
+        mock_lastfm_api.side_effect = UpstreamUnavailableError('Failed to connect to Last.fm')
+        
+        for _ in range(2):
+            authenticated_session.post('/fetch-artist-image', json={'artist': 'Muse'})
+        
+        assert mock_lastfm_api.call_count == 2
+
+class TestTopChartImages:
+    """Test server-side image enrichment of the top-* routes"""
+    
+    @pytest.fixture(autouse=True)
+    def clear_image_cache(self):
+        import app as app_module
+        app_module.image_cache.clear()
+        yield
+        app_module.image_cache.clear()
+    
+    def test_top_albums_with_images(self, authenticated_session, mock_lastfm_api):
+        """Test that missing album art is resolved and embedded"""
+        def fake_lastfm(params):
+            if params['method'] == 'user.getTopAlbums':
+                return {'topalbums': {'album': [
+                    {'name': 'Drones', 'artist': {'name': 'Muse'}, 'image': [{'#text': 'drones.jpg'}]},
+                    {'name': 'Rare', 'artist': {'name': 'Obscure'}, 'image': [{'#text': ''}]}
+                ]}}
+            if params['method'] == 'album.getInfo':
+                return {'album': {'image': [{'#text': 'rare-cover.jpg'}]}}
+            raise AssertionError(params['method'])
+        mock_lastfm_api.side_effect = fake_lastfm
+        
+        response = authenticated_session.get('/top-albums?with_images=1')
+        
+        data = json.loads(response.data)
+        assert [a['image_url'] for a in data['albums']] == ['drones.jpg', 'rare-cover.jpg']
+        assert mock_lastfm_api.call_count == 2
+    
+    def test_top_artists_without_flag_unchanged(self, authenticated_session, mock_lastfm_api):
+        """Test that enrichment is opt-in"""
+        mock_lastfm_api.return_value = {'topartists': {'artist': [{'name': 'Muse', 'image': []}]}}
+        
+        response = authenticated_session.get('/top-artists')
+        
+        data = json.loads(response.data)
+        assert 'image_url' not in data['artists'][0]
+        assert mock_lastfm_api.call_count == 1
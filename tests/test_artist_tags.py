@@ -0,0 +1,153 @@
+import time
+import json
+import pytest
+from unittest.mock import patch
+from artist_tags import ArtistTagIndex, parse_top_tags
+from history_store import HistoryStore
+from aggregates import ListeningAggregates
+from fake_lastfm import FakeLastFM, FakeLastFMConfig
+
+TAGS = {
+    'radiohead': [('alternative', 100), ('rock', 60)],
+    'portishead': [('trip-hop', 100)],
+    'björk': [('electronic', 100), ('experimental', 100)],
+}
+
+class TagSource:
+    """Counts artist.getTopTags lookups and can fail or stall on demand"""
+
+    def __init__(self, failing=(), background_delay=0.0):
+        self.calls = []
+        self.background_calls = []
+        self.failing = set(failing)
+        self.background_delay = background_delay
+
+    def __call__(self, artist, background):
+        self.calls.append(artist)
+        if background:
+            self.background_calls.append(artist)
+            time.sleep(self.background_delay)
+        if artist.lower() in self.failing:
+            raise ConnectionError('simulated failure')
+        tags = TAGS.get(artist.lower())
+        if tags is None:
+            return None
+        return {'toptags': {'tag': [{'name': name.title(), 'count': count} for name, count in tags]}}
+
+def _wait_idle(index):
+    deadline = time.time() + 5
+    while index.get_stats()['pending'] and time.time() < deadline:
+        time.sleep(0.01)
+
+@pytest.fixture
+def source():
+    """A counting tag source"""
+    return TagSource()
+
+@pytest.fixture
+def index(tmp_path, source):
+    """An artist tag index in a temporary directory"""
+    return ArtistTagIndex(str(tmp_path / 'artist_tags.sqlite3'), source)
+
+class TestArtistTagIndex:
+    """Test cases for the persisted artist tag index"""
+
+    def test_parse_top_tags(self):
+        """Test that tags are lowercased, ranked, trimmed and filtered"""
+        data = {'toptags': {'tag': [{'name': 'seen live', 'count': 100}, {'name': 'Jazz', 'count': '40'},
+                                    {'name': 'Soul', 'count': '90'}, {'name': 'zero', 'count': 0}]}}
+        assert parse_top_tags(data) == [('soul', 90), ('jazz', 40)]
+        assert parse_top_tags(data, max_tags=1) == [('soul', 90)]
+
+    def test_resolves_each_artist_once(self, tmp_path, index, source):
+        """Test that indexed artists cost no further lookups, across instances and case"""
+        index.ensure(['Radiohead', 'Portishead'])
+        index.ensure(['RADIOHEAD', 'portishead'])
+        assert sorted(source.calls) == ['Portishead', 'Radiohead']
+
+        reopened_source = TagSource()
+        reopened = ArtistTagIndex(index.path, reopened_source)
+        assert reopened.lookup(['radiohead'])['radiohead'] == [('alternative', 100), ('rock', 60)]
+        reopened.ensure(['Radiohead'])
+        assert reopened_source.calls == []
+
+    def test_unknown_and_failed_artists(self, tmp_path):
+        """Test that unknown artists are remembered but failed lookups are retried"""
+        source = TagSource(failing={'portishead'})
+        index = ArtistTagIndex(str(tmp_path / 'tags.sqlite3'), source)
+        index.ensure(['Nobody', 'Portishead'])
+        index.ensure(['Nobody', 'Portishead'])
+
+        assert source.calls.count('Nobody') == 1
+        assert source.calls.count('Portishead') == 2
+        assert index.get_stats()['unknown'] == 1
+
+    def test_rest_resolved_in_background(self, tmp_path, source):
+        """Test that only the first artists are resolved before returning"""
+        index = ArtistTagIndex(str(tmp_path / 'tags.sqlite3'), source, wait_for=1)
+        found = index.ensure(['Radiohead', 'Portishead', 'Björk'])
+        assert list(found) == ['radiohead']
+
+        _wait_idle(index)
+        assert set(index.lookup(['Radiohead', 'Portishead', 'Björk'])) == {'radiohead', 'portishead', 'björk'}
+        assert len(source.calls) == 3
+
+    def test_requests_not_queued_behind_background(self, tmp_path):
+        """Test that a request's batch runs on its own pool while background batches are slow"""
+        source = TagSource(background_delay=0.3)
+        index = ArtistTagIndex(str(tmp_path / 'tags.sqlite3'), source, workers=1, wait_for=1)
+        index.ensure(['Nobody', 'Radiohead', 'Portishead'])
+        deadline = time.time() + 5
+        while not source.background_calls and time.time() < deadline:
+            time.sleep(0.01)
+        assert source.background_calls[:1] == ['Radiohead']
+
+        start = time.monotonic()
+        found = index.ensure(['Björk'])
+        assert time.monotonic() - start < 0.2
+        assert 'björk' in found
+        assert 'Björk' not in source.background_calls
+        _wait_idle(index)
+
+    def test_genres_weighted_by_plays(self, index):
+        """Test that plays are shared across an artist's tags by weight"""
+        genres = index.genres({'Radiohead': 80, 'Portishead': 30, 'Björk': 20, 'Nobody': 500})
+        assert genres == [('alternative', 50), ('rock', 30), ('trip-hop', 30), ('electronic', 10),
+                          ('experimental', 10)]
+        assert index.genres({'Radiohead': 80}, limit=1) == [('alternative', 50)]
+
+class TestStatsGenres:
+    """Test that /stats reports genres from the tag index"""
+
+    def test_stats_top_genres(self, authenticated_session, tmp_path):
+        """Test that genres come from artist.getTopTags of the listener's artists"""
+        import app as app_module
+        fake = FakeLastFM(config=FakeLastFMConfig(history_size=300, artists=10)).start()
+        store = HistoryStore(str(tmp_path / 'history.sqlite3'))
+        tags = ArtistTagIndex(str(tmp_path / 'tags.sqlite3'), app_module.fetch_artist_tags)
+        try:
+            with patch.object(app_module, 'BASE_URL', fake.url), \
+                    patch.object(app_module, 'history_store', store), \
+                    patch.object(app_module, 'aggregates', ListeningAggregates(store)), \
+                    patch.object(app_module, 'artist_tags', tags):
+                data = json.loads(authenticated_session.get('/stats').data)
+                _wait_idle(tags)
+                calls = fake.stats['by_method']['artist.getTopTags']
+                authenticated_session.get('/stats')
+                assert fake.stats['by_method']['artist.getTopTags'] == calls
+        finally:
+            fake.stop()
+            app_module.response_cache.clear()
+
+        catalogue_tags = {tag for artist in fake.catalogue.artists for tag in artist['tags']}
+        assert data['success'] and data['stats']['top_genres']
+        assert {genre for genre, _ in data['stats']['top_genres']} <= catalogue_tags
+
+    def test_fetch_priorities(self):
+        """Test that awaited lookups use the default tier and warmup the background tier"""
+        import app as app_module
+        from upstream_governor import BACKGROUND
+        with patch.object(app_module, '_send_lastfm_request', return_value={}) as send:
+            app_module.fetch_artist_tags('Radiohead')
+            app_module.fetch_artist_tags('Portishead', True)
+        assert [call.kwargs['priority'] for call in send.call_args_list] == [None, BACKGROUND]
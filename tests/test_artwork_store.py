@@ -0,0 +1,146 @@
+import pytest
+import os
+import struct
+import requests
+from unittest.mock import patch
+from artwork_store import ArtworkStore, ArtworkError, snap_size
+from fake_lastfm import FakeLastFM
+
+@pytest.fixture(scope='module')
+def fake():
+    """Run the fake Last.fm server as a stand-in image CDN"""
+    server = FakeLastFM().start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def fetches():
+    """Record every upstream image fetch"""
+    return []
+
+@pytest.fixture
+def store(tmp_path, fetches):
+    """Create an artwork store that may fetch from the local fake"""
+    def fetch(url):
+        fetches.append(url)
+        return requests.get(url, timeout=5, allow_redirects=False)
+    return ArtworkStore(str(tmp_path / 'artwork'), fetch, allowed_hosts=['127.0.0.1'])
+
+def _png_width(path):
+    with open(path, 'rb') as f:
+        header = f.read(24)
+    return struct.unpack('>I', header[16:20])[0]
+
+class TestArtworkStore:
+    """Test cases for the content-addressed artwork cache"""
+
+    def test_snap_size(self):
+        """Test that requested sizes round up to supported thumbnails"""
+        assert snap_size(48) == 64
+        assert snap_size(64) == 64
+        assert snap_size(96) == 174
+        assert snap_size(2000) == 300
+        assert snap_size(None) == 300
+
+    def test_cdn_variant(self):
+        """Test rewriting Last.fm CDN URLs to a size variant"""
+        url = 'https://lastfm.freetls.fastly.net/i/u/300x300/abc.png'
+        assert ArtworkStore.cdn_variant(url, 64) == 'https://lastfm.freetls.fastly.net/i/u/64s/abc.png'
+        assert ArtworkStore.cdn_variant(url, 300) == url
+        assert ArtworkStore.cdn_variant('https://example.com/cover.png', 64) is None
+
+    @pytest.mark.parametrize('url', [
+        'file:///etc/passwd',
+        'http://169.254.169.254/latest/meta-data/',
+        'https://evil.example.com/i/u/64s/x.png',
+        ''
+    ])
+    def test_rejects_disallowed_urls(self, store, fetches, url):
+        """Test that only allowed http(s) hosts are fetched"""
+        with pytest.raises(ArtworkError):
+            store.get(url, 64)
+        assert fetches == []
+
+    def test_fetches_once_and_resizes(self, store, fake, fetches):
+        """Test that a thumbnail is fetched once at the requested size"""
+        url = f"{fake.base}/i/u/300x300/cafe.png"
+        path, digest, content_type = store.get(url, 48)
+        again = store.get(url, 48)
+
+        assert again == (path, digest, content_type)
+        assert len(fetches) == 1
+        assert content_type == 'image/png'
+        assert _png_width(path) == 64
+        assert os.path.basename(path).startswith(digest)
+
+    def test_pillow_resizes_largest_variant(self, store, fake, fetches):
+        """Test that with Pillow the largest CDN variant is fetched and resized locally"""
+        pytest.importorskip('PIL')
+        path, _, _ = store.get(f"{fake.base}/i/u/64s/cafe.png", 34)
+
+        assert fetches == [f"{fake.base}/i/u/300x300/cafe.png"]
+        assert _png_width(path) == 34
+        assert store.get_stats()['resize'] == 'pillow'
+
+    def test_cdn_variant_without_pillow(self, store, fake, fetches):
+        """Test that without Pillow the CDN's own size variant is served as is"""
+        with patch('artwork_store.Image', None):
+            path, _, _ = store.get(f"{fake.base}/i/u/300x300/cafe.png", 48)
+            assert store.get_stats()['resize'] == 'cdn'
+
+        assert fetches == [f"{fake.base}/i/u/64s/cafe.png"]
+        assert _png_width(path) == 64
+
+    def test_identical_content_stored_once(self, store, fake):
+        """Test that the same bytes from two URLs share one object"""
+        first = store.get(f"{fake.base}/i/u/300x300/same.png", 64)
+        second = store.get(f"{fake.base}/i/u/64s/same.png", 64)
+        assert first[1] == second[1]
+        objects = [name for _, _, names in os.walk(os.path.join(store.root, 'objects')) for name in names]
+        assert len(objects) == 1
+
+    def test_non_image_rejected(self, store, fake):
+        """Test that upstream responses that are not images are refused"""
+        with pytest.raises(ArtworkError):
+            store.get(f"{fake.base}/__fake/stats", 64)
+
+    def test_lru_eviction(self, store, fake):
+        """Test that least recently served objects are evicted over the cap"""
+        first = store.get(f"{fake.base}/i/u/300x300/one.png", 300)
+        size = os.path.getsize(first[0])
+        store.max_bytes = int(size * 2.5)
+
+        second = store.get(f"{fake.base}/i/u/300x300/two.png", 300)
+        os.utime(second[0], (1, 1))  # 'two' is now the least recently used
+        store.get(f"{fake.base}/i/u/300x300/one.png", 300)
+        store.get(f"{fake.base}/i/u/300x300/three.png", 300)
+
+        assert not os.path.exists(second[0])
+        assert os.path.exists(first[0])
+        assert store.get_stats()['evictions'] == 1
+
+class TestArtworkRoute:
+    """Test the /artwork proxy route"""
+
+    def test_serves_with_immutable_etag(self, authenticated_session, store, fake):
+        """Test strong ETags, immutable caching and conditional requests"""
+        import app as app_module
+        url = f"{fake.base}/i/u/300x300/route.png"
+        with patch.object(app_module, 'artwork_store', store):
+            response = authenticated_session.get('/artwork', query_string={'url': url, 'size': 64})
+            etag = response.headers['ETag']
+            cached = authenticated_session.get('/artwork', query_string={'url': url, 'size': 64},
+                                               headers={'If-None-Match': etag})
+
+        assert response.status_code == 200
+        assert response.mimetype == 'image/png'
+        assert not etag.startswith('W/')
+        assert 'immutable' in response.headers['Cache-Control']
+        assert cached.status_code == 304
+
+    def test_disallowed_host(self, authenticated_session, store):
+        """Test that the proxy refuses hosts outside the allowlist"""
+        import app as app_module
+        with patch.object(app_module, 'artwork_store', store):
+            response = authenticated_session.get('/artwork', query_string={'url': 'http://localhost:22/'})
+        assert response.status_code == 400
@@ -0,0 +1,195 @@
+import pytest
+import json
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from unittest.mock import patch
+
+aiohttp = pytest.importorskip('aiohttp')
+
+import app as app_module
+from async_client import AsyncLastFMClient
+
+class _Handler(BaseHTTPRequestHandler):
+    """Minimal Last.fm stand-in echoing the requested method"""
+
+    def _reply(self, params):
+        self.server.seen.append(params)
+        method = params.get('method')
+        if method == 'bad.json':
+            body, status = b'not json', 200
+        elif method == 'api.error':
+            body, status = json.dumps({'error': 6, 'message': 'Artist not found'}).encode(), 200
+        elif method == 'api.offline':
+            body, status = json.dumps({'error': 11, 'message': 'Service Offline'}).encode(), 200
+        elif method == 'api.ratelimited':
+            body, status = json.dumps({'error': 29, 'message': 'Rate Limit Exceeded'}).encode(), 200
+        elif method == 'http.error':
+            body, status = b'{}', 503
+        elif method == 'http.forbidden':
+            body, status = b'{}', 403
+        else:
+            body, status = json.dumps({'method': method, 'params': params}).encode(), 200
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        self._reply({k: v[0] for k, v in query.items()})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        self._reply({k: v[0] for k, v in form.items()})
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def upstream():
+    """Run a local fake upstream for the duration of a test"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.seen = []
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _client(server, **kwargs):
+    return AsyncLastFMClient(f"http://127.0.0.1:{server.server_address[1]}/2.0/",
+                             error_for=app_module.lastfm_error, **kwargs)
+
+async def _request(server, params, **kwargs):
+    client_kwargs = {k: kwargs.pop(k) for k in ('signer',) if k in kwargs}
+    async with _client(server, **client_kwargs) as client:
+        return await client.request(params, **kwargs)
+
+class TestAsyncLastFMClient:
+    """Test cases for the asyncio Last.fm client"""
+
+    def test_get_request(self, upstream):
+        """Test a plain GET returns decoded JSON"""
+        data = asyncio.run(_request(upstream, {'method': 'user.getInfo', 'user': 'a'}))
+        assert data['method'] == 'user.getInfo'
+        assert data['params']['format'] == 'json'
+
+    def test_signed_post(self, upstream):
+        """Test signing happens before the format parameter is added"""
+        signer = lambda params: 'sig:' + ','.join(sorted(params))
+        data = asyncio.run(_request(upstream, {'method': 'track.scrobble', 'artist': 'A'},
+                                    method='POST', sign=True, signer=signer))
+        assert data['params']['api_sig'] == 'sig:artist,method'
+
+    @pytest.mark.parametrize('method,error_class,message', [
+        ('api.error', app_module.LastFMNotFoundError, 'Artist not found'),
+        ('api.offline', app_module.UpstreamUnavailableError, 'Service Offline'),
+        ('api.ratelimited', app_module.UpstreamBusyError, 'Rate Limit Exceeded'),
+        ('bad.json', app_module.UpstreamUnavailableError, 'Invalid response from Last.fm'),
+        ('http.error', app_module.UpstreamUnavailableError, 'Failed to connect to Last.fm'),
+    ])
+    def test_error_mapping(self, upstream, method, error_class, message):
+        """Test failures raise the same LastFMError subclasses as the sync path"""
+        with pytest.raises(error_class, match=message):
+            asyncio.run(_request(upstream, {'method': method}))
+
+    def test_client_errors_not_outages(self, upstream):
+        """Test 4xx responses raise plain LastFMError, like the sync path"""
+        with pytest.raises(app_module.LastFMError) as raised:
+            asyncio.run(_request(upstream, {'method': 'http.forbidden'}))
+        assert type(raised.value) is app_module.LastFMError
+
+class TestAsyncRequestPath:
+    """Test make_lastfm_request_async's caching and coalescing"""
+
+    @pytest.fixture(autouse=True)
+    def base_url(self, upstream):
+        app_module.response_cache.clear()
+        with patch('app.BASE_URL', f"http://127.0.0.1:{upstream.server_address[1]}/2.0/"):
+            yield
+        app_module.response_cache.clear()
+
+    def test_concurrent_reads_coalesced_and_cached(self, upstream):
+        """Test identical concurrent async reads share one upstream call and the sync cache"""
+        async def run():
+            async with app_module.create_async_client() as client:
+                return await asyncio.gather(*(
+                    app_module.make_lastfm_request_async(client, {'method': 'user.getTopArtists', 'user': 'a'})
+                    for _ in range(5)))
+
+        results = asyncio.run(run())
+        assert len(upstream.seen) == 1
+        assert all(result['method'] == 'user.getTopArtists' for result in results)
+        assert len({id(result) for result in results}) == 5
+
+        app_module.make_lastfm_request({'method': 'user.getTopArtists', 'user': 'a'})
+        assert len(upstream.seen) == 1
+
+    def test_reads_use_metadata_cache(self, upstream, tmp_path):
+        """Test catalogue reads are answered from the persistent metadata cache"""
+        from metadata_cache import MetadataCache
+        store = MetadataCache(str(tmp_path / 'metadata.sqlite3'))
+        params = {'method': 'artist.getInfo', 'artist': 'Muse', 'format': 'json'}
+        store.set(app_module.response_cache.make_key(params), {'artist': {'name': 'Muse'}}, method='artist.getInfo')
+
+        async def run():
+            async with app_module.create_async_client() as client:
+                return await app_module.make_lastfm_request_async(client, {'method': 'artist.getInfo',
+                                                                           'artist': 'Muse'})
+
+        with patch.object(app_module, 'metadata_cache', store):
+            assert asyncio.run(run()) == {'artist': {'name': 'Muse'}}
+        assert upstream.seen == []
+
+class TestTopOverviewRoute:
+    """Test the async /top-overview route"""
+
+    def test_top_overview(self, authenticated_session, upstream):
+        """Test the route fans out to all three top charts"""
+        app_module.response_cache.clear()
+        base_url = f"http://127.0.0.1:{upstream.server_address[1]}/2.0/"
+
+        with patch('app.BASE_URL', base_url):
+            response = authenticated_session.get('/top-overview?period=1month')
+
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['success'] is True
+        methods = sorted(params['method'] for params in upstream.seen)
+        assert methods == ['user.getTopAlbums', 'user.getTopArtists', 'user.getTopTracks']
+
+    def test_top_overview_with_images(self, authenticated_session, mock_lastfm_api):
+        """Test that with_images resolves missing artwork for all three charts"""
+        app_module.image_cache.clear()
+
+        def fake_lastfm(params):
+            charts = {
+                'user.getTopArtists': {'topartists': {'artist': {'name': 'Muse', 'image': []}}},
+                'user.getTopTracks': {'toptracks': {'track': [
+                    {'name': 'Uprising', 'artist': {'name': 'Muse'}, 'image': [{'#text': 'uprising.jpg'}]}]}},
+                'user.getTopAlbums': {'topalbums': {'album': [
+                    {'name': 'Drones', 'artist': {'name': 'Muse'}, 'image': [{'#text': ''}]}]}},
+                'artist.getInfo': {'artist': {'image': [{'#text': 'muse.jpg'}]}},
+                'album.getInfo': {'album': {'image': []}},
+            }
+            return charts[params['method']]
+        mock_lastfm_api.side_effect = fake_lastfm
+
+        response = authenticated_session.get('/top-overview?with_images=1')
+        app_module.image_cache.clear()
+
+        data = json.loads(response.data)
+        assert [item['image_url'] for item in data['artists']] == ['muse.jpg']
+        assert [item['image_url'] for item in data['tracks']] == ['uprising.jpg']
+        assert [item['image_url'] for item in data['albums']] == ['muse.jpg']  # artist fallback
+        methods = [call.args[0]['method'] for call in mock_lastfm_api.call_args_list]
+        assert sorted(methods[3:]) == ['album.getInfo', 'artist.getInfo']  # the fallback reuses the lookup
+
+    def test_top_overview_unauthenticated(self, client):
+        """Test the async route still requires authentication"""
+        response = client.get('/top-overview')
+        assert response.status_code == 401
@@ -0,0 +1,136 @@
+import pytest
+import json
+import time
+import requests
+from unittest.mock import patch
+from backfill import Backfill, COMPLETE, FAILED
+from history_store import HistoryStore
+from aggregates import ListeningAggregates
+from fake_lastfm import FakeLastFM, FakeLastFMConfig
+
+@pytest.fixture
+def fake():
+    """Run a fake Last.fm server with a 1000-scrobble history"""
+    server = FakeLastFM(config=FakeLastFMConfig(history_size=1000, artists=50)).start()
+    yield server
+    server.stop()
+
+def _fetcher(fake, calls=None, fail_pages=()):
+    def fetch(user, extra):
+        if calls is not None:
+            calls.append(extra)
+        if extra['page'] in fail_pages:
+            raise ConnectionError('simulated failure')
+        params = {'method': 'user.getRecentTracks', 'user': user, 'format': 'json'}
+        params.update(extra)
+        return requests.get(fake.url, params=params, timeout=5).json()
+    return fetch
+
+class TestBackfill:
+    """Test cases for the resumable history backfill"""
+
+    def test_full_backfill(self, store, fake):
+        """Test that every page is stored and the whole history becomes covered"""
+        store.sync('alice', lambda extra: _fetcher(fake)('alice', extra))
+        progress = Backfill(store, _fetcher(fake), workers=3).run('alice')
+
+        assert progress['status'] == COMPLETE
+        assert progress['pages_done'] == progress['total_pages'] == 5
+        assert store.covered_count('alice') == 1000
+
+    def test_resume_fetches_only_missing_pages(self, store, fake):
+        """Test that a failed job picks up where it stopped"""
+        first = Backfill(store, _fetcher(fake, fail_pages={3, 4}), max_retries=1).run('alice')
+        assert first['status'] == FAILED
+        assert first['pages_done'] == 3
+
+        calls = []
+        second = Backfill(store, _fetcher(fake, calls), max_retries=1).run('alice')
+        assert second['status'] == COMPLETE
+        assert sorted(call['page'] for call in calls) == [3, 4]
+        assert store.summary('alice')['scrobbles'] == 1000
+
+    def test_pages_pinned_to_start(self, store, fake):
+        """Test that scrobbles arriving mid-job do not shift the pages"""
+        calls = []
+        job = Backfill(store, _fetcher(fake, calls), max_retries=1)
+        job._create_job('alice')
+        fake.record_scrobble('alice', fake.catalogue.artists[0]['name'], 'New', '', int(time.time()) + 5)
+        job.run('alice')
+
+        assert len({call['to'] for call in calls}) == 1
+        assert store.summary('alice')['scrobbles'] == 1000
+
+    def test_lease_blocks_second_worker(self, store, fake):
+        """Test that only one worker runs a user's job while its lease is live"""
+        holder = Backfill(store, _fetcher(fake), owner='worker-a')
+        holder._create_job('alice')
+        assert holder._claim('alice') is True
+
+        other = Backfill(store, _fetcher(fake), owner='worker-b')
+        assert other.run('alice') is None
+        assert other.resume_interrupted('alice') is False
+
+    def test_overflow_after_complete_starts_new_job(self, tmp_path, fake):
+        """Test that a gap left by a sync overflow is filled by a new job"""
+        store = HistoryStore(str(tmp_path / 'history.sqlite3'), max_delta_pages=1)
+        sync = lambda: store.sync('alice', lambda extra: _fetcher(fake)('alice', extra))
+        job = Backfill(store, _fetcher(fake), workers=3)
+        sync()
+        assert job.run('alice')['status'] == COMPLETE
+        assert job.outdated('alice') is False
+
+        now = int(time.time())
+        for i in range(500):
+            fake.record_scrobble('alice', fake.catalogue.artists[0]['name'], f"New {i}", '', now + 1 + i)
+        sync()
+        assert store.covered_count('alice') == 200
+        assert job.outdated('alice') is True
+
+        progress = job.run('alice')
+        assert progress['status'] == COMPLETE
+        assert store.covered_count('alice') == 1500
+        assert job.outdated('alice') is False
+
+    def test_progress_unknown_user(self, store, fake):
+        """Test that users without a job report no progress"""
+        assert Backfill(store, _fetcher(fake)).progress('nobody') is None
+
+class TestBackfillRoutes:
+    """Test the backfill endpoints and partial analytics"""
+
+    @pytest.fixture
+    def app_backfill(self, fake, store):
+        import app as app_module
+        job = Backfill(store, _fetcher(fake), workers=2)
+        with patch.object(app_module, 'BASE_URL', fake.url), \
+                patch.object(app_module, 'history_store', store), \
+                patch.object(app_module, 'backfill', job), \
+                patch.object(app_module, 'aggregates', ListeningAggregates(store)):
+            yield app_module
+        app_module.response_cache.clear()
+
+    def test_start_and_progress(self, authenticated_session, app_backfill):
+        """Test that a started backfill reports progress until complete"""
+        response = authenticated_session.post('/backfill')
+        assert response.status_code == 202
+
+        deadline = time.time() + 10
+        progress = None
+        while time.time() < deadline:
+            progress = json.loads(authenticated_session.get('/backfill/progress').data)['progress']
+            if progress and progress['status'] == COMPLETE:
+                break
+            time.sleep(0.05)
+        assert progress['status'] == COMPLETE
+        assert progress['scrobbles'] == 1000
+
+    def test_stats_use_stored_history(self, authenticated_session, app_backfill, store, fake):
+        """Test that /stats analyses the stored history, partial or not"""
+        Backfill(store, _fetcher(fake, fail_pages={2, 3, 4, 5}), max_retries=1).run('testuser')
+
+        data = json.loads(authenticated_session.get('/stats').data)
+        assert data['success']
+        assert data['stats']['coverage']['analyzed_scrobbles'] == 200
+        assert data['stats']['coverage']['backfill']['status'] == FAILED
+        assert sum(data['stats']['patterns']['hourly'].values()) == 200
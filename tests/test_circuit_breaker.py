@@ -0,0 +1,200 @@
+import pytest
+import json
+import time
+import requests
+from unittest.mock import patch, MagicMock
+from circuit_breaker import CircuitBreaker, CircuitBreakerRegistry, CLOSED, OPEN, HALF_OPEN
+
+class TestCircuitBreaker:
+    """Test cases for the per-method circuit breaker"""
+
+    def test_opens_after_threshold(self):
+        """Test that consecutive failures open the breaker"""
+        breaker = CircuitBreaker('artist.getInfo', failure_threshold=3, reset_timeout=30)
+        for _ in range(2):
+            breaker.record_failure()
+        assert breaker.state == CLOSED
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert breaker.allow_request() is False
+
+    def test_success_resets_failure_count(self):
+        """Test that a success in between keeps the breaker closed"""
+        breaker = CircuitBreaker('artist.getInfo', failure_threshold=2)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == CLOSED
+
+    def test_half_open_allows_single_probe(self):
+        """Test that only one probe goes through after the reset timeout"""
+        breaker = CircuitBreaker('artist.getInfo', failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow_request() is True
+        assert breaker.allow_request() is False
+
+    def test_probe_success_closes(self):
+        """Test that a successful probe closes the breaker"""
+        breaker = CircuitBreaker('artist.getInfo', failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        breaker.allow_request()
+        breaker.record_success()
+        assert breaker.state == CLOSED
+
+    def test_probe_failure_reopens(self):
+        """Test that a failed probe re-opens the breaker"""
+        breaker = CircuitBreaker('artist.getInfo', failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        breaker._opened_at -= 31
+        assert breaker.allow_request() is True
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert breaker.retry_in() > 29
+
+    def test_registry_records_transitions(self):
+        """Test that the registry keeps per-method breakers and transitions"""
+        registry = CircuitBreakerRegistry(failure_threshold=1, reset_timeout=30)
+        registry.get('user.getTopArtists').record_failure()
+        registry.get('track.getInfo').record_success()
+
+        snapshot = registry.snapshot()
+        states = {b['name']: b['state'] for b in snapshot['breakers']}
+        assert states == {'user.getTopArtists': OPEN, 'track.getInfo': CLOSED}
+        assert snapshot['transitions'][0]['name'] == 'user.getTopArtists'
+        assert snapshot['transitions'][0]['to'] == OPEN
+
+@pytest.fixture
+def breakers():
+    """Fresh breakers and cache around make_lastfm_request"""
+    import app as app_module
+    registry = CircuitBreakerRegistry(failure_threshold=2, reset_timeout=60)
+    app_module.response_cache.clear()
+    with patch.object(app_module, 'circuit_breakers', registry):
+        yield registry
+    app_module.response_cache.clear()
+
+def _ok(payload):
+    response = MagicMock(status_code=200)
+    response.json.return_value = payload
+    return response
+
+class TestStaleFallback:
+    """Test stale-while-revalidate behaviour in make_lastfm_request"""
+
+    def test_serves_stale_when_upstream_fails(self, breakers):
+        """Test that a failing read falls back to the last good response"""
+        import app as app_module
+        params = {'method': 'user.getRecentTracks', 'user': 'testuser', 'limit': 50}
+
+        with patch.object(app_module.http_client, 'get', return_value=_ok({'recenttracks': {'track': []}})):
+            app_module.make_lastfm_request(dict(params))
+
+        with patch.object(app_module.http_client, 'get', side_effect=requests.ConnectionError('down')):
+            data = app_module.make_lastfm_request(dict(params))
+
+        assert data == {'recenttracks': {'track': []}}
+
+    def test_open_breaker_fails_fast_without_stale(self, breakers):
+        """Test that an open breaker rejects calls without going upstream"""
+        import app as app_module
+        with patch.object(app_module.http_client, 'get', side_effect=requests.Timeout('slow')) as mock_get:
+            for _ in range(2):
+                with pytest.raises(app_module.UpstreamUnavailableError):
+                    app_module.make_lastfm_request({'method': 'track.search', 'track': 'x'})
+            with pytest.raises(app_module.UpstreamUnavailableError, match='temporarily unavailable'):
+                app_module.make_lastfm_request({'method': 'track.search', 'track': 'x'})
+
+        assert mock_get.call_count == 2
+        assert breakers.get('track.search').state == OPEN
+
+    def test_api_errors_do_not_trip_breaker(self, breakers):
+        """Test that ordinary Last.fm errors count as healthy responses"""
+        import app as app_module
+        response = _ok({'error': 6, 'message': 'Artist not found'})
+        with patch.object(app_module.http_client, 'get', return_value=response):
+            for _ in range(3):
+                with pytest.raises(app_module.LastFMError):
+                    app_module.make_lastfm_request({'method': 'artist.getInfo', 'artist': 'nobody'})
+        assert breakers.get('artist.getInfo').state == CLOSED
+
+    def test_route_flags_stale_response(self, breakers, authenticated_session):
+        """Test that routes mark stale data in the body and headers"""
+        import app as app_module
+        payload = {'topartists': {'artist': [{'name': 'Cached Artist'}]}}
+        key = app_module.response_cache.make_key({
+            'method': 'user.getTopArtists', 'user': 'testuser', 'api_key': app_module.API_KEY,
+            'period': '7day', 'limit': 10
+        })
+        with patch('response_cache.time.time', return_value=time.time() - 60):
+            app_module.response_cache.set(key, payload, ttl=1)
+
+        breaker = breakers.get('user.getTopArtists')
+        breaker.record_failure()
+        breaker.record_failure()
+
+        with patch.object(app_module.http_client, 'get') as mock_get:
+            response = authenticated_session.get('/top-artists')
+
+        mock_get.assert_not_called()
+        data = json.loads(response.data)
+        assert data['stale'] is True
+        assert data['artists'][0]['name'] == 'Cached Artist'
+        assert 'Stale' in response.headers['Warning']
+
+def _unused_url():
+    """URL of a local port nothing listens on"""
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/2.0/"
+
+class TestAsyncStaleFallback:
+    """Test breakers and stale fallback on the async request path"""
+
+    def test_async_failures_trip_breaker(self, breakers):
+        """Test that async outages count against the method's breaker"""
+        pytest.importorskip('aiohttp')
+        import asyncio
+        import app as app_module
+
+        async def read():
+            async with app_module.create_async_client() as client:
+                return await app_module.make_lastfm_request_async(client, {'method': 'track.search', 'track': 'x'})
+
+        with patch.object(app_module, 'BASE_URL', _unused_url()):
+            for _ in range(2):
+                with pytest.raises(app_module.UpstreamUnavailableError, match='Failed to connect'):
+                    asyncio.run(read())
+            with pytest.raises(app_module.UpstreamUnavailableError, match='temporarily unavailable'):
+                asyncio.run(read())
+
+        assert breakers.get('track.search').state == OPEN
+
+    def test_top_overview_serves_stale(self, breakers, authenticated_session):
+        """Test that /top-overview falls back to stale charts, flagged, while Last.fm is down"""
+        pytest.importorskip('aiohttp')
+        import app as app_module
+        charts = {'user.getTopArtists': {'topartists': {'artist': [{'name': 'Cached Artist'}]}},
+                  'user.getTopTracks': {'toptracks': {'track': []}},
+                  'user.getTopAlbums': {'topalbums': {'album': []}}}
+        with patch('response_cache.time.time', return_value=time.time() - 60):
+            for method, payload in charts.items():
+                key = app_module.response_cache.make_key({
+                    'method': method, 'user': 'testuser', 'api_key': app_module.API_KEY,
+                    'period': '7day', 'limit': 10
+                })
+                app_module.response_cache.set(key, payload, ttl=1)
+        # The artists breaker is already open; the other two fail now
+        breakers.get('user.getTopArtists').record_failure()
+        breakers.get('user.getTopArtists').record_failure()
+
+        with patch.object(app_module, 'BASE_URL', _unused_url()):
+            response = authenticated_session.get('/top-overview')
+
+        data = json.loads(response.data)
+        assert response.status_code == 200 and data['stale'] is True
+        assert data['artists'][0]['name'] == 'Cached Artist'
+        assert 'Stale' in response.headers['Warning']
+        assert breakers.get('user.getTopTracks').snapshot()['failures'] == 1
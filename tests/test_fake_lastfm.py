@@ -0,0 +1,125 @@
+import pytest
+import time
+import requests
+from unittest.mock import patch
+from fake_lastfm import FakeLastFM, FakeLastFMConfig, LatencyModel
+from circuit_breaker import CircuitBreakerRegistry
+
+@pytest.fixture
+def fake():
+    """Run a fake Last.fm server on a free port"""
+    server = FakeLastFM(config=FakeLastFMConfig(history_size=1000, artists=50)).start()
+    yield server
+    server.stop()
+
+def _call(fake, **params):
+    params.setdefault('format', 'json')
+    return requests.get(fake.url, params=params, timeout=5)
+
+class TestFakeLastFM:
+    """Test cases for the fake Last.fm server"""
+
+    def test_latency_specs(self):
+        """Test that latency specs parse into the expected distributions"""
+        import random
+        rng = random.Random(1)
+        assert LatencyModel('fixed:50').sample(rng) == 0.05
+        assert 0.02 <= LatencyModel('uniform:20:80').sample(rng) <= 0.08
+        assert LatencyModel('lognormal:50:0.5').sample(rng) > 0
+        with pytest.raises(ValueError):
+            LatencyModel('bogus:1')
+
+    def test_recent_tracks_paging(self, fake):
+        """Test that recent tracks page newest first with totals"""
+        page1 = _call(fake, method='user.getRecentTracks', user='alice', limit=200).json()['recenttracks']
+        page2 = _call(fake, method='user.getRecentTracks', user='alice', limit=200, page=2).json()['recenttracks']
+
+        assert page1['@attr']['total'] == '1000'
+        assert page1['@attr']['totalPages'] == '5'
+        assert len(page1['track']) == 200
+        uts = [int(t['date']['uts']) for t in page1['track'] + page2['track']]
+        assert uts == sorted(uts, reverse=True)
+
+    def test_recent_tracks_time_window(self, fake):
+        """Test that from/to restrict the returned scrobbles"""
+        everything = _call(fake, method='user.getRecentTracks', user='alice', limit=200).json()
+        newest = everything['recenttracks']['track']
+        window_to = int(newest[10]['date']['uts'])
+        window_from = int(newest[19]['date']['uts'])
+
+        data = _call(fake, method='user.getRecentTracks', user='alice', limit=200,
+                     **{'from': window_from, 'to': window_to}).json()['recenttracks']
+        assert data['@attr']['total'] == '10'
+        assert data['track'][0] == newest[10]
+
+    def test_scrobble_appears_in_history(self, fake):
+        """Test that accepted scrobbles show up in recent tracks"""
+        artist = fake.catalogue.artists[0]['name']
+        response = requests.post(fake.url, data={
+            'method': 'track.scrobble', 'artist[0]': artist, 'track[0]': 'New Song',
+            'timestamp[0]': int(time.time()), 'artist[1]': artist, 'track[1]': 'Old Song',
+            'timestamp[1]': int(time.time()) - 30 * 86400,
+            'sk': 'fake-sk-alice', 'api_sig': 'sig', 'format': 'json'
+        }, timeout=5).json()
+
+        assert response['scrobbles']['@attr'] == {'accepted': 1, 'ignored': 1}
+        recent = _call(fake, method='user.getRecentTracks', user='alice', limit=1).json()
+        assert recent['recenttracks']['track'][0]['name'] == 'New Song'
+
+    def test_scrobble_requires_signature(self, fake):
+        """Test that signed methods reject unsigned calls"""
+        response = requests.post(fake.url, data={'method': 'track.scrobble', 'artist': 'A',
+                                                 'track': 'B', 'timestamp': 1, 'format': 'json'}, timeout=5)
+        assert response.json()['error'] == 13
+
+    def test_unknown_artist_and_method(self, fake):
+        """Test Last.fm-shaped errors for bad input"""
+        assert _call(fake, method='artist.getInfo', artist='Nobody At All').json()['error'] == 6
+        assert _call(fake, method='no.suchMethod').json()['error'] == 3
+
+    def test_rate_limit_injection(self, fake):
+        """Test that the token bucket answers error 29 once exhausted"""
+        fake.config.update({'rate_limit': 0.001, 'rate_limit_burst': 2})
+        fake._tokens = 2
+        statuses = [_call(fake, method='user.getInfo', user='alice').status_code for _ in range(3)]
+        assert statuses == [200, 200, 429]
+        assert fake.stats['rate_limited'] == 1
+
+    def test_error_injection_via_config_endpoint(self, fake):
+        """Test that errors can be switched on at runtime"""
+        requests.post(f"{fake.base}/__fake/config", json={'error_rate': 1.0, 'error_codes': [11]}, timeout=5)
+        assert _call(fake, method='user.getInfo', user='alice').json()['error'] == 11
+
+    def test_image_endpoint_serves_png(self, fake):
+        """Test that image URLs in payloads resolve to PNGs"""
+        artist = next(a for a in fake.catalogue.artists if a['has_image'])
+        info = _call(fake, method='artist.getInfo', artist=artist['name']).json()
+        url = info['artist']['image'][-1]['#text']
+        response = requests.get(url, timeout=5)
+        assert response.headers['Content-Type'] == 'image/png'
+        assert response.content.startswith(b'\x89PNG')
+
+class TestAppAgainstFake:
+    """Drive make_lastfm_request against the fake server"""
+
+    def test_app_round_trip(self, fake):
+        """Test that the app parses fake responses end to end"""
+        import app as app_module
+        app_module.response_cache.clear()
+        with patch.object(app_module, 'BASE_URL', fake.url):
+            data = app_module.make_lastfm_request({'method': 'user.getTopArtists', 'user': 'alice',
+                                                   'api_key': 'k', 'period': '7day', 'limit': 5})
+        assert len(data['topartists']['artist']) == 5
+
+    def test_injected_outage_opens_breaker(self, fake):
+        """Test that injected service errors trip the circuit breaker"""
+        import app as app_module
+        app_module.response_cache.clear()
+        fake.config.update({'error_rate': 1.0, 'error_codes': [16]})
+        registry = CircuitBreakerRegistry(failure_threshold=2, reset_timeout=60)
+        with patch.object(app_module, 'BASE_URL', fake.url), \
+                patch.object(app_module, 'circuit_breakers', registry):
+            for _ in range(3):
+                with pytest.raises(app_module.UpstreamUnavailableError):
+                    app_module.make_lastfm_request({'method': 'user.getInfo', 'user': 'alice', 'api_key': 'k'})
+        assert fake.stats['by_method']['user.getInfo'] == 2
@@ -0,0 +1,157 @@
+import io
+import csv
+import gzip
+import json
+import pytest
+import requests
+from unittest.mock import patch
+from history_export import HistoryExport, remote_rows
+from fake_lastfm import FakeLastFM, FakeLastFMConfig
+from conftest import make_track
+
+ROWS = [
+    (1700007200, 'Portishead', 'Roads', 'Dummy', ''),
+    (1700003600, 'Sigur Rós', 'Hoppípolla, "live"', 'Takk...', 'https://www.last.fm/music/Sigur+R%C3%B3s'),
+    (1700000000, 'Radiohead', 'Airbag', '', ''),
+]
+
+@pytest.fixture
+def fake():
+    """Run a fake Last.fm server with a 450-scrobble history"""
+    server = FakeLastFM(config=FakeLastFMConfig(history_size=450, artists=20)).start()
+    yield server
+    server.stop()
+
+def _body(export):
+    return b''.join(export)
+
+class TestHistoryExport:
+    """Test cases for encoding and streaming history exports"""
+
+    def test_csv(self):
+        """Test that CSV output has a header and survives quoting and non-ASCII text"""
+        rows = list(csv.reader(io.StringIO(_body(HistoryExport(ROWS, 'csv')).decode('utf-8'))))
+        assert rows[0] == ['uts', 'date', 'artist', 'track', 'album', 'url']
+        assert rows[2][2:4] == ['Sigur Rós', 'Hoppípolla, "live"']
+        assert len(rows) == 4
+
+    def test_ndjson(self):
+        """Test that each NDJSON line is one scrobble object"""
+        lines = _body(HistoryExport(ROWS, 'ndjson')).decode('utf-8').splitlines()
+        assert [json.loads(line)['uts'] for line in lines] == [row[0] for row in ROWS]
+        assert json.loads(lines[0])['date'] == '15 Nov 2023, 00:13'
+
+    def test_gzip_round_trip(self):
+        """Test that gzipped output decompresses to the plain export"""
+        plain = _body(HistoryExport(ROWS * 500, 'ndjson'))
+        assert gzip.decompress(_body(HistoryExport(ROWS * 500, 'ndjson', compress=True))) == plain
+
+    def test_streams_in_chunks(self):
+        """Test that rows are pulled lazily and emitted in bounded chunks"""
+        pulled = []
+
+        def rows():
+            for i in range(1000):
+                pulled.append(i)
+                yield (1700000000 - i, 'Artist', f'Track {i}', '', '')
+
+        chunks = iter(HistoryExport(rows(), 'csv', chunk_size=1024))
+        first = next(chunks)
+        assert 1024 <= len(first) < 2048
+        assert len(pulled) < 100
+        assert sum(len(chunk) for chunk in chunks) > 0 and len(pulled) == 1000
+
+    def test_unknown_format(self):
+        """Test that only CSV and NDJSON are offered"""
+        with pytest.raises(ValueError):
+            HistoryExport(ROWS, 'xml')
+
+    def test_iter_rows_pages_with_keyset(self, store):
+        """Test that stored rows stream newest first across batches, with duplicated times"""
+        store.add_tracks('alice', [make_track(1700000000 + i // 2, 'Artist', f'Track {i}') for i in range(25)])
+
+        rows = list(store.iter_rows('alice', batch_size=4))
+        assert len(rows) == 25
+        assert [row[0] for row in rows] == sorted((row[0] for row in rows), reverse=True)
+        assert len({row[2] for row in rows}) == 25
+        assert [row[0] for row in store.iter_rows('alice', since=1700000010, until=1700000011)] == \
+            [1700000011, 1700000011, 1700000010, 1700000010]
+
+    def test_remote_rows_pins_end(self, fake):
+        """Test that upstream paging reads every scrobble once with a fixed 'to'"""
+        calls = []
+
+        def fetch(extra):
+            calls.append(extra)
+            params = {'method': 'user.getRecentTracks', 'user': 'alice', 'format': 'json'}
+            params.update(extra)
+            return requests.get(fake.url, params=params, timeout=5).json()
+
+        rows = list(remote_rows(fetch, page_size=100))
+        assert len(rows) == 450
+        assert len(calls) == 5 and len({call['to'] for call in calls}) == 1
+
+    def test_remote_rows_retries_page(self, fake):
+        """Test that a page failing once mid-stream is retried instead of ending the export"""
+        calls = []
+
+        def fetch(extra):
+            calls.append(extra['page'])
+            if calls.count(3) == 1 and extra['page'] == 3:
+                raise ConnectionError('simulated throttling')
+            params = {'method': 'user.getRecentTracks', 'user': 'alice', 'format': 'json'}
+            params.update(extra)
+            return requests.get(fake.url, params=params, timeout=5).json()
+
+        rows = remote_rows(fetch, page_size=100, retry_delay=0)
+        first = [next(rows) for _ in range(150)]
+        rest = list(rows)
+        assert len(first) + len(rest) == 450
+        assert len({row[0] for row in first + rest}) == 450
+        assert calls == [1, 2, 3, 3, 4, 5]
+
+        def down(extra):
+            raise ConnectionError('still down')
+
+        with pytest.raises(ConnectionError):
+            list(remote_rows(down, max_retries=2, retry_delay=0))
+
+class TestExportRoute:
+    """Test the /history/export endpoint"""
+
+    def test_local_csv(self, authenticated_session, store):
+        """Test that a fully stored history is exported from the local copy"""
+        import app as app_module
+        store.add_tracks('testuser', [make_track(row[0], row[1], row[2], row[3]) for row in ROWS])
+        store._save_state('testuser', ROWS[0][0], ROWS[-1][0], len(ROWS), None)
+        with patch.object(app_module, 'history_store', store), \
+                patch.object(app_module.rate_limiter, 'is_allowed', return_value=True):
+            response = authenticated_session.get('/history/export?format=csv')
+            body = response.data.decode('utf-8')
+
+        assert response.status_code == 200
+        assert response.headers['X-Export-Source'] == 'local'
+        assert 'scrobbles-testuser.csv' in response.headers['Content-Disposition']
+        assert body.count('\n') == 4
+
+    def test_lastfm_gzip(self, authenticated_session, store, fake):
+        """Test that a history not yet stored is streamed from Last.fm and gzipped"""
+        import app as app_module
+        with patch.object(app_module, 'BASE_URL', fake.url), \
+                patch.object(app_module, 'history_store', store), \
+                patch.object(app_module.rate_limiter, 'is_allowed', return_value=True):
+            response = authenticated_session.get('/history/export?format=ndjson&gzip=1')
+            body = response.data  # the body streams while the patches are active
+        app_module.response_cache.clear()
+
+        assert response.status_code == 200
+        assert response.headers['X-Export-Source'] == 'lastfm'
+        assert response.mimetype == 'application/gzip'
+        assert len(gzip.decompress(body).splitlines()) == 450
+
+    def test_bad_request(self, authenticated_session):
+        """Test that an unknown format is rejected before streaming starts"""
+        import app as app_module
+        with patch.object(app_module.rate_limiter, 'is_allowed', return_value=True):
+            response = authenticated_session.get('/history/export?format=xml&source=local')
+        assert response.status_code == 400
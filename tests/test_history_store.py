@@ -0,0 +1,211 @@
+import pytest
+import time
+import json
+import requests
+from unittest.mock import patch
+from history_store import HistoryStore, parse_recent_tracks
+from fake_lastfm import FakeLastFM, FakeLastFMConfig
+from conftest import make_track
+
+@pytest.fixture
+def fake():
+    """Run a fake Last.fm server with a 450-scrobble history"""
+    server = FakeLastFM(config=FakeLastFMConfig(history_size=450, artists=50)).start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def store(tmp_path):
+    """Create a history store in a temporary directory"""
+    return HistoryStore(str(tmp_path / 'history.sqlite3'), sync_interval=60)
+
+def _fetcher(fake, user, calls):
+    def fetch(extra):
+        calls.append(extra)
+        params = {'method': 'user.getRecentTracks', 'user': user, 'format': 'json'}
+        params.update(extra)
+        return requests.get(fake.url, params=params, timeout=5).json()
+    return fetch
+
+class TestHistoryStore:
+    """Test cases for the incremental history store"""
+
+    def test_parse_skips_now_playing(self):
+        """Test that now-playing entries are split from dated scrobbles"""
+        data = {'recenttracks': {'track': [
+            {'name': 'Live', '@attr': {'nowplaying': 'true'}},
+            {'name': 'Done', 'date': {'uts': '100'}}
+        ], '@attr': {'total': '1'}}}
+        scrobbles, now_playing, attr = parse_recent_tracks(data)
+        assert [t['name'] for t in scrobbles] == ['Done']
+        assert now_playing['name'] == 'Live'
+        assert attr['total'] == '1'
+
+    def test_first_sync_stores_newest_page(self, store, fake):
+        """Test that the first sync fetches one page and records the checkpoint"""
+        calls = []
+        result = store.sync('alice', _fetcher(fake, 'alice', calls))
+
+        assert result['inserted'] == 200
+        assert calls == [{'page': 1, 'limit': 200}]
+        state = store.get_state('Alice')
+        assert state['remote_total'] == 450
+        assert store.covered_count('alice') == 200
+
+    def test_delta_sync_uses_from(self, store, fake):
+        """Test that later syncs only pull scrobbles since the checkpoint"""
+        fetch_calls = []
+        fetch = _fetcher(fake, 'alice', fetch_calls)
+        store.sync('alice', fetch)
+        newest = store.get_state('alice')['newest_uts']
+
+        artist = fake.catalogue.artists[0]['name']
+        fake.record_scrobble('alice', artist, 'Fresh Track', 'Fresh Album', int(time.time()))
+        result = store.sync('alice', fetch)
+
+        assert fetch_calls[-1]['from'] == newest
+        assert result['inserted'] == 1
+        assert store.recent('alice', 1)[0]['name'] == 'Fresh Track'
+        assert store.get_state('alice')['remote_total'] == 451
+
+    def test_recent_matches_lastfm_shape(self, store, fake):
+        """Test that stored tracks read back like Last.fm entries, newest first"""
+        store.sync('alice', _fetcher(fake, 'alice', []))
+        live = requests.get(fake.url, params={'method': 'user.getRecentTracks', 'user': 'alice',
+                                              'limit': 5, 'format': 'json'}, timeout=5).json()
+
+        local = store.recent('alice', 5)
+        for mine, theirs in zip(local, live['recenttracks']['track']):
+            assert mine['name'] == theirs['name']
+            assert mine['artist']['#text'] == theirs['artist']['#text']
+            assert mine['date'] == theirs['date']
+            assert mine['image'] == theirs['image']
+
+    def test_needs_sync_interval(self, store, fake):
+        """Test that a fresh history does not need syncing"""
+        assert store.needs_sync('alice') is True
+        store.sync('alice', _fetcher(fake, 'alice', []))
+        assert store.needs_sync('alice') is False
+        store.sync_interval = 0
+        assert store.needs_sync('alice') is True
+
+    def test_now_playing_recorded(self, store, fake):
+        """Test that the current now-playing track is kept with the checkpoint"""
+        fake.set_now_playing('alice', fake.catalogue.artists[1]['name'], 'On Air', '')
+        store.sync('alice', _fetcher(fake, 'alice', []))
+        assert store.get_state('alice')['now_playing']['name'] == 'On Air'
+
+class TestHistorySearch:
+    """Test cases for full-text history search"""
+
+    @pytest.fixture
+    def filled(self, store):
+        store.add_tracks('alice', [
+            make_track(1000, 'Radiohead', 'Airbag', 'OK Computer'),
+            make_track(2000, 'Björk', 'Jóga', 'Homogenic'),
+            make_track(3000, 'Radiohead', 'Reckoner', 'In Rainbows'),
+            make_track(4000, 'Portishead', 'Roads', 'Dummy'),
+        ] + [make_track(10000 + i, 'Filler', f'Song {i}') for i in range(25)])
+        store.add_tracks('bob', [make_track(1500, 'Radiohead', 'Creep')])
+        return store
+
+    def test_text_matches_prefixes_and_fields(self, filled):
+        """Test that words match artist, track or album prefixes for one user"""
+        assert [t['name'] for t in filled.search('alice', 'radio')['tracks']] == ['Reckoner', 'Airbag']
+        assert [t['name'] for t in filled.search('alice', 'rainbows')['tracks']] == ['Reckoner']
+        assert [t['name'] for t in filled.search('alice', 'bjork')['tracks']] == ['Jóga']
+
+    def test_all_words_required(self, filled):
+        """Test that every word in the query has to match"""
+        assert [t['name'] for t in filled.search('alice', 'radiohead ok')['tracks']] == ['Airbag']
+
+    def test_time_range(self, filled):
+        """Test that results are limited to the requested time range"""
+        result = filled.search('alice', '', since=1500, until=3500)
+        assert [t['name'] for t in result['tracks']] == ['Reckoner', 'Jóga']
+
+    def test_keyset_pagination(self, filled):
+        """Test that cursors walk the whole result set without gaps or repeats"""
+        seen, cursor = [], None
+        while True:
+            page = filled.search('alice', '', limit=10, cursor=cursor)
+            seen.extend(t['date']['uts'] for t in page['tracks'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        assert len(seen) == 29 == len(set(seen))
+        assert seen == sorted(seen, key=int, reverse=True)
+
+    def test_query_syntax_is_not_interpreted(self, filled):
+        """Test that FTS operators and quotes in the search box are treated as text"""
+        assert filled.search('alice', '"radiohead" OR NEAR(')['tracks'] == []
+        assert len(filled.search('alice', 'radiohead*"')['tracks']) == 2
+
+    def test_common_query_walks_time_index(self, filled):
+        """Test that the index-ordered plan for common words gives the same results"""
+        with patch('history_store.SELECTIVE_MATCHES', 1):
+            assert [t['name'] for t in filled.search('alice', 'radio')['tracks']] == ['Reckoner', 'Airbag']
+            page = filled.search('alice', 'song', limit=10)
+            assert len(page['tracks']) == 10 and page['next_cursor']
+
+    def test_like_fallback(self, filled):
+        """Test that search still works without the full-text index"""
+        filled._search_index = False
+        assert [t['name'] for t in filled.search('alice', 'reck')['tracks']] == ['Reckoner']
+
+    def test_bad_cursor(self, filled):
+        """Test that a malformed cursor is rejected"""
+        with pytest.raises(ValueError):
+            filled.search('alice', '', cursor='nope')
+
+class TestRecentTracksFromHistory:
+    """Test /recent-tracks reading from the local history"""
+
+    @pytest.fixture
+    def app_history(self, fake, store):
+        import app as app_module
+        app_module.response_cache.clear()
+        with patch.object(app_module, 'BASE_URL', fake.url), \
+                patch.object(app_module, 'history_store', store), \
+                patch.object(app_module.rate_limiter, 'is_allowed', return_value=True):
+            yield app_module
+        app_module.response_cache.clear()
+
+    def test_second_view_costs_nothing_upstream(self, authenticated_session, app_history, fake):
+        """Test that a fresh local history serves pages without Last.fm calls"""
+        first = json.loads(authenticated_session.get('/recent-tracks?limit=20').data)
+        second = json.loads(authenticated_session.get('/recent-tracks?limit=20&page=2').data)
+
+        assert first['success'] and second['success']
+        assert first['pagination']['total_tracks'] == 450
+        assert fake.stats['by_method']['user.getRecentTracks'] == 1
+        assert second['tracks'][0]['date']['uts'] < first['tracks'][-1]['date']['uts']
+
+    def test_pages_beyond_local_copy_go_live(self, authenticated_session, app_history, fake):
+        """Test that pages older than the synced range are fetched from Last.fm"""
+        authenticated_session.get('/recent-tracks?limit=50')
+        data = json.loads(authenticated_session.get('/recent-tracks?limit=50&page=6').data)
+
+        assert len(data['tracks']) == 50
+        assert fake.stats['by_method']['user.getRecentTracks'] == 2
+
+    def test_history_search_api(self, authenticated_session, app_history, fake):
+        """Test that /history/search pages through the synced history"""
+        first = json.loads(authenticated_session.get('/history/search?limit=30').data)
+        second = json.loads(authenticated_session.get(
+            f"/history/search?limit=30&cursor={first['next_cursor']}").data)
+
+        assert first['success'] and len(first['tracks']) == 30
+        assert second['tracks'][0]['date']['uts'] < first['tracks'][-1]['date']['uts']
+        assert fake.stats['by_method']['user.getRecentTracks'] == 1
+
+    def test_history_page(self, authenticated_session, app_history, fake):
+        """Test that /history renders matching scrobbles and rejects bad dates"""
+        artist = fake.catalogue.artists[0]['name']
+        fake.record_scrobble('testuser', artist, 'Needle In Haystack', '', int(time.time()))
+
+        response = authenticated_session.get('/history?search=needle+hay')
+        assert response.status_code == 200
+        assert b'Needle In Haystack' in response.data
+
+        assert authenticated_session.get('/history?from=yesterday').status_code == 400
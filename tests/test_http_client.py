@@ -0,0 +1,62 @@
+import pytest
+import os
+from unittest.mock import patch, MagicMock
+from http_client import HTTPClient
+
+class TestHTTPClient:
+    """Test cases for the pooled HTTP client"""
+
+    def test_session_is_reused(self):
+        """Test that repeated access returns the same pooled session"""
+        client = HTTPClient()
+        assert client.session is client.session
+
+    def test_adapter_pool_configuration(self):
+        """Test that the mounted adapter uses the configured pool sizes"""
+        client = HTTPClient(pool_connections=2, pool_maxsize=7)
+        adapter = client.session.get_adapter('https://ws.audioscrobbler.com/2.0/')
+        assert adapter._pool_connections == 2
+        assert adapter._pool_maxsize == 7
+
+    def test_separate_connect_and_read_timeouts(self):
+        """Test that connect and read timeouts are passed separately"""
+        client = HTTPClient(connect_timeout=1.5, read_timeout=8)
+        with patch.object(client.session, 'get') as mock_get:
+            client.get('https://example.test/', params={'a': 1})
+            mock_get.assert_called_once_with('https://example.test/', params={'a': 1}, timeout=(1.5, 8))
+
+    def test_post_uses_pooled_session(self):
+        """Test that POST requests go through the same session"""
+        client = HTTPClient()
+        with patch.object(client.session, 'post') as mock_post:
+            client.post('https://example.test/', data={'a': 1})
+            assert mock_post.call_args.kwargs['data'] == {'a': 1}
+            assert mock_post.call_args.kwargs['timeout'] == client.timeout
+
+    def test_session_rebuilt_after_fork(self):
+        """Test that a new process gets its own session"""
+        client = HTTPClient()
+        parent_session = client.session
+        with patch('http_client.os.getpid', return_value=os.getpid() + 1):
+            assert client.session is not parent_session
+
+    def test_from_env(self):
+        """Test configuration from environment variables"""
+        env = {
+            'LASTFM_POOL_CONNECTIONS': '3',
+            'LASTFM_POOL_MAXSIZE': '20',
+            'LASTFM_CONNECT_TIMEOUT': '2',
+            'LASTFM_READ_TIMEOUT': '6.5'
+        }
+        with patch.dict(os.environ, env):
+            client = HTTPClient.from_env()
+        assert client.pool_connections == 3
+        assert client.pool_maxsize == 20
+        assert client.timeout == (2.0, 6.5)
+
+    def test_close(self):
+        """Test closing releases the session"""
+        client = HTTPClient()
+        client.session
+        client.close()
+        assert client.get_stats()['active'] is False
@@ -0,0 +1,131 @@
+import pytest
+import os
+import time
+import threading
+from unittest.mock import patch, MagicMock
+from metadata_cache import MetadataCache
+
+@pytest.fixture
+def cache(tmp_path):
+    """Create a metadata cache in a temporary directory"""
+    return MetadataCache(str(tmp_path / 'meta' / 'cache.sqlite3'), ttl=100, refresh_after=50)
+
+class TestMetadataCache:
+    """Test cases for the persistent metadata cache"""
+
+    def test_lazy_open(self, cache):
+        """Test that nothing is created on disk until first use"""
+        assert not os.path.exists(cache.path)
+        assert cache.get('missing') is None
+        assert os.path.exists(cache.path)
+
+    def test_set_then_get(self, cache):
+        """Test that a stored response is returned as fresh"""
+        assert cache.set('k', {'artist': {'name': 'A'}}, method='artist.getInfo') is True
+        assert cache.get('k') == ({'artist': {'name': 'A'}}, False)
+        assert cache.get_stats()['entries'] == 1
+
+    def test_only_metadata_methods_stored(self, cache):
+        """Test that other methods are not written"""
+        assert cache.set('k', {'a': 1}, method='user.getTopArtists') is False
+        assert cache.get('k') is None
+
+    def test_refresh_due_and_expiry(self, cache):
+        """Test that old entries are flagged for refresh, then expire"""
+        with patch('metadata_cache.time.time', return_value=1000):
+            cache.set('k', {'a': 1}, method='track.getInfo')
+        with patch('metadata_cache.time.time', return_value=1060):
+            assert cache.get('k') == ({'a': 1}, True)
+        with patch('metadata_cache.time.time', return_value=1100):
+            assert cache.get('k') is None
+            assert cache.purge_expired() == 1
+
+    def test_writes_purge_expired_entries(self, tmp_path):
+        """Test that expired entries are swept every purge_every writes"""
+        cache = MetadataCache(str(tmp_path / 'cache.sqlite3'), ttl=100, purge_every=3)
+        with patch('metadata_cache.time.time', return_value=1000):
+            cache.set('old', {'a': 1}, method='artist.getInfo')
+        with patch('metadata_cache.time.time', return_value=1200):
+            cache.set('new1', {'a': 2}, method='artist.getInfo')
+            assert cache.get_stats()['entries'] == 2
+            cache.set('new2', {'a': 3}, method='artist.getInfo')
+
+        stats = cache.get_stats()
+        assert stats['entries'] == 2 and stats['purged'] == 1
+
+    def test_survives_new_instance(self, cache):
+        """Test that entries persist across cache instances (restarts)"""
+        cache.set('k', {'a': 1}, method='album.getInfo')
+        reopened = MetadataCache(cache.path)
+        assert reopened.get('k')[0] == {'a': 1}
+
+    def test_threads_use_own_connections(self, cache):
+        """Test concurrent reads and writes from several threads"""
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(20):
+                    cache.set(f"{n}:{i}", {'n': n, 'i': i}, method='artist.getInfo')
+                    assert cache.get(f"{n}:{i}")[0] == {'n': n, 'i': i}
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert errors == []
+        assert cache.get_stats()['entries'] == 80
+
+    def test_database_errors_are_misses(self, tmp_path):
+        """Test that an unusable database degrades to cache misses"""
+        blocker = tmp_path / 'file'
+        blocker.write_text('not a directory')
+        broken = MetadataCache(str(blocker / 'cache.sqlite3'))
+        assert broken.get('k') is None
+        assert broken.set('k', {'a': 1}, method='artist.getInfo') is False
+        assert broken.get_stats()['errors'] == 2
+
+class TestMakeLastFMRequestMetadata:
+    """Test the persistent cache behind make_lastfm_request"""
+
+    @pytest.fixture(autouse=True)
+    def fresh_caches(self, tmp_path):
+        import app as app_module
+        app_module.response_cache.clear()
+        with patch.object(app_module, 'metadata_cache', MetadataCache(str(tmp_path / 'meta.sqlite3'))):
+            yield
+        app_module.response_cache.clear()
+
+    def test_served_from_disk_after_restart(self):
+        """Test that info survives a cleared in-memory cache"""
+        import app as app_module
+        response = MagicMock(status_code=200)
+        response.json.return_value = {'artist': {'name': 'Persisted'}}
+        params = {'method': 'artist.getInfo', 'artist': 'Persisted', 'api_key': 'k'}
+
+        with patch.object(app_module.http_client, 'get', return_value=response) as mock_get:
+            app_module.make_lastfm_request(dict(params))
+            app_module.response_cache.clear()
+            data = app_module.make_lastfm_request(dict(params))
+
+        assert data == {'artist': {'name': 'Persisted'}}
+        assert mock_get.call_count == 1
+
+    def test_due_entry_refreshed_in_background(self):
+        """Test that an entry past refresh_after triggers one background fetch"""
+        import app as app_module
+        params = {'method': 'track.getInfo', 'artist': 'A', 'track': 'B', 'api_key': 'k'}
+        key = app_module.response_cache.make_key(dict(params, format='json'))
+        written = time.time() - app_module.metadata_cache.refresh_after - 60
+        with patch('metadata_cache.time.time', return_value=written):
+            app_module.metadata_cache.set(key, {'track': {'name': 'old'}}, method='track.getInfo')
+
+        with patch.object(app_module, '_refresh_in_background') as refresh:
+            data = app_module.make_lastfm_request(dict(params))
+
+        assert data == {'track': {'name': 'old'}}
+        refresh.assert_called_once()
@@ -0,0 +1,97 @@
+import pytest
+from recent_blocks import RecentTracksBlocks
+
+NOW_PLAYING = {'name': 'Live', 'artist': {'#text': 'Artist'}, '@attr': {'nowplaying': 'true'}}
+
+class FakeHistory:
+    """Minimal user.getRecentTracks honouring limit, page and to"""
+
+    def __init__(self, size):
+        self.scrobbles = [1700000000 - i * 60 for i in range(size)]
+        self.calls = []
+
+    def scrobble(self, uts):
+        self.scrobbles.insert(0, uts)
+
+    def fetch(self, user, extra, background):
+        self.calls.append(dict(extra, background=background))
+        visible = [uts for uts in self.scrobbles if 'to' not in extra or uts < extra['to']]
+        start = (extra['page'] - 1) * extra['limit']
+        tracks = [{'name': f"Track {uts}", 'artist': {'#text': 'Artist'}, 'date': {'uts': str(uts)}}
+                  for uts in visible[start:start + extra['limit']]]
+        if 'to' not in extra:
+            tracks.insert(0, NOW_PLAYING)
+        return {'recenttracks': {'track': tracks, '@attr': {'total': str(len(visible))}}}
+
+@pytest.fixture
+def history():
+    """A 1000-scrobble upstream history"""
+    return FakeHistory(1000)
+
+@pytest.fixture
+def blocks(history):
+    """Block cache over the fake history, with prefetching turned off"""
+    return RecentTracksBlocks(history.fetch, prefetch_margin=-1)
+
+def _times(result):
+    return [int(track['date']['uts']) for track in result['tracks'] if 'date' in track]
+
+class TestRecentTracksBlocks:
+    """Test cases for slicing client pages out of upstream superblocks"""
+
+    def test_pages_share_one_block(self, blocks, history):
+        """Test that ten 20-track pages cost one upstream request"""
+        pages = [blocks.page('alice', 20, page) for page in range(1, 11)]
+
+        assert len(history.calls) == 1 and history.calls[0]['limit'] == 200
+        assert sum((_times(page) for page in pages), []) == history.scrobbles[:200]
+        assert pages[0]['tracks'][0] == NOW_PLAYING
+        assert pages[0]['total_pages'] == 50 and pages[0]['total_tracks'] == 1000
+
+    def test_page_spanning_blocks(self, blocks, history):
+        """Test that a page crossing a block boundary is stitched from both"""
+        result = blocks.page('alice', 30, 7)
+        assert _times(result) == history.scrobbles[180:210]
+        assert [call['page'] for call in history.calls] == [1, 2]
+
+    def test_new_scrobbles_do_not_shift_pages(self, blocks, history):
+        """Test that scrobbles made while scrolling do not repeat tracks"""
+        first = blocks.page('alice', 50, 4)
+        history.scrobble(1700000600)
+        second = blocks.page('alice', 50, 5)
+        assert _times(second)[0] < _times(first)[-1]
+        assert _times(first) + _times(second) == history.scrobbles[151:251]
+
+    def test_prefetch_near_block_end(self, history):
+        """Test that the next block is fetched in the background near the end of a block"""
+        blocks = RecentTracksBlocks(history.fetch, prefetch_margin=60)
+        blocks.page('alice', 20, 6)
+        assert len(history.calls) == 1
+        blocks.page('alice', 20, 8)
+        blocks._executor.shutdown(wait=True)
+
+        assert history.calls[-1]['page'] == 2 and history.calls[-1]['background'] is True
+        assert blocks.get_stats()['prefetched'] == 1
+        blocks.page('alice', 20, 11)
+        assert len(history.calls) == 2
+
+    def test_anchor_skips_first_fetch(self, blocks, history):
+        """Test that a snapshot taken from the synced history needs no block 0 request"""
+        anchor = {'to_uts': history.scrobbles[0] + 1, 'total': 1000, 'now_playing': None}
+        result = blocks.page('alice', 50, 6, anchor)
+
+        assert _times(result) == history.scrobbles[250:300]
+        assert [(call['page'], call['to']) for call in history.calls] == [(2, anchor['to_uts'])]
+
+    def test_page_past_end(self, blocks, history):
+        """Test that pages past the end are empty"""
+        result = blocks.page('alice', 50, 30)
+        assert result['tracks'] == [] and result['total_pages'] == 20
+
+    def test_snapshot_renewed_after_ttl(self, history):
+        """Test that reloading page 1 after the TTL picks up new scrobbles"""
+        blocks = RecentTracksBlocks(history.fetch, ttl=0, prefetch_margin=-1)
+        blocks.page('alice', 20, 1)
+        history.scrobble(1700000600)
+        assert _times(blocks.page('alice', 20, 1))[0] == 1700000600
+        assert blocks.get_stats()['blocks'] == 1
@@ -0,0 +1,119 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from response_cache import ResponseCache
+
+@pytest.fixture
+def cache():
+    """Create a small response cache for testing"""
+    return ResponseCache(max_bytes=1024)
+
+def _params(method='artist.getInfo', **extra):
+    params = {'method': method, 'api_key': 'key', 'artist': 'Test Artist'}
+    params.update(extra)
+    return params
+
+class TestResponseCache:
+    """Test cases for the Last.fm response cache"""
+
+    def test_miss_then_hit(self, cache):
+        """Test that a stored response is returned on the next lookup"""
+        key = cache.make_key(_params())
+        assert cache.get(key) is None
+        cache.set(key, {'artist': {'name': 'Test Artist'}}, method='artist.getInfo')
+        assert cache.get(key) == {'artist': {'name': 'Test Artist'}}
+
+        stats = cache.get_stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+
+    def test_returns_private_copy(self, cache):
+        """Test that mutating a returned value does not affect the cache"""
+        key = cache.make_key(_params())
+        cache.set(key, {'artist': {'name': 'Test Artist'}}, method='artist.getInfo')
+        cache.get(key)['artist']['name'] = 'Changed'
+        assert cache.get(key)['artist']['name'] == 'Test Artist'
+
+    def test_key_ignores_signature_and_session(self, cache):
+        """Test that api_sig, sk and format do not change the key"""
+        plain = cache.make_key(_params())
+        signed = cache.make_key(_params(api_sig='abc', sk='session', format='json'))
+        assert plain == signed
+
+    def test_key_is_order_independent(self, cache):
+        """Test that parameter order does not change the key"""
+        a = cache.make_key({'method': 'track.getInfo', 'artist': 'A', 'track': 'B'})
+        b = cache.make_key({'track': 'B', 'artist': 'A', 'method': 'track.getInfo'})
+        assert a == b
+
+    def test_mutating_methods_bypass(self, cache):
+        """Test that signed and mutating methods are never cacheable"""
+        for method in ('track.scrobble', 'track.updateNowPlaying', 'auth.getSession'):
+            assert cache.is_cacheable({'method': method}) is False
+        assert cache.is_cacheable({'method': 'user.getTopArtists'}) is True
+        assert cache.get_stats()['bypassed'] == 3
+
+    def test_unlisted_methods_bypass(self, cache):
+        """Test that methods without a TTL are not cached"""
+        assert cache.is_cacheable({'method': 'track.search'}) is False
+        assert cache.set('key', {'a': 1}, method='track.search') is False
+
+    def test_ttl_expiry(self, cache):
+        """Test that entries expire after their TTL"""
+        key = cache.make_key(_params())
+        with patch('response_cache.time.time', return_value=1000):
+            cache.set(key, {'a': 1}, ttl=10)
+        with patch('response_cache.time.time', return_value=1009):
+            assert cache.get(key) == {'a': 1}
+        with patch('response_cache.time.time', return_value=1010):
+            assert cache.get(key) is None
+        assert cache.get_stats()['expirations'] == 1
+
+    def test_lru_eviction_by_size(self, cache):
+        """Test that least recently used entries are evicted at the memory cap"""
+        payload = {'data': 'x' * 300}
+        cache.set('a', payload, ttl=60)
+        cache.set('b', payload, ttl=60)
+        cache.set('c', payload, ttl=60)
+        cache.get('a')  # 'b' is now least recently used
+        cache.set('d', payload, ttl=60)
+
+        assert cache.get('b') is None
+        assert cache.get('a') is not None
+        stats = cache.get_stats()
+        assert stats['evictions'] == 1
+        assert stats['bytes'] <= cache.max_bytes
+
+    def test_oversized_value_not_stored(self, cache):
+        """Test that values larger than the cap are skipped"""
+        assert cache.set('big', {'data': 'x' * 2048}, ttl=60) is False
+        assert cache.get_stats()['entries'] == 0
+
+class TestMakeLastFMRequestCaching:
+    """Test the cache in front of make_lastfm_request"""
+
+    def test_read_method_served_from_cache(self):
+        """Test that a repeated read-only call reaches upstream once"""
+        import app as app_module
+        app_module.response_cache.clear()
+        response = MagicMock()
+        response.json.return_value = {'artist': {'name': 'Cached Artist'}}
+
+        with patch.object(app_module.http_client, 'get', return_value=response) as mock_get:
+            first = app_module.make_lastfm_request(_params(artist='Cached Artist'))
+            second = app_module.make_lastfm_request(_params(artist='Cached Artist'))
+
+        assert first == second
+        assert mock_get.call_count == 1
+
+    def test_scrobble_never_cached(self):
+        """Test that POSTed scrobbles always reach upstream"""
+        import app as app_module
+        response = MagicMock()
+        response.json.return_value = {'scrobbles': {}}
+        params = {'method': 'track.scrobble', 'artist': 'A', 'track': 'B', 'sk': 'x'}
+
+        with patch.object(app_module.http_client, 'post', return_value=response) as mock_post:
+            app_module.make_lastfm_request(dict(params), method='POST')
+            app_module.make_lastfm_request(dict(params), method='POST')
+
+        assert mock_post.call_count == 2
@@ -0,0 +1,171 @@
+import json
+import time
+import threading
+import pytest
+from unittest.mock import patch
+import app as app_module
+from scrobble_queue import ScrobbleQueue, QUEUED, ACCEPTED, IGNORED, FAILED
+from fake_lastfm import FakeLastFM
+
+class PermanentError(Exception):
+    """Stands in for a Last.fm error that retrying cannot fix"""
+
+class Sender:
+    """Records batches and accepts every track, failing on demand first"""
+
+    def __init__(self, failures=()):
+        self.batches = []
+        self.failures = list(failures)
+
+    def __call__(self, user, session_key, tracks):
+        self.batches.append((user, session_key, list(tracks)))
+        if self.failures:
+            raise self.failures.pop(0)
+        return [{'accepted': track != 'Old', 'ignored_message': '' if track != 'Old' else 'Timestamp failed filter',
+                 'track': track} for _, track, _, _ in tracks]
+
+@pytest.fixture
+def sender():
+    """A sender that accepts everything"""
+    return Sender()
+
+@pytest.fixture
+def queue(tmp_path, sender, test_token_store):
+    """A scrobble queue in a temporary directory, without a flusher thread"""
+    return ScrobbleQueue(str(tmp_path / 'queue.sqlite3'), sender, test_token_store,
+                         retryable=lambda error: not isinstance(error, PermanentError))
+
+class TestScrobbleQueue:
+    """Test cases for the durable scrobble queue"""
+
+    def test_survives_restart(self, tmp_path, queue):
+        """Test that entries queued by one process are sent by the next"""
+        entry_id = queue.enqueue('Alice', 'sk-a', 'Radiohead', 'Reckoner', 'In Rainbows', 1700000000)
+        sender = Sender()
+        restarted = ScrobbleQueue(queue.path, sender, queue.cipher)
+
+        assert restarted.status('alice', entry_id)['status'] == QUEUED
+        assert restarted.flush() == 1
+        assert sender.batches == [('alice', 'sk-a', [('Radiohead', 'Reckoner', 'In Rainbows', 1700000000)])]
+        assert restarted.status('alice', entry_id)['status'] == ACCEPTED
+        assert queue.status('bob', entry_id) is None
+
+    def test_batches_per_user_and_session(self, queue, sender):
+        """Test that entries are sent fifty at a time, one user and session key per request"""
+        ids = [queue.enqueue('alice', 'sk-a', 'Artist', f"Track {i}", '', 1700000000 + i) for i in range(120)]
+        queue.enqueue('bob', 'sk-b', 'Artist', 'Old', '', 1600000000)
+
+        assert queue.flush() == 121
+        assert [(user, len(tracks)) for user, _, tracks in sender.batches] == [
+            ('alice', 50), ('alice', 50), ('alice', 20), ('bob', 1)]
+        assert [track for _, track, _, _ in sender.batches[0][2]][:2] == ['Track 0', 'Track 1']
+        assert queue.status('alice', ids[-1])['status'] == ACCEPTED
+        assert queue.get_stats()['entries'] == {ACCEPTED: 120, IGNORED: 1}
+
+    def test_retry_with_backoff(self, queue, sender):
+        """Test that a failed batch stays queued until its backoff has passed"""
+        sender.failures.append(ConnectionError('upstream down'))
+        entry_id = queue.enqueue('alice', 'sk-a', 'Radiohead', 'Reckoner', '', 1700000000)
+
+        assert queue.flush() == 1
+        status = queue.status('alice', entry_id)
+        assert status['status'] == QUEUED and status['attempts'] == 1 and status['error'] == 'upstream down'
+        assert status['next_attempt_at'] > time.time()
+        assert queue.flush() == 0
+
+        with patch('scrobble_queue.time.time', return_value=status['next_attempt_at'] + 1):
+            assert queue.flush() == 1
+        status = queue.status('alice', entry_id)
+        assert (status['status'], status['attempts'], status['result']['track']) == (ACCEPTED, 2, 'Reckoner')
+
+    def test_permanent_failure_and_attempt_limit(self, tmp_path, test_token_store):
+        """Test that non-retryable errors fail at once and retryable ones after max_attempts"""
+        sender = Sender([PermanentError('Invalid session key')] + [ConnectionError('down')] * 3)
+        queue = ScrobbleQueue(str(tmp_path / 'queue.sqlite3'), sender, test_token_store,
+                              max_attempts=3, base_backoff=0,
+                              retryable=lambda error: not isinstance(error, PermanentError))
+        rejected = queue.enqueue('alice', 'sk-old', 'Radiohead', 'Reckoner', '', 1700000000)
+        queue.flush()
+        retried = queue.enqueue('alice', 'sk-a', 'Radiohead', 'Airbag', '', 1700000100)
+        queue.flush()
+
+        assert queue.status('alice', rejected)['status'] == FAILED
+        assert queue.status('alice', rejected)['attempts'] == 1
+        assert queue.status('alice', retried)['status'] == FAILED
+        assert queue.status('alice', retried)['attempts'] == 3
+        assert queue._db.execute("SELECT COUNT(*) FROM scrobble_queue WHERE session_key != ''").fetchone()[0] == 0
+
+    def test_session_key_stored_encrypted(self, queue, sender):
+        """Test that the raw session key never reaches the database file"""
+        queue.enqueue('alice', 'sk-raw-secret', 'Radiohead', 'Reckoner', '', 1700000000)
+        queue.enqueue('alice', 'sk-raw-secret', 'Radiohead', 'Airbag', '', 1700000100)
+        for suffix in ('', '-wal'):
+            with open(queue.path + suffix, 'rb') as f:
+                assert b'sk-raw-secret' not in f.read()
+
+        queue.flush()
+        assert [(user, session_key, len(tracks)) for user, session_key, tracks in sender.batches] == [
+            ('alice', 'sk-raw-secret', 2)]
+
+    def test_leased_batch_not_sent_twice(self, queue, sender):
+        """Test that a batch claimed by one worker is skipped by another until the lease lapses"""
+        queue.enqueue('alice', 'sk-a', 'Radiohead', 'Reckoner', '', 1700000000)
+        other_sender = Sender()
+        other_worker = ScrobbleQueue(queue.path, other_sender, queue.cipher)
+        assert queue._claim() is not None
+
+        assert other_worker.flush() == 0 and other_sender.batches == []
+        with patch('scrobble_queue.time.time', return_value=time.time() + queue.lease_seconds + 1):
+            assert other_worker.flush() == 1
+
+    def test_concurrent_enqueues_share_commits(self, queue):
+        """Test that entries arriving during a commit are made durable together"""
+        commit = queue._commit
+
+        def slow_commit(batch):
+            time.sleep(0.05)
+            commit(batch)
+
+        with patch.object(queue, '_commit', side_effect=slow_commit):
+            threads = [threading.Thread(target=queue.enqueue, args=('alice', 'sk-a', 'Artist', f"Track {i}", '',
+                                                                    1700000000 + i)) for i in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        stats = queue.get_stats()
+        assert stats['enqueued'] == 20 and stats['entries'] == {QUEUED: 20}
+        assert stats['commits'] < 20
+
+class TestQueuedScrobbleRoute:
+    """Test that /scrobble queues and the flusher delivers"""
+
+    def test_scrobble_queued_then_sent(self, authenticated_session, app_history, app_scrobble_queue):
+        """Test that /scrobble answers 202 before contacting Last.fm and reports delivery"""
+        fake = FakeLastFM().start()
+        try:
+            with patch.object(app_module, 'BASE_URL', fake.url), \
+                    patch.object(app_module.rate_limiter, 'is_allowed', return_value=True):
+                response = authenticated_session.post('/scrobble', data={'artist': 'Radiohead', 'track': 'Reckoner'})
+                queued = json.loads(authenticated_session.get(json.loads(response.data)['status_url']).data)
+                assert fake.stats['by_method'].get('track.scrobble', 0) == 0
+                app_scrobble_queue.flush()
+                sent = json.loads(authenticated_session.get(json.loads(response.data)['status_url']).data)
+                missing = authenticated_session.get('/scrobble/status/nope')
+        finally:
+            fake.stop()
+
+        assert response.status_code == 202
+        assert queued['scrobble']['status'] == QUEUED
+        assert sent['scrobble']['status'] == ACCEPTED and sent['scrobble']['result']['artist'] == 'Radiohead'
+        assert fake.stats['by_method']['track.scrobble'] == 1
+        assert app_history.summary('testuser')['scrobbles'] == 1
+        assert missing.status_code == 404
+
+    def test_retryable_errors(self):
+        """Test that outages and rate limiting are retried but other Last.fm errors are not"""
+        assert app_module.scrobble_error_retryable(app_module.UpstreamUnavailableError('down'))
+        assert app_module.scrobble_error_retryable(app_module.UpstreamBusyError('slow down'))
+        assert app_module.scrobble_error_retryable(ConnectionError('reset'))
+        assert not app_module.scrobble_error_retryable(app_module.LastFMError('Invalid session key'))
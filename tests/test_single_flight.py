@@ -0,0 +1,190 @@
+import pytest
+import asyncio
+import threading
+import time
+from single_flight import SingleFlight
+
+def _run_concurrently(count, target):
+    """Start count threads running target and wait for them"""
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+class TestSingleFlight:
+    """Test cases for single-flight request coalescing"""
+
+    def test_single_call(self):
+        """Test that a lone call just runs the function"""
+        flight = SingleFlight()
+        assert flight.do('key', lambda: {'a': 1}) == {'a': 1}
+        assert flight.get_stats()['executed'] == 1
+        assert flight.get_stats()['in_flight'] == 0
+
+    def test_concurrent_callers_share_one_call(self):
+        """Test that concurrent identical calls execute once"""
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def upstream():
+            calls.append(1)
+            release.wait(2)
+            return {'artist': 'Shared'}
+
+        threads = _run_concurrently(5, lambda: results.append(flight.do('key', upstream)))
+        while flight.get_stats()['coalesced'] < 4:
+            time.sleep(0.005)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert results == [{'artist': 'Shared'}] * 5
+        stats = flight.get_stats()
+        assert stats['executed'] == 1
+        assert stats['coalesced'] == 4
+
+    def test_followers_receive_copies(self):
+        """Test that followers cannot mutate each other's results"""
+        flight = SingleFlight()
+        release = threading.Event()
+        results = []
+
+        def upstream():
+            release.wait(2)
+            return {'items': [1]}
+
+        threads = _run_concurrently(2, lambda: results.append(flight.do('key', upstream)))
+        while flight.get_stats()['coalesced'] < 1:
+            time.sleep(0.005)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        results[0]['items'].append(2)
+        assert results[1]['items'] == [1]
+        assert results[0] is not results[1]
+
+    def test_leader_result_not_shared(self):
+        """Test that the leader can mutate its result while followers copy theirs"""
+        flight = SingleFlight()
+        release = threading.Event()
+        shared = {'items': [{'name': str(i)} for i in range(50)]}
+        results = []
+
+        def upstream():
+            release.wait(2)
+            return shared
+
+        threads = _run_concurrently(4, lambda: results.append(flight.do('key', upstream)))
+        while flight.get_stats()['coalesced'] < 3:
+            time.sleep(0.005)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert all(result is not shared for result in results)
+        for result in results:
+            for item in result['items']:
+                item['image_url'] = 'x'
+        assert 'image_url' not in shared['items'][0]
+
+    def test_error_is_shared(self):
+        """Test that followers receive the leader's exception"""
+        flight = SingleFlight()
+        release = threading.Event()
+        errors = []
+
+        def upstream():
+            release.wait(2)
+            raise ValueError('upstream failed')
+
+        def caller():
+            try:
+                flight.do('key', upstream)
+            except ValueError as e:
+                errors.append(str(e))
+
+        threads = _run_concurrently(3, caller)
+        while flight.get_stats()['coalesced'] < 2:
+            time.sleep(0.005)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert errors == ['upstream failed'] * 3
+        assert flight.get_stats()['shared_errors'] == 2
+
+    def test_different_keys_not_coalesced(self):
+        """Test that different keys run independently"""
+        flight = SingleFlight()
+        assert flight.do('a', lambda: 1) == 1
+        assert flight.do('b', lambda: 2) == 2
+        assert flight.get_stats()['executed'] == 2
+        assert flight.get_stats()['coalesced'] == 0
+
+    def test_key_released_after_completion(self):
+        """Test that sequential calls each execute"""
+        flight = SingleFlight()
+        flight.do('key', lambda: 1)
+        flight.do('key', lambda: 2)
+        assert flight.get_stats()['executed'] == 2
+
+    def test_async_followers_of_sync_leader(self):
+        """Test that coroutines join a call led by a thread without blocking their loop"""
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def upstream():
+            calls.append(1)
+            release.wait(2)
+            return {'artist': 'Shared'}
+
+        leader = _run_concurrently(1, lambda: flight.do('key', upstream))[0]
+        while not calls:
+            time.sleep(0.005)
+
+        async def followers():
+            async def never_called():
+                raise AssertionError('follower ran the call')
+            ticks = []
+
+            async def tick():
+                # Keeps running while the followers wait
+                while not release.is_set():
+                    ticks.append(1)
+                    await asyncio.sleep(0.005)
+
+            ticker = asyncio.ensure_future(tick())
+            waiting = asyncio.gather(*(flight.do_async('key', never_called) for _ in range(3)))
+            await asyncio.sleep(0.05)
+            release.set()
+            results = await waiting
+            await ticker
+            return results, ticks
+
+        results, ticks = asyncio.run(followers())
+        leader.join()
+        assert results == [{'artist': 'Shared'}] * 3
+        assert len(ticks) > 1 and len(calls) == 1
+        assert flight.get_stats()['coalesced'] == 3
+
+    def test_async_leader(self):
+        """Test that an awaited call is shared with concurrent coroutines"""
+        flight = SingleFlight()
+        calls = []
+
+        async def upstream():
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            return {'items': [1]}
+
+        async def run():
+            return await asyncio.gather(*(flight.do_async('key', upstream) for _ in range(4)))
+
+        results = asyncio.run(run())
+        assert results == [{'items': [1]}] * 4 and len(calls) == 1
+        assert len({id(result) for result in results}) == 4
@@ -0,0 +1,129 @@
+import json
+import random
+import itertools
+import pytest
+from collections import Counter
+from unittest.mock import patch
+from history_store import HistoryStore
+from aggregates import ListeningAggregates
+from artist_tags import ArtistTagIndex
+from sketches import ListeningSketches, HyperLogLog, HeavyHitters, SKETCHES_VERSION
+from fake_lastfm import FakeLastFM, FakeLastFMConfig
+from conftest import make_track
+
+NOV_2023 = 1700000000
+DEC_2023 = 1702000000
+JAN_2024 = 1705000000
+
+@pytest.fixture
+def sketches(store):
+    """Attach listening sketches to the store"""
+    return ListeningSketches(store)
+
+class TestSketchPrimitives:
+    """Test cases for the HyperLogLog and heavy-hitter summaries"""
+
+    def test_hyperloglog_within_error(self):
+        """Test that distinct counts stay within three standard errors"""
+        for n in (10, 1000, 100000):
+            sketch = HyperLogLog()
+            for i in range(n):
+                sketch.add(f"artist {i}")
+                sketch.add(f"artist {i}")
+            assert abs(sketch.count() - n) <= 3 * sketch.relative_error * n + 1
+
+    def test_hyperloglog_merge_is_union(self):
+        """Test that merged sketches count the union, across serialization"""
+        first, second = HyperLogLog(), HyperLogLog()
+        for i in range(3000):
+            first.add(f"artist {i}")
+            second.add(f"artist {i + 1500}")
+        merged = HyperLogLog.from_bytes(first.to_bytes()).merge(HyperLogLog.from_bytes(second.to_bytes()))
+        assert abs(merged.count() - 4500) <= 3 * merged.relative_error * 4500
+
+    def test_heavy_hitters_bound(self):
+        """Test that merged summaries undercount by no more than the reported bound"""
+        rng = random.Random(1)
+        weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(2000)))
+        true, merged = Counter(), HeavyHitters(capacity=50)
+        for _ in range(12):
+            month = Counter(str(key) for key in rng.choices(range(2000), cum_weights=weights, k=5000))
+            true.update(month)
+            merged.merge(HeavyHitters.from_bytes(HeavyHitters(capacity=50).update(month).to_bytes()))
+
+        assert merged.total == sum(true.values())
+        assert 0 < merged.max_error <= merged.total // 51
+        for key, plays in merged.counts.items():
+            assert true[key] - merged.max_error <= plays <= true[key]
+        assert [key for key, _ in merged.top(3)] == ['0', '1', '2']
+
+class TestListeningSketches:
+    """Test cases for per-month sketches kept alongside the history"""
+
+    def test_summary_over_months(self, store, sketches):
+        """Test that a range merges only the months it covers"""
+        store.add_tracks('alice', [
+            make_track(NOV_2023, 'Radiohead', 'Airbag', 'OK Computer'),
+            make_track(NOV_2023 + 60, 'Radiohead', 'Reckoner', 'In Rainbows'),
+            make_track(DEC_2023, 'Portishead', 'Roads', 'Dummy'),
+        ])
+        store.add_tracks('alice', [make_track(JAN_2024, 'Björk', 'Jóga'), make_track(JAN_2024 + 60, 'Radiohead', 'Airbag')])
+
+        everything = sketches.summary('Alice')
+        assert everything['from'] == '2023-11' and everything['to'] == '2024-01'
+        assert everything['scrobbles'] == 5
+        assert everything['unique_artists'] == 3 and everything['unique_albums'] == 3
+        assert everything['top_artists'][0] == {'artist': 'Radiohead', 'plays': 3}
+        assert everything['top_tracks'][0] == {'artist': 'Radiohead', 'name': 'Airbag', 'plays': 2}
+        assert everything['error']['top_artist_plays'] == 0
+
+        winter = sketches.summary('alice', DEC_2023, JAN_2024)
+        assert (winter['from'], winter['scrobbles'], winter['unique_artists']) == ('2023-12', 3, 3)
+        assert sketches.summary('alice', JAN_2024 + 86400 * 60)['scrobbles'] == 0
+
+    def test_existing_history_is_rebuilt(self, store):
+        """Test that history stored before sketches existed is summarized on first read"""
+        store.add_tracks('alice', [make_track(NOV_2023, 'Radiohead', 'Airbag')])
+        sketches = ListeningSketches(store)
+        assert sketches.summary('alice')['scrobbles'] == 1
+
+        store.add_tracks('alice', [make_track(DEC_2023, 'Portishead', 'Roads')])
+        assert sketches.summary('alice')['unique_artists'] == 2
+
+    def test_version_change_rebuilds(self, store, sketches):
+        """Test that sketches stored under another version are recomputed"""
+        store.add_tracks('alice', [make_track(NOV_2023, 'Radiohead', 'Airbag')])
+        sketches._db.execute('DELETE FROM sketches')
+        with patch('sketches.SKETCHES_VERSION', SKETCHES_VERSION + 1):
+            assert sketches.summary('alice')['scrobbles'] == 1
+        assert sketches.get_stats()['sketches'] == 4
+
+class TestApproximateStats:
+    """Test that /stats can answer from the sketches"""
+
+    def test_stats_approximate_mode(self, authenticated_session, tmp_path):
+        """Test that ?approx=1 reports sketch estimates with their error bounds"""
+        import app as app_module
+        fake = FakeLastFM(config=FakeLastFMConfig(history_size=300, artists=10)).start()
+        store = HistoryStore(str(tmp_path / 'history.sqlite3'))
+        aggregates = ListeningAggregates(store)
+        sketches = ListeningSketches(store)
+        try:
+            with patch.object(app_module, 'BASE_URL', fake.url), \
+                    patch.object(app_module, 'history_store', store), \
+                    patch.object(app_module, 'aggregates', aggregates), \
+                    patch.object(app_module, 'sketches', sketches), \
+                    patch.object(app_module, 'artist_tags',
+                                 ArtistTagIndex(str(tmp_path / 'tags.sqlite3'), lambda artist, background: None)):
+                exact = json.loads(authenticated_session.get('/stats').data)['stats']
+                approximate = json.loads(authenticated_session.get('/stats?approx=1').data)['stats']
+                bad = authenticated_session.get('/stats?approx=1&days=0')
+        finally:
+            fake.stop()
+            app_module.response_cache.clear()
+
+        assert 'approximate' not in exact
+        assert approximate['unique_artists'] == exact['unique_artists']
+        assert approximate['approximate']['scrobbles'] == exact['coverage']['analyzed_scrobbles']
+        assert approximate['approximate']['error']['unique_relative'] == round(HyperLogLog().relative_error, 4)
+        assert bad.status_code == 400
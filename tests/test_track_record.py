@@ -0,0 +1,49 @@
+import json
+from track_record import TrackRecord, parse_track_records
+
+IMAGES = [{'#text': 'https://lastfm.freetls.fastly.net/i/u/34s/abc.png', 'size': 'small'},
+          {'#text': 'https://lastfm.freetls.fastly.net/i/u/300x300/abc.png', 'size': 'extralarge'}]
+
+def _response():
+    """A decoded user.getRecentTracks response with a now-playing entry"""
+    return json.loads(json.dumps({'recenttracks': {'track': [
+        {'name': 'Jóga', 'artist': {'#text': 'Björk'}, '@attr': {'nowplaying': 'true'}},
+        {'name': 'Reckoner', 'artist': {'mbid': '', '#text': 'Radiohead'}, 'album': {'#text': 'In Rainbows'},
+         'url': 'https://www.last.fm/music/Radiohead/_/Reckoner', 'image': IMAGES, 'streamable': '0',
+         'date': {'uts': '1700000000', '#text': '14 Nov 2023, 22:13'}},
+        {'name': 'Airbag', 'artist': {'#text': 'Radiohead'}, 'album': {'#text': ''},
+         'date': {'uts': '1699990000', '#text': '14 Nov 2023, 19:26'}},
+    ], '@attr': {'total': '2'}}}))
+
+class TestTrackRecord:
+    """Test cases for the compact track representation"""
+
+    def test_round_trip(self):
+        """Test that a record rebuilds the fields clients read"""
+        records, now_playing, attr = parse_track_records(_response())
+        assert now_playing['name'] == 'Jóga' and attr == {'total': '2'}
+        assert [record.uts for record in records] == [1700000000, 1699990000]
+
+        assert records[0].to_lastfm() == {
+            'name': 'Reckoner',
+            'artist': {'#text': 'Radiohead'},
+            'album': {'#text': 'In Rainbows'},
+            'url': 'https://www.last.fm/music/Radiohead/_/Reckoner',
+            'image': IMAGES,
+            'date': {'uts': '1700000000', '#text': '14 Nov 2023, 22:13'}
+        }
+        assert records[1].to_lastfm()['image'] == [] and records[1].album == ''
+
+    def test_strings_are_shared(self):
+        """Test that equal strings from separate responses are stored once"""
+        first, _, _ = parse_track_records(_response())
+        second, _, _ = parse_track_records(_response())
+        assert first[0] == second[0]
+        assert first[0].artist is second[0].artist is first[1].artist
+        assert first[0].images is second[0].images
+
+    def test_slotted(self):
+        """Test that records carry no per-instance dict"""
+        record = TrackRecord(1700000000, 'Radiohead', 'Airbag')
+        assert not hasattr(record, '__dict__')
+        assert record.to_lastfm()['date']['uts'] == '1700000000'
@@ -0,0 +1,138 @@
+import pytest
+import os
+import time
+import asyncio
+import tempfile
+from unittest.mock import patch, MagicMock
+from upstream_governor import (
+    UpstreamGovernor, GovernorTimeout, priority_for,
+    INTERACTIVE, DEFAULT, BACKGROUND
+)
+
+@pytest.fixture
+def state_path():
+    """Temporary path for the shared bucket state"""
+    directory = tempfile.mkdtemp()
+    yield os.path.join(directory, 'governor.state')
+
+def _governor(state_path, **kwargs):
+    kwargs.setdefault('rate', 1.0)
+    kwargs.setdefault('burst', 10.0)
+    return UpstreamGovernor(state_path=state_path, **kwargs)
+
+class TestUpstreamGovernor:
+    """Test cases for the outbound request governor"""
+
+    def test_method_priorities(self):
+        """Test default priority classes for Last.fm methods"""
+        assert priority_for('track.scrobble') == INTERACTIVE
+        assert priority_for('track.updateNowPlaying') == INTERACTIVE
+        assert priority_for('artist.getInfo') == BACKGROUND
+        assert priority_for('user.getTopArtists') == DEFAULT
+
+    def test_burst_then_refill(self, state_path):
+        """Test that the bucket empties and refills at the configured rate"""
+        governor = _governor(state_path, reserves={})
+        with patch('upstream_governor.time.time', return_value=1000.0):
+            for _ in range(10):
+                assert governor.try_acquire(INTERACTIVE) == 0
+            assert governor.try_acquire(INTERACTIVE) == pytest.approx(1.0)
+        with patch('upstream_governor.time.time', return_value=1001.0):
+            assert governor.try_acquire(INTERACTIVE) == 0
+
+    def test_reserve_keeps_tokens_for_interactive(self, state_path):
+        """Test that background requests leave a reserve for interactive ones"""
+        governor = _governor(state_path)
+        with patch('upstream_governor.time.time', return_value=1000.0):
+            taken = 0
+            while governor.try_acquire(BACKGROUND) == 0:
+                taken += 1
+            assert taken == 5
+            assert governor.try_acquire(INTERACTIVE) == 0
+
+    def test_budget_shared_between_processes(self, state_path):
+        """Test that two governors on the same file share one bucket"""
+        first = _governor(state_path, reserves={})
+        second = _governor(state_path, reserves={})
+        with patch('upstream_governor.time.time', return_value=1000.0):
+            for _ in range(5):
+                assert first.try_acquire() == 0
+            for _ in range(5):
+                assert second.try_acquire() == 0
+            assert first.try_acquire() > 0
+            assert second.try_acquire() > 0
+
+    def test_acquire_waits_in_queue(self, state_path):
+        """Test that acquire waits briefly instead of failing"""
+        governor = _governor(state_path, rate=50.0, burst=1.0, reserves={})
+        governor.acquire(DEFAULT)
+        waited = governor.acquire(DEFAULT, max_wait=1.0)
+        assert waited > 0
+        assert governor.get_stats()['acquired']['default'] == 2
+
+    def test_acquire_timeout(self, state_path):
+        """Test that acquire gives up after the wait limit"""
+        governor = _governor(state_path, rate=0.1, burst=1.0, reserves={})
+        governor.acquire(DEFAULT)
+        with pytest.raises(GovernorTimeout):
+            governor.acquire(DEFAULT, max_wait=0.05)
+        assert governor.get_stats()['timeouts']['default'] == 1
+
+    def test_acquire_async(self, state_path):
+        """Test the asyncio variant takes tokens from the same bucket"""
+        governor = _governor(state_path, rate=0.1, burst=1.0, reserves={})
+        asyncio.run(governor.acquire_async(DEFAULT))
+        with pytest.raises(GovernorTimeout):
+            asyncio.run(governor.acquire_async(DEFAULT, max_wait=0.05))
+
+    def test_acquire_async_priorities(self, state_path):
+        """Test that async waiters take part in priority yielding like sync ones"""
+        governor = _governor(state_path, rate=10.0, burst=1.0, reserves={})
+        governor.acquire(DEFAULT)
+
+        async def interactive_waiting():
+            task = asyncio.create_task(governor.acquire_async(INTERACTIVE, max_wait=2.0))
+            await asyncio.sleep(0.02)
+            waiting = governor._should_yield(BACKGROUND)
+            await task
+            return waiting
+
+        assert asyncio.run(interactive_waiting()) is True
+        assert set(governor._waiting.values()) == {0}
+
+        time.sleep(0.15)  # refill the token
+        with patch.dict(governor._waiting, {INTERACTIVE: 1}):
+            with pytest.raises(GovernorTimeout):
+                asyncio.run(governor.acquire_async(BACKGROUND, max_wait=0.05))
+        assert governor.try_acquire(INTERACTIVE) == 0
+
+    def test_penalize_blocks_all_priorities(self, state_path):
+        """Test that an upstream rate limit pauses every priority"""
+        governor = _governor(state_path, penalty_seconds=30)
+        with patch('upstream_governor.time.time', return_value=1000.0):
+            governor.penalize()
+            assert governor.try_acquire(INTERACTIVE) == pytest.approx(30.0)
+        with patch('upstream_governor.time.time', return_value=1031.0):
+            assert governor.try_acquire(INTERACTIVE) == 0
+        assert governor.get_stats()['penalties'] == 1
+
+class TestGovernorIntegration:
+    """Test the governor in front of make_lastfm_request"""
+
+    def test_budget_exhausted_maps_to_lastfm_error(self):
+        """Test that a queue timeout surfaces as LastFMError"""
+        import app as app_module
+        with patch.object(app_module.upstream_governor, 'acquire', side_effect=GovernorTimeout('busy')):
+            with pytest.raises(app_module.LastFMError, match='busy'):
+                app_module.make_lastfm_request({'method': 'track.search', 'track': 'x'})
+
+    def test_rate_limit_error_penalizes(self):
+        """Test that Last.fm error 29 empties the shared bucket"""
+        import app as app_module
+        response = MagicMock(status_code=200)
+        response.json.return_value = {'error': 29, 'message': 'Rate limit exceeded'}
+        with patch.object(app_module.http_client, 'get', return_value=response), \
+             patch.object(app_module.upstream_governor, 'penalize') as mock_penalize:
+            with pytest.raises(app_module.LastFMError):
+                app_module.make_lastfm_request({'method': 'track.search', 'track': 'y'})
+        mock_penalize.assert_called_once()
@@ -471,6 +471,24 @@ class TokenStore:
             logger.error(f"Failed to clear all tokens: {e}")
             return False
 
+    def encrypt(self, data: str) -> str:
+        """
+        Encrypt a secret kept outside the token file with the store's key.
+        
+        Raises:
+            TokenStoreError: If encryption fails
+        """
+        return self._encrypt_data(data)
+
+    def decrypt(self, encrypted_data: str) -> str:
+        """
+        Decrypt a secret encrypted with encrypt().
+        
+        Raises:
+            TokenStoreError: If decryption fails, e.g. after a key change
+        """
+        return self._decrypt_data(encrypted_data)
+
     def __len__(self) -> int:
         """Return the number of stored tokens"""
         try:
@@ -0,0 +1,75 @@
+import sys
+import json
+from typing import Optional, Dict, Any, List, Tuple
+from history_store import parse_recent_tracks, format_uts, field_text
+
+class TrackRecord:
+    """
+    Compact in-memory scrobble.
+
+    A user.getRecentTracks entry decodes to a dict holding nested artist,
+    album and date dicts and a list of four image dicts, all with their
+    own string copies; held in bulk (cached recent-tracks blocks) that is
+    a few kilobytes per track. A record keeps the same information in
+    fixed slots: an integer timestamp and interned strings, with the image
+    list held as its compact JSON text (the encoding HistoryStore stores),
+    also interned. Artist, album, link and artwork strings repeat across a
+    listener's scrobbles, so each distinct value is kept once and a record
+    costs little more than its slots. Convert upstream JSON once with
+    from_lastfm or parse_track_records and build the Last.fm-shaped dict
+    with to_lastfm only for tracks actually sent to a client.
+    """
+
+    __slots__ = ('uts', 'artist', 'name', 'album', 'url', 'images')
+
+    def __init__(self, uts: int, artist: str, name: str, album: str = '', url: str = '', images: str = ''):
+        self.uts = uts
+        self.artist = sys.intern(artist)
+        self.name = sys.intern(name)
+        self.album = sys.intern(album)
+        self.url = sys.intern(url)
+        self.images = sys.intern(images)
+
+    @classmethod
+    def from_lastfm(cls, track: Dict[str, Any]) -> 'TrackRecord':
+        """Convert a dated user.getRecentTracks entry"""
+        images = track.get('image')
+        return cls(
+            int(track['date']['uts']),
+            field_text(track.get('artist')),
+            track.get('name') or '',
+            field_text(track.get('album')),
+            track.get('url') or '',
+            json.dumps(images, separators=(',', ':')) if images else ''
+        )
+
+    def to_lastfm(self) -> Dict[str, Any]:
+        """Build the entry in the shape user.getRecentTracks returns it"""
+        return {
+            'name': self.name,
+            'artist': {'#text': self.artist},
+            'album': {'#text': self.album},
+            'url': self.url,
+            'image': json.loads(self.images) if self.images else [],
+            'date': {'uts': str(self.uts), '#text': format_uts(self.uts)}
+        }
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, TrackRecord):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"TrackRecord({self.uts}, {self.artist!r}, {self.name!r})"
+
+def parse_track_records(data: Dict[str, Any]) -> Tuple[List[TrackRecord], Optional[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Split a user.getRecentTracks response like parse_recent_tracks, with
+    the dated scrobbles converted to records.
+
+    Returns:
+        Tuple: (scrobble records, now-playing entry as received or None,
+            the '@attr' dict)
+    """
+    scrobbles, now_playing, attr = parse_recent_tracks(data)
+    return [TrackRecord.from_lastfm(track) for track in scrobbles], now_playing, attr
@@ -0,0 +1,254 @@
+import os
+import time
+import struct
+import asyncio
+import logging
+import tempfile
+import threading
+from typing import Optional, Dict, Any
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, highest first
+INTERACTIVE = 0
+DEFAULT = 1
+BACKGROUND = 2
+
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', DEFAULT: 'default', BACKGROUND: 'background'}
+
+METHOD_PRIORITIES = {
+    'track.scrobble': INTERACTIVE,
+    'track.updateNowPlaying': INTERACTIVE,
+    'auth.getSession': INTERACTIVE,
+    'artist.getInfo': BACKGROUND,
+    'album.getInfo': BACKGROUND,
+    'track.getInfo': BACKGROUND,
+}
+
+# Fraction of the burst that lower priorities must leave in the bucket
+DEFAULT_RESERVES = {INTERACTIVE: 0.0, DEFAULT: 0.2, BACKGROUND: 0.5}
+
+# Longest time each priority queues for a token before giving up
+DEFAULT_MAX_WAITS = {INTERACTIVE: 5.0, DEFAULT: 3.0, BACKGROUND: 1.5}
+
+# Last.fm allows 5 requests/second per API key, averaged over 5 minutes
+DEFAULT_RATE = 5.0
+DEFAULT_BURST = 10.0
+DEFAULT_PENALTY_SECONDS = 30.0
+
+# Last.fm error code for "Rate limit exceeded"
+RATE_LIMIT_ERROR_CODE = 29
+
+# tokens, last refill time, penalty end time
+_STATE = struct.Struct('<ddd')
+
+def priority_for(method: Optional[str]) -> int:
+    """Return the default priority class for a Last.fm method"""
+    return METHOD_PRIORITIES.get(method, DEFAULT)
+
+class GovernorTimeout(Exception):
+    """Raised when no upstream budget became available within the wait limit"""
+    pass
+
+class UpstreamGovernor:
+    """
+    Token bucket limiting outbound Last.fm requests across all workers.
+
+    The bucket state lives in a small file guarded by ``flock`` so every
+    gunicorn worker on the node draws from the same budget. Lower priority
+    classes may only take a token while a reserve is left for higher ones,
+    so scrobbles still go through when background lookups have drained most
+    of the budget. When Last.fm reports a rate limit the bucket is emptied
+    and refilling is paused for a cooldown.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: float = DEFAULT_BURST,
+                 state_path: Optional[str] = None,
+                 reserves: Optional[Dict[int, float]] = None,
+                 max_waits: Optional[Dict[int, float]] = None,
+                 penalty_seconds: float = DEFAULT_PENALTY_SECONDS):
+        self.rate = rate
+        self.burst = burst
+        self.state_path = state_path or os.path.join(tempfile.gettempdir(), 'lastfm_governor.state')
+        self.reserves = dict(DEFAULT_RESERVES if reserves is None else reserves)
+        self.max_waits = dict(DEFAULT_MAX_WAITS if max_waits is None else max_waits)
+        self.penalty_seconds = penalty_seconds
+        self.backend = 'flock' if fcntl is not None else 'local'
+        self._lock = threading.Lock()
+        self._fd = None
+        self._pid = None
+        self._local_state = None
+        self._waiting = {INTERACTIVE: 0, DEFAULT: 0, BACKGROUND: 0}
+        self._stats = {
+            'acquired': {name: 0 for name in PRIORITY_NAMES.values()},
+            'timeouts': {name: 0 for name in PRIORITY_NAMES.values()},
+            'total_wait_seconds': 0.0,
+            'penalties': 0
+        }
+
+    @classmethod
+    def from_env(cls) -> 'UpstreamGovernor':
+        """Create a governor configured from environment variables"""
+        return cls(
+            rate=float(os.environ.get('LASTFM_RATE_PER_SEC', DEFAULT_RATE)),
+            burst=float(os.environ.get('LASTFM_RATE_BURST', DEFAULT_BURST)),
+            state_path=os.environ.get('LASTFM_GOVERNOR_STATE') or None
+        )
+
+    def _open(self) -> int:
+        """Open the shared state file for this process"""
+        pid = os.getpid()
+        if self._fd is None or self._pid != pid:
+            # flock is tied to the open file description, so a descriptor
+            # inherited across fork would not exclude the parent.
+            self._fd = os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._pid = pid
+        return self._fd
+
+    def _update(self, fn):
+        """Apply fn(tokens, updated, penalty_until, now) to the shared state"""
+        with self._lock:
+            now = time.time()
+            if self.backend == 'local':
+                state = self._local_state or (self.burst, now, 0.0)
+                result, self._local_state = fn(*state, now)
+                return result
+
+            fd = self._open()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                raw = os.pread(fd, _STATE.size, 0)
+                state = _STATE.unpack(raw) if len(raw) == _STATE.size else (self.burst, now, 0.0)
+                result, new_state = fn(*state, now)
+                os.pwrite(fd, _STATE.pack(*new_state), 0)
+                return result
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def try_acquire(self, priority: int = DEFAULT) -> float:
+        """
+        Take one token if the priority class may do so right now.
+
+        Args:
+            priority: INTERACTIVE, DEFAULT or BACKGROUND
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until retrying makes sense
+        """
+        reserve = self.reserves.get(priority, 0.0) * self.burst
+
+        def take(tokens, updated, penalty_until, now):
+            if now < penalty_until:
+                return penalty_until - now, (0.0, now, penalty_until)
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+            if tokens - 1.0 >= reserve:
+                return 0.0, (tokens - 1.0, now, penalty_until)
+            return (1.0 + reserve - tokens) / self.rate, (tokens, now, penalty_until)
+
+        return self._update(take)
+
+    def _should_yield(self, priority: int) -> bool:
+        """Check whether higher-priority callers in this process are queued"""
+        return any(self._waiting[p] for p in self._waiting if p < priority)
+
+    def _record(self, priority: int, acquired: bool, waited: float) -> None:
+        name = PRIORITY_NAMES.get(priority, 'default')
+        with self._lock:
+            self._stats['acquired' if acquired else 'timeouts'][name] += 1
+            self._stats['total_wait_seconds'] += waited
+
+    def acquire(self, priority: int = DEFAULT, max_wait: Optional[float] = None) -> float:
+        """
+        Wait for a token, queueing for at most the priority's wait limit.
+
+        Args:
+            priority: INTERACTIVE, DEFAULT or BACKGROUND
+            max_wait: Override for the priority's wait limit in seconds
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            GovernorTimeout: If no token became available in time
+        """
+        if max_wait is None:
+            max_wait = self.max_waits.get(priority, 0.0)
+        start = time.monotonic()
+        with self._lock:
+            self._waiting[priority] += 1
+        try:
+            while True:
+                delay = 0.01 if self._should_yield(priority) else self.try_acquire(priority)
+                waited = time.monotonic() - start
+                if delay == 0:
+                    self._record(priority, True, waited)
+                    return waited
+                if waited + delay > max_wait:
+                    self._record(priority, False, waited)
+                    raise GovernorTimeout(f"No upstream budget for {PRIORITY_NAMES.get(priority)} request")
+                time.sleep(min(delay, 0.25))
+        finally:
+            with self._lock:
+                self._waiting[priority] -= 1
+
+    async def acquire_async(self, priority: int = DEFAULT, max_wait: Optional[float] = None) -> float:
+        """asyncio variant of acquire() that never blocks the event loop"""
+        if max_wait is None:
+            max_wait = self.max_waits.get(priority, 0.0)
+        start = time.monotonic()
+        with self._lock:
+            self._waiting[priority] += 1
+        try:
+            while True:
+                delay = 0.01 if self._should_yield(priority) else self.try_acquire(priority)
+                waited = time.monotonic() - start
+                if delay == 0:
+                    self._record(priority, True, waited)
+                    return waited
+                if waited + delay > max_wait:
+                    self._record(priority, False, waited)
+                    raise GovernorTimeout(f"No upstream budget for {PRIORITY_NAMES.get(priority)} request")
+                await asyncio.sleep(min(delay, 0.25))
+        finally:
+            with self._lock:
+                self._waiting[priority] -= 1
+
+    def penalize(self, seconds: Optional[float] = None) -> None:
+        """Empty the bucket and pause refilling after an upstream rate-limit response"""
+        cooldown = self.penalty_seconds if seconds is None else seconds
+
+        def drain(tokens, updated, penalty_until, now):
+            return None, (0.0, now, max(penalty_until, now + cooldown))
+
+        self._update(drain)
+        with self._lock:
+            self._stats['penalties'] += 1
+        logger.warning(f"Last.fm rate limit hit, pausing outbound requests for {cooldown}s")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return budget configuration, current level and counters"""
+        def peek(tokens, updated, penalty_until, now):
+            level = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+            if now < penalty_until:
+                level = 0.0
+            return (level, max(0.0, penalty_until - now)), (tokens, updated, penalty_until)
+
+        level, penalty_remaining = self._update(peek)
+        with self._lock:
+            stats = {
+                'backend': self.backend,
+                'rate_per_second': self.rate,
+                'burst': self.burst,
+                'tokens_available': round(level, 2),
+                'penalty_remaining': round(penalty_remaining, 2),
+                'acquired': dict(self._stats['acquired']),
+                'timeouts': dict(self._stats['timeouts']),
+                'total_wait_seconds': round(self._stats['total_wait_seconds'], 3),
+                'penalties': self._stats['penalties']
+            }
+        return stats